@@ -0,0 +1,105 @@
+'''
+Columnar BED loader shared by the BED scripts.
+'''
+
+# Reads the first six columns of a BED file once into NumPy arrays so that coordinates can be changed and filtered with array operations.
+# Requires:
+# -numpy: http://www.numpy.org/
+# Columns (dictionary keys):
+# 'chrom' (chromosome codes, index of 'chromNames'), 'start', 'end', 'name', 'score' (nan if '.'), 'strand'.
+# Missing columns are filled with '.' (name, strand) and 0 (score).
+
+import numpy as np
+
+# number of lines parsed into Python lists before they are converted to arrays
+CHUNK_SIZE = 1000000
+COLUMN_NAMES = ["chrom", "start", "end", "name", "score", "strand"]
+
+def getChunkColumns(chroms, starts, ends, names, scores, strands):
+    return {"chrom": np.array(chroms, dtype=np.int32), "start": np.array(starts, dtype=np.int64), "end": np.array(ends, dtype=np.int64), "name": np.array(names, dtype=str), "score": np.array(scores, dtype=np.float64), "strand": np.array(strands, dtype="S1")}
+
+def readBedColumns(bedFile):
+    bFile = open(bedFile, "r", 1048576)
+    chromNames = []
+    chromCodes = {}
+    chunks = []
+    chroms, starts, ends, names, scores, strands = [], [], [], [], [], []
+    for line in bFile:
+        if line.startswith("#") or line.startswith("track") or line.startswith("browser") or line.isspace():
+            continue
+        fields = line.rstrip("\r\n").split("\t", 6)
+        chrom = fields[0]
+        if not chrom in chromCodes:
+            chromCodes[chrom] = len(chromNames)
+            chromNames.append(chrom)
+        chroms.append(chromCodes[chrom])
+        starts.append(int(fields[1]))
+        ends.append(int(fields[2]))
+        fieldNumber = len(fields)
+        if fieldNumber > 3:
+            names.append(fields[3])
+        else:
+            names.append(".")
+        if fieldNumber > 4 and fields[4] != ".":
+            scores.append(float(fields[4]))
+        elif fieldNumber > 4:
+            scores.append(np.nan)
+        else:
+            scores.append(0)
+        if fieldNumber > 5:
+            strands.append(fields[5])
+        else:
+            strands.append(".")
+        if len(chroms) == CHUNK_SIZE:
+            chunks.append(getChunkColumns(chroms, starts, ends, names, scores, strands))
+            chroms, starts, ends, names, scores, strands = [], [], [], [], [], []
+    bFile.close()
+    if len(chroms) > 0 or len(chunks) == 0:
+        chunks.append(getChunkColumns(chroms, starts, ends, names, scores, strands))
+    columns = {}
+    for colName in COLUMN_NAMES:
+        columns[colName] = np.concatenate([chunk[colName] for chunk in chunks])
+    columns["chromNames"] = chromNames
+    print "Reading BED file '"+str(bedFile)+"': "+str(len(columns["start"]))+" lines, "+str(len(chromNames))+" chromosomes."
+    return columns
+
+def getRowNumber(columns):
+    return len(columns["start"])
+
+# returns the rows selected by mask (boolean array or array of row numbers)
+def selectRows(columns, mask):
+    selected = {}
+    for colName in COLUMN_NAMES:
+        selected[colName] = columns[colName][mask]
+    selected["chromNames"] = columns["chromNames"]
+    return selected
+
+def getWidthMask(columns, minWidth, maxWidth):
+    widths = columns["end"]-columns["start"]
+    return (widths >= minWidth) & (widths <= maxWidth)
+
+def formatScore(score):
+    if np.isnan(score):
+        return "."
+    if score == int(score):
+        return str(int(score))
+    return str(score)
+
+# writes the first fieldNumber columns (3 to 6)
+def writeBedColumns(columns, outfileName, fieldNumber = 6):
+    outFile = open(outfileName, "w", 1048576)
+    chromNames = columns["chromNames"]
+    rowColumns = [[chromNames[code] for code in columns["chrom"]], columns["start"].tolist(), columns["end"].tolist()]
+    if fieldNumber > 3:
+        rowColumns.append(columns["name"].tolist())
+    if fieldNumber > 4:
+        rowColumns.append([formatScore(score) for score in columns["score"]])
+    if fieldNumber > 5:
+        rowColumns.append(columns["strand"].tolist())
+    lineCount = 0
+    for row in zip(*rowColumns):
+        outFile.write("\t".join([str(field) for field in row])+"\n")
+        lineCount = lineCount+1
+    outFile.flush()
+    outFile.close()
+    print "Writing '"+outfileName+"': "+str(lineCount)+" lines."
@@ -0,0 +1,101 @@
+'''
+Benchmark of clinvarToBed_iterative.py on a synthetic ClinVar-shaped XML file.
+'''
+
+# Writes a synthetic ClinVar XML file and reports the records/s of the previous parsing loop (start and end events, findall on every event)
+# and of the current one (end events only).
+# Usage: python benchClinvarToBed.py -n 20000
+# Args:
+#-n: number of ClinVarSet records (default: 20000)
+
+import sys
+import os
+import getopt
+import time
+import shutil
+import tempfile
+from xml.etree.ElementTree import iterparse as pyIterparse
+import clinvarToBed_iterative
+
+usage = "Benchmark of clinvarToBed_iterative.py on a synthetic ClinVar-shaped XML file.\nUsage: python benchClinvarToBed.py -n 20000\nArgs:\n-n: number of ClinVarSet records (default: 20000)"
+
+def get_params(argv):
+    try:
+        opts, args = getopt.getopt(argv, "n:", ["records"])
+    except getopt.GetoptError:
+        sys.exit(usage)
+    recordNumber = 20000
+    for opt,arg in opts:
+        if opt == '-n':
+            recordNumber = int(arg)
+    return recordNumber
+
+def writeSyntheticXML(xmlName, recordNumber):
+    xFile = open(xmlName, "w")
+    xFile.write('<?xml version="1.0" encoding="UTF-8"?>\n<ReleaseSet Dated="2015-04-01" Type="full">\n')
+    for i in xrange(recordNumber):
+        pos = 10000+i*37
+        xFile.write('<ClinVarSet ID="'+str(i)+'"><RecordStatus>current</RecordStatus><Title>NM_000000.1(GENE'+str(i%500)+'):c.'+str(i)+'A&gt;G</Title>')
+        xFile.write('<ReferenceClinVarAssertion ID="'+str(i)+'"><ClinVarAccession Acc="RCV'+str(i).zfill(9)+'" Version="1" Type="RCV"/><RecordStatus>current</RecordStatus>')
+        xFile.write('<ClinicalSignificance><Description>Pathogenic</Description></ClinicalSignificance><Assertion Type="variation to disease"/>')
+        xFile.write('<MeasureSet Type="Variant" ID="'+str(i)+'"><Measure Type="single nucleotide variant" ID="'+str(i)+'"><Name><ElementValue Type="Preferred">NM_000000.1(GENE'+str(i%500)+'):c.'+str(i)+'A&gt;G</ElementValue></Name>')
+        xFile.write('<AttributeSet><Attribute Type="HGVS, coding">NM_000000.1:c.'+str(i)+'A&gt;G</Attribute></AttributeSet><CytogeneticLocation>1p36</CytogeneticLocation>')
+        xFile.write('<SequenceLocation Assembly="GRCh38" Chr="'+str(i%22+1)+'" Accession="NC_000001.11" start="'+str(pos+500)+'" stop="'+str(pos+500)+'"/>')
+        xFile.write('<SequenceLocation Assembly="GRCh37" Chr="'+str(i%22+1)+'" Accession="NC_000001.10" start="'+str(pos)+'" stop="'+str(pos)+'" Strand="+"/>')
+        xFile.write('<MeasureRelationship Type="variant in gene"><Name><ElementValue Type="Preferred">gene</ElementValue></Name><SequenceLocation Assembly="GRCh37" Chr="1" start="1" stop="50000"/></MeasureRelationship>')
+        xFile.write('<XRef ID="rs'+str(i)+'" DB="dbSNP"/></Measure></MeasureSet>')
+        xFile.write('<TraitSet Type="Disease"><Trait Type="Disease"><Name><ElementValue Type="Preferred">Disease '+str(i%100)+'</ElementValue></Name><XRef ID="C'+str(i%100).zfill(7)+'" DB="MedGen"/></Trait></TraitSet></ReferenceClinVarAssertion>')
+        xFile.write('<ClinVarAssertion ID="'+str(i)+'"><ClinVarSubmissionID submitter="lab"/><ClinVarAccession Acc="SCV'+str(i).zfill(9)+'" Version="1" Type="SCV"/>')
+        xFile.write('<MeasureSet Type="Variant"><Measure Type="Variation"><AttributeSet><Attribute Type="HGVS">NM_000000.1:c.'+str(i)+'A&gt;G</Attribute></AttributeSet></Measure></MeasureSet></ClinVarAssertion></ClinVarSet>\n')
+    xFile.write('</ReleaseSet>\n')
+    xFile.close()
+
+# parsing loop of the previous version (pure python ElementTree, start and end events, findall on every event)
+def parsePrevious(infileName, outFile):
+    context = iter(pyIterparse(infileName, events=("start", "end")))
+    event, root = next(context)
+    acc = "None"
+    for event, elem in context:
+        if elem.tag == "MeasureRelationship":
+            elem.clear()
+            root.clear()
+            continue
+        for access in elem.findall("ClinVarAccession"):
+            acc = access.get("Acc")
+        for seqLoc in elem.findall("SequenceLocation"):
+            if seqLoc.get("Assembly") == "GRCh37" and event == "end":
+                strand = seqLoc.get("Strand")
+                if strand != "+" and strand != "-":
+                    strand = "."
+                if seqLoc.get("start") is not None and seqLoc.get("stop") is not None:
+                    outFile.write("chr"+seqLoc.get("Chr")+"\t"+seqLoc.get("start")+"\t"+seqLoc.get("stop")+"\t"+str(acc)+"\t0\t"+strand+"\n")
+                elem.clear()
+                root.clear()
+
+def timeParser(name, parser, xmlName, outName, recordNumber):
+    outFile = open(outName, "w")
+    startTime = time.time()
+    parser(xmlName, outFile)
+    elapsed = time.time()-startTime
+    outFile.close()
+    print name+": "+str("{:.2f}".format(elapsed))+"s, "+str(int(recordNumber/elapsed))+" records/s."
+    return elapsed
+
+if __name__ == '__main__':
+    recordNumber = get_params(sys.argv[1:])
+    tmpDir = tempfile.mkdtemp(prefix="benchClinvar_")
+    try:
+        xmlName = os.path.join(tmpDir, "clinvar_synthetic.xml")
+        writeSyntheticXML(xmlName, recordNumber)
+        print "Synthetic ClinVar file: "+str(recordNumber)+" records, "+str(os.path.getsize(xmlName)/1048576)+"MB."
+        before = timeParser("Previous parser (start+end events)", parsePrevious, xmlName, os.path.join(tmpDir, "before.bed"), recordNumber)
+        after = timeParser("Current parser (end events)", lambda source, outFile: clinvarToBed_iterative.parseClinVarFile(open(source, "rb"), {"GRCh37": outFile}), xmlName, os.path.join(tmpDir, "after.bed"), recordNumber)
+        print "Speedup: "+str("{:.1f}".format(before/after))+"x."
+        beforeLines = open(os.path.join(tmpDir, "before.bed")).readlines()
+        afterLines = open(os.path.join(tmpDir, "after.bed")).readlines()
+        diffCount = len([1 for beforeLine, afterLine in zip(beforeLines, afterLines) if beforeLine != afterLine])
+        print "Lines: "+str(len(beforeLines))+" before, "+str(len(afterLines))+" after, "+str(diffCount)+" different."
+        if diffCount > 0:
+            print "(the previous parser reads accessions on the start event of their parent, they are missed when the parent starts at the end of a read buffer)"
+    finally:
+        shutil.rmtree(tmpDir)
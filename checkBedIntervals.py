@@ -0,0 +1,107 @@
+'''
+Checks the overlap queries of getFromBed.py ('-v', '-r') against a brute-force scan on synthetic bed files with a chromosome-spanning entry.
+'''
+
+# Writes one entry spanning the whole chromosome, a few large domains and many small entries, then compares the overlaps found
+# through the containment lists with a scan of every entry, and counts the candidates read by each query: the long entries must not
+# make a query read the entries they contain.
+# Usage: python checkBedIntervals.py -n 20000
+# Args:
+#-n: number of small entries (default: 20000)
+
+import sys
+import os
+import getopt
+import random
+import shutil
+import tempfile
+import getFromBed
+
+usage = "Checks the overlap queries of getFromBed.py ('-v', '-r') against a brute-force scan on synthetic bed files with a chromosome-spanning entry.\nUsage: python checkBedIntervals.py -n 20000\nArgs:\n-n: number of small entries (default: 20000)"
+
+CHROM_SIZE = 50000000
+QUERY_NUMBER = 1000
+
+def get_params(argv):
+    try:
+        opts, args = getopt.getopt(argv, "n:", ["entries"])
+    except getopt.GetoptError:
+        sys.exit(usage)
+    entryNumber = 20000
+    for opt,arg in opts:
+        if opt == '-n':
+            entryNumber = int(arg)
+    return entryNumber
+
+def getSyntheticLines(entryNumber):
+    random.seed(1)
+    entries = [(0, CHROM_SIZE), (1000, CHROM_SIZE/2), (CHROM_SIZE/2, CHROM_SIZE-1000)]
+    for i in xrange(entryNumber):
+        start = random.randint(0, CHROM_SIZE-1000)
+        entries.append((start, start+random.randint(0, 500)))
+    entries.sort()
+    return ["chr1\t"+str(start)+"\t"+str(end)+"\tentry"+str(i)+"\n" for i, (start, end) in enumerate(entries)]
+
+# list counting the reads of its items, used for the starts of a containment list (only read while scanning candidates)
+class CountingList(list):
+    reads = 0
+    def __getitem__(self, index):
+        CountingList.reads = CountingList.reads+1
+        return list.__getitem__(self, index)
+
+def countCandidates(containmentList):
+    return (CountingList(containmentList[0]),)+containmentList[1:]
+
+if __name__ == '__main__':
+    entryNumber = get_params(sys.argv[1:])
+    lines = getSyntheticLines(entryNumber)
+    entries = [(int(line.split("\t")[1]), int(line.split("\t")[2]), line.rstrip("\n")) for line in lines]
+    random.seed(2)
+    queries = []
+    for i in xrange(QUERY_NUMBER):
+        start = random.randint(0, CHROM_SIZE)
+        queries.append((start, start+random.choice([0, 1, 100, 5000])))
+    errors = 0
+    intervalIndex = getFromBed.getIntervalIndex(lines)
+    starts, ends, containmentList, sortedLines, sortedEnds, sortedEndLines = intervalIndex["chr1"]
+    intervalIndex["chr1"] = (starts, ends, countCandidates(containmentList), sortedLines, sortedEnds, sortedEndLines)
+    foundCount = 0
+    for start, end in queries:
+        found = getFromBed.getOverlaps(intervalIndex, "chr1", start, end)
+        expected = [line for entryStart, entryEnd, line in entries if entryStart < end and entryEnd > start]
+        foundCount = foundCount+len(found)
+        if found != expected:
+            errors = errors+1
+    # each list holding an overlap is entered by a binary search and read up to its first start past the query
+    print "Overlaps ('-v'): "+str(QUERY_NUMBER)+" queries, "+str(errors)+" different from the scan, "+str(foundCount)+" overlaps, "+str(CountingList.reads)+" candidates read."
+    if CountingList.reads > 2*foundCount+QUERY_NUMBER:
+        errors = errors+1
+        print "Too many candidates read."
+    tmpDir = tempfile.mkdtemp(prefix="checkBedIntervals_")
+    try:
+        bedName = os.path.join(tmpDir, "entries.bed")
+        bedFile = open(bedName, "w")
+        bedFile.writelines(lines)
+        bedFile.close()
+        getFromBed.writeBlockIndex(bedName)
+        blockIndex = getFromBed.getBlockIndex(bedName+".gz.idx")
+        firstStarts, maxEnds, offsets, sizes, containmentList = blockIndex["chr1"]
+        CountingList.reads = 0
+        blockIndex["chr1"] = (firstStarts, maxEnds, offsets, sizes, countCandidates(containmentList))
+        bgzFile = open(bedName+".gz", "rb")
+        regionErrors = 0
+        for start, end in queries[:200]:
+            found = getFromBed.getRegionLines(bgzFile, blockIndex, "chr1", start, end)
+            expected = [line for entryStart, entryEnd, line in entries if entryStart < end and entryEnd > start]
+            if found != expected:
+                regionErrors = regionErrors+1
+        bgzFile.close()
+        print "Regions ('-r'): 200 queries, "+str(regionErrors)+" different from the scan, "+str(CountingList.reads)+" block candidates read ("+str(len(firstStarts))+" blocks per query on a full scan)."
+        if CountingList.reads > 200*10:
+            regionErrors = regionErrors+1
+            print "Too many blocks read."
+        errors = errors+regionErrors
+    finally:
+        shutil.rmtree(tmpDir)
+    if errors > 0:
+        sys.exit(1)
@@ -0,0 +1,71 @@
+'''
+Checks that clinvarToBed_iterative.py writes the same bed file with several processes ('-t') as with one, on synthetic ClinVar-shaped XML files.
+'''
+
+# Writes a synthetic ClinVar XML file (see benchClinvarToBed.py) and compares the output of one process with the output of several processes.
+# A copy without the closing </ReleaseSet> tag (truncated download) must stop the parallel run with an error instead of dropping records.
+# Usage: python checkClinvarChunks.py -n 20000 -t 4
+# Args:
+#-n: number of ClinVarSet records (default: 20000)
+#-t: number of processes (default: 4)
+
+import sys
+import os
+import getopt
+import shutil
+import tempfile
+import clinvarToBed_iterative
+import benchClinvarToBed
+
+usage = "Checks that clinvarToBed_iterative.py writes the same bed file with several processes ('-t') as with one, on synthetic ClinVar-shaped XML files.\nUsage: python checkClinvarChunks.py -n 20000 -t 4\nArgs:\n-n: number of ClinVarSet records (default: 20000)\n-t: number of processes (default: 4)"
+
+def get_params(argv):
+    try:
+        opts, args = getopt.getopt(argv, "n:t:", ["records", "processes"])
+    except getopt.GetoptError:
+        sys.exit(usage)
+    recordNumber = 20000
+    processes = 4
+    for opt,arg in opts:
+        if opt == '-n':
+            recordNumber = int(arg)
+        if opt == '-t':
+            processes = int(arg)
+    return recordNumber, processes
+
+# returns the content of 'clinvar.bed' written in outDir
+def getBedText(xmlName, outDir, processes):
+    os.mkdir(outDir)
+    os.chdir(outDir)
+    clinvarToBed_iterative.writeSequenceLocations(xmlName, processes)
+    return open(os.path.join(outDir, "clinvar.bed")).read()
+
+if __name__ == '__main__':
+    recordNumber, processes = get_params(sys.argv[1:])
+    tmpDir = tempfile.mkdtemp(prefix="checkClinvarChunks_")
+    workDir = os.getcwd()
+    errors = 0
+    try:
+        xmlName = os.path.join(tmpDir, "clinvar_synthetic.xml")
+        benchClinvarToBed.writeSyntheticXML(xmlName, recordNumber)
+        serial = getBedText(xmlName, os.path.join(tmpDir, "serial"), 1)
+        parallel = getBedText(xmlName, os.path.join(tmpDir, "parallel"), processes)
+        print "Complete file: "+str(serial.count("\n"))+" lines with 1 process, "+str(parallel.count("\n"))+" lines with "+str(processes)+", identical: "+str(serial == parallel)+"."
+        if serial != parallel:
+            errors = errors+1
+        truncatedName = os.path.join(tmpDir, "clinvar_truncated.xml")
+        xmlText = open(xmlName).read()
+        truncatedFile = open(truncatedName, "w")
+        truncatedFile.write(xmlText[:xmlText.rfind("</ReleaseSet")])
+        truncatedFile.close()
+        try:
+            getBedText(truncatedName, os.path.join(tmpDir, "truncated"), processes)
+            print "File without closing tag: no error."
+            errors = errors+1
+        except SystemExit, exitError:
+            print "File without closing tag: stopped with '"+str(exitError)+"'."
+    finally:
+        os.chdir(workDir)
+        shutil.rmtree(tmpDir)
+    if errors > 0:
+        sys.exit(1)
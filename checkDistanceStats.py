@@ -0,0 +1,62 @@
+'''
+Checks the distance to TSS quantiles of distanceStats.py against exact quantiles on synthetic distances with heavy tails.
+'''
+
+# Draws distances with more than 5% of them beyond -1Mb and +1Mb (peaks on gene-poor chromosomes), adds them by chunks
+# and compares the quantiles with the exact ones: 10bp bins within 1Mb of the TSS, 1% of the distance beyond.
+# Requires:
+# -numpy: http://www.numpy.org/
+# Usage: python checkDistanceStats.py -n 1000000
+# Args:
+#-n: number of distances (default: 1000000)
+
+import sys
+import getopt
+import numpy as np
+import distanceStats
+
+usage = "Checks the distance to TSS quantiles of distanceStats.py against exact quantiles on synthetic distances with heavy tails.\nRequires:\n-numpy: http://www.numpy.org/\nUsage: python checkDistanceStats.py -n 1000000\nArgs:\n-n: number of distances (default: 1000000)"
+
+QUANTILES = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99]
+CHUNK_SIZE = 100000
+
+def get_params(argv):
+    try:
+        opts, args = getopt.getopt(argv, "n:", ["distances"])
+    except getopt.GetoptError:
+        sys.exit(usage)
+    distanceNumber = 1000000
+    for opt,arg in opts:
+        if opt == '-n':
+            distanceNumber = int(arg)
+    return distanceNumber
+
+# near the TSS for most peaks, Pareto-like tails reaching 100Mb for the others
+def getSyntheticDistances(distanceNumber):
+    np.random.seed(1)
+    distances = np.round(np.random.laplace(0, 20000, distanceNumber)).astype(np.int64)
+    tail = np.random.random(distanceNumber) < 0.3
+    farDistances = np.minimum(500000*(np.random.pareto(1.0, distanceNumber)+1), 100000000).astype(np.int64)
+    signs = np.where(np.random.random(distanceNumber) < 0.5, -1, 1)
+    distances[tail] = (signs*farDistances)[tail]
+    return distances
+
+if __name__ == '__main__':
+    distanceNumber = get_params(sys.argv[1:])
+    distances = getSyntheticDistances(distanceNumber)
+    stats = distanceStats.getDistanceStats()
+    for i in xrange(0, len(distances), CHUNK_SIZE):
+        distanceStats.addDistances(stats, distances[i:i+CHUNK_SIZE])
+    sortedDistances = np.sort(distances)
+    errors = 0
+    print "Distances: "+str(len(distances))+", beyond -1Mb: "+str(int(np.sum(distances < -1000000)))+", beyond +1Mb: "+str(int(np.sum(distances > 1000000)))+"."
+    for quantile, value in distanceStats.getQuantiles(stats, QUANTILES):
+        exact = int(sortedDistances[max(1, int(np.ceil(quantile*len(distances))))-1])
+        tolerance = max(distanceStats.QUANTILE_BIN, abs(exact)*(distanceStats.FAR_RATIO-1))
+        status = "ok"
+        if abs(value-exact) > tolerance:
+            status = "wrong"
+            errors = errors+1
+        print str(quantile*100)+"%: "+str(value)+", exact: "+str(exact)+" ("+status+")."
+    if errors > 0:
+        sys.exit(1)
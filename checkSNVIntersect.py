@@ -0,0 +1,84 @@
+'''
+Compares the sorted intersection of getSNVTable.py ('-a'/'-b') with the output of intersectBed '-wo' ('-i') on synthetic bed files.
+'''
+
+# Writes sorted variant and motif bed files with zero-length (start == stop, as in the clinvar bed file), 1bp and 2bp variants
+# around the first and last bases of each motif, then compares the SNVs found by both ways.
+# Requires:
+# -bedtools (intersectBed): http://bedtools.readthedocs.org/
+# Usage: python checkSNVIntersect.py -n 1000
+# Args:
+#-n: number of motifs (default: 1000)
+
+import sys
+import os
+import getopt
+import shutil
+import tempfile
+import subprocess
+import getSNVTable
+
+usage = "Compares the sorted intersection of getSNVTable.py ('-a'/'-b') with the output of intersectBed '-wo' ('-i') on synthetic bed files.\nRequires:\n-bedtools (intersectBed): http://bedtools.readthedocs.org/\nUsage: python checkSNVIntersect.py -n 1000\nArgs:\n-n: number of motifs (default: 1000)"
+
+MOTIF_WIDTH = 12
+
+def get_params(argv):
+    try:
+        opts, args = getopt.getopt(argv, "n:", ["motifs"])
+    except getopt.GetoptError:
+        sys.exit(usage)
+    motifNumber = 1000
+    for opt,arg in opts:
+        if opt == '-n':
+            motifNumber = int(arg)
+    return motifNumber
+
+# motifs are 40bp apart, every fifth one overlaps the previous one
+def writeSyntheticBeds(variantBed, motifBed, motifNumber):
+    motifs = []
+    for i in xrange(motifNumber):
+        chrom = "chr"+str(i%3+1)
+        mStart = 1000+(i//3)*40
+        if i%5 == 4:
+            mStart = mStart-MOTIF_WIDTH/2
+        motifs.append((chrom, mStart, mStart+MOTIF_WIDTH, "peak"+str(i)))
+    variants = []
+    for chrom, mStart, mEnd, peakID in motifs:
+        for position in [mStart-2, mStart-1, mStart, mStart+1, mStart+MOTIF_WIDTH/2, mEnd-1, mEnd, mEnd+1]:
+            variants.append((chrom, position, position))
+            variants.append((chrom, position, position+1))
+            variants.append((chrom, position, position+2))
+    for fileName, rows in [(variantBed, sorted(set(variants))), (motifBed, sorted(motifs))]:
+        bFile = open(fileName, "w")
+        for row in rows:
+            if len(row) == 3:
+                row = row+("var_"+row[0]+"_"+str(row[1])+"_"+str(row[2]),)
+            bFile.write("\t".join([str(field) for field in row])+"\n")
+        bFile.close()
+
+if __name__ == '__main__':
+    motifNumber = get_params(sys.argv[1:])
+    tmpDir = tempfile.mkdtemp(prefix="checkSNVIntersect_")
+    try:
+        variantBed = os.path.join(tmpDir, "variants.bed")
+        motifBed = os.path.join(tmpDir, "motifs.bed")
+        intersectName = os.path.join(tmpDir, "intersect.bed")
+        writeSyntheticBeds(variantBed, motifBed, motifNumber)
+        try:
+            intersectFile = open(intersectName, "w")
+            subprocess.check_call(["intersectBed", "-a", variantBed, "-b", motifBed, "-wo"], stdout=intersectFile)
+            intersectFile.close()
+        except OSError:
+            sys.exit("intersectBed not found, install bedtools: http://bedtools.readthedocs.org/")
+        expected, expectedWidth = getSNVTable.parseBed(intersectName)
+        found, foundWidth = getSNVTable.intersectSortedBeds(variantBed, motifBed)
+        missing = sorted(set(expected)-set(found))
+        extra = sorted(set(found)-set(expected))
+        print "SNVs: "+str(len(expected))+" from intersectBed, "+str(len(found))+" from the sorted intersection, "+str(len(missing))+" missing, "+str(len(extra))+" extra."
+        for label, snvs in [("Missing", missing), ("Extra", extra)]:
+            for varLocation, varID, peakID in snvs[:10]:
+                print label+": "+varID+" in "+peakID+", position "+str(varLocation)+"."
+        if len(missing) > 0 or len(extra) > 0 or sorted(expected) != sorted(found) or expectedWidth != foundWidth:
+            sys.exit(1)
+    finally:
+        shutil.rmtree(tmpDir)
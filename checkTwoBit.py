@@ -0,0 +1,89 @@
+'''
+Checks the fasta to 2bit conversion of getFromGenome.py ('-c') and the sequences read back ('-b') on a synthetic genome with IUPAC codes.
+'''
+
+# Writes a synthetic genome (upper and lower case bases, N runs and IUPAC codes), converts it to 2bit and compares random regions
+# read from the 2bit file with the fasta sequences, where every letter other than A, C, G, T is expected as N (n if lower case).
+# Usage: python checkTwoBit.py -n 2000
+# Args:
+#-n: number of regions (default: 2000)
+
+import sys
+import os
+import getopt
+import random
+import shutil
+import tempfile
+import getFromGenome
+
+usage = "Checks the fasta to 2bit conversion of getFromGenome.py ('-c') and the sequences read back ('-b') on a synthetic genome with IUPAC codes.\nUsage: python checkTwoBit.py -n 2000\nArgs:\n-n: number of regions (default: 2000)"
+
+IUPAC_CODES = "RYKMSWBDHVN"
+
+def get_params(argv):
+    try:
+        opts, args = getopt.getopt(argv, "n:", ["regions"])
+    except getopt.GetoptError:
+        sys.exit(usage)
+    regionNumber = 2000
+    for opt,arg in opts:
+        if opt == '-n':
+            regionNumber = int(arg)
+    return regionNumber
+
+def getSyntheticSequence(size):
+    seq = []
+    while len(seq) < size:
+        runType = random.random()
+        if runType < 0.05:
+            seq.extend(["N"]*random.randint(1, 200))
+        elif runType < 0.15:
+            seq.extend([random.choice(IUPAC_CODES) for i in xrange(random.randint(1, 3))])
+        else:
+            seq.extend([random.choice("ACGT") for i in xrange(random.randint(1, 300))])
+    seq = "".join(seq[:size])
+    # lower case (masked) runs, overlapping the N runs and IUPAC codes
+    for i in xrange(size/1000):
+        start = random.randint(0, size-1)
+        end = min(size, start+random.randint(1, 500))
+        seq = seq[:start]+seq[start:end].lower()+seq[end:]
+    return seq
+
+# letters read back from the 2bit file
+def getExpectedSequence(seq):
+    return "".join([base if base in "ACGTacgt" else ("n" if base.islower() else "N") for base in seq])
+
+if __name__ == '__main__':
+    regionNumber = get_params(sys.argv[1:])
+    random.seed(1)
+    sequences = [("chr"+str(i+1), getSyntheticSequence(random.randint(1000, 100000))) for i in xrange(3)]
+    tmpDir = tempfile.mkdtemp(prefix="checkTwoBit_")
+    errors = 0
+    try:
+        fastaName = os.path.join(tmpDir, "genome.fa")
+        fFile = open(fastaName, "w")
+        for name, seq in sequences:
+            fFile.write(">"+name+"\n")
+            for i in xrange(0, len(seq), 60):
+                fFile.write(seq[i:i+60]+"\n")
+        fFile.close()
+        genomeName = os.path.join(tmpDir, "genome.2bit")
+        getFromGenome.writeTwoBit(fastaName, genomeName)
+        genome = getFromGenome.openTwoBit(genomeName)
+        for name, seq in sequences:
+            expected = getExpectedSequence(seq)
+            if getFromGenome.getSequence(genome, name, 0, len(seq)) != expected:
+                errors = errors+1
+                print "Different sequence: "+name+"."
+            for i in xrange(regionNumber/len(sequences)):
+                start = random.randint(-10, len(seq))
+                end = start+random.randint(0, 300)
+                if getFromGenome.getSequence(genome, name, start, end) != expected[max(start, 0):end]:
+                    errors = errors+1
+                    print "Different region: "+name+":"+str(start)+"-"+str(end)+"."
+        iupacCount = sum([len([base for base in seq if base.upper() in IUPAC_CODES[:-1]]) for name, seq in sequences])
+        print str(len(sequences))+" sequences ("+str(iupacCount)+" IUPAC codes other than N) and "+str(regionNumber)+" regions read back, "+str(errors)+" different."
+    finally:
+        shutil.rmtree(tmpDir)
+    if errors > 0:
+        sys.exit(1)
@@ -0,0 +1,80 @@
+'''
+Persistent ClinVar record store shared by clinvarToBed_iterative.py and getSNVTable.py.
+'''
+
+# SQLite file keeping one row per ClinVar record (RCV accession and version) with its sequence locations, so that a new release only needs the new or updated records to be converted.
+# Requires:
+# -sqlite3 (python standard library)
+# Tables:
+# 'records': accession, version, name, clinical significance, condition ('MedGen:<id>' list, as in the ClinVar tab-delimited files)
+# 'locations': BED line of each sequence location of a record, by assembly, with its reference and alternate alleles (NULL if not given)
+# 'changes': records added, updated and removed by each release
+
+import sqlite3
+
+def openStore(storeFile):
+    connection = sqlite3.connect(storeFile)
+    connection.text_factory = str
+    connection.execute("CREATE TABLE IF NOT EXISTS records (acc TEXT PRIMARY KEY, version INTEGER, name TEXT, clinSig TEXT, condition TEXT)")
+    connection.execute("CREATE TABLE IF NOT EXISTS locations (acc TEXT, rank INTEGER, assembly TEXT, line TEXT, ref TEXT, alt TEXT)")
+    # stores written before the alleles were kept: the records are parsed again with the next release
+    if "alt" not in [column[1] for column in connection.execute("PRAGMA table_info(locations)")]:
+        connection.execute("ALTER TABLE locations ADD COLUMN ref TEXT")
+        connection.execute("ALTER TABLE locations ADD COLUMN alt TEXT")
+        connection.execute("UPDATE records SET version = -1")
+        print "Store '"+storeFile+"' has no alleles, all records will be updated."
+    connection.execute("CREATE INDEX IF NOT EXISTS locations_acc ON locations (acc)")
+    connection.execute("CREATE TABLE IF NOT EXISTS changes (release TEXT, acc TEXT, version INTEGER, change TEXT)")
+    # accessions of the release being read, in file order
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS seen (acc TEXT PRIMARY KEY, position INTEGER)")
+    return connection
+
+# returns accession -> version of all stored records
+def getStoredVersions(connection):
+    return dict(connection.execute("SELECT acc, version FROM records"))
+
+# record: (acc, version, name, clinSig, condition, locations), locations: list of (assembly, BED line, reference allele, alternate allele)
+def storeRecord(connection, record, release, change):
+    acc, version, name, clinSig, condition, locations = record
+    connection.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)", (acc, version, name, clinSig, condition))
+    connection.execute("DELETE FROM locations WHERE acc = ?", (acc,))
+    connection.executemany("INSERT INTO locations VALUES (?, ?, ?, ?, ?, ?)", [(acc, rank)+tuple(locations[rank]) for rank in xrange(len(locations))])
+    connection.execute("INSERT INTO changes VALUES (?, ?, ?, ?)", (release, acc, version, change))
+
+def markSeen(connection, accPositions):
+    connection.executemany("INSERT OR REPLACE INTO seen VALUES (?, ?)", accPositions)
+
+# deletes the stored records missing from the release, returns their number
+def removeUnseen(connection, release):
+    removed = connection.execute("SELECT acc, version FROM records WHERE acc NOT IN (SELECT acc FROM seen)").fetchall()
+    connection.executemany("INSERT INTO changes VALUES (?, ?, ?, 'removed')", [(release, acc, version) for acc, version in removed])
+    connection.executemany("DELETE FROM records WHERE acc = ?", [(acc,) for acc, version in removed])
+    connection.executemany("DELETE FROM locations WHERE acc = ?", [(acc,) for acc, version in removed])
+    return len(removed)
+
+# writes the locations of one assembly in the order of the last release read, returns the number of lines
+def writeStoredLocations(connection, assembly, outFile):
+    lineCount = 0
+    for (line,) in connection.execute("SELECT l.line FROM seen s JOIN locations l ON l.acc = s.acc WHERE l.assembly = ? ORDER BY s.position, l.rank", (assembly,)):
+        outFile.write(line)
+        lineCount = lineCount+1
+    return lineCount
+
+# returns accession -> (name, clinSig, condition, alleles) for the accessions found in the store, alleles: (ref, alt) of the first location giving them, or None
+def getRecordAnnotations(storeFile, accessions):
+    connection = sqlite3.connect(storeFile)
+    connection.text_factory = str
+    accessions = list(set(accessions))
+    annotations = {}
+    # SQLite limits the number of query parameters
+    for i in xrange(0, len(accessions), 500):
+        batch = accessions[i:i+500]
+        query = "SELECT acc, name, clinSig, condition FROM records WHERE acc IN ("+",".join(["?"]*len(batch))+")"
+        for acc, name, clinSig, condition in connection.execute(query, batch):
+            annotations[acc] = (name, clinSig, condition, None)
+        query = "SELECT acc, ref, alt FROM locations WHERE alt IS NOT NULL AND acc IN ("+",".join(["?"]*len(batch))+") ORDER BY rank DESC"
+        for acc, ref, alt in connection.execute(query, batch):
+            annotations[acc] = annotations[acc][:3]+((ref, alt),)
+    connection.close()
+    print "Reading '"+storeFile+"': "+str(len(annotations))+" of "+str(len(accessions))+" variants found."
+    return annotations
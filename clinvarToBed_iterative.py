@@ -4,69 +4,422 @@
 
 # Converts the ClinVar DB XML file to bed format
 #Requires:
-#-elementtree: http://effbot.org/zone/element-index.htm#installation
+#-cElementTree (python standard library)
 # Usage: python clinvarToBed_iterative.py -i ClinVarFullRelease_2015-04.xml
 #Args:
-#-i: input file, clinVar XML file
+#-i: input file, clinVar XML file (.xml.gz files are decompressed on the fly by a background thread)
+#-a: comma-separated assemblies written in the same pass (default: GRCh37), e.g. GRCh37,GRCh38
+#-z: write gzip-compressed output (.bed.gz)
+#-t: number of processes, the file is split between ClinVarSet records into chunks parsed in parallel (same output as one process), 0 uses all available cores
+#-s <clinvar.db>: record store (SQLite, see clinvarStore.py), only the records whose accession/version is not stored yet are parsed, records missing from the release are removed and the bed files are written from the store
 #Output:
-#'clinvar.bed': clinVar DB in bed format
+#'clinvar.bed': clinVar DB in bed format, or 'clinvar_<assembly>.bed' for each assembly if several are given
 
 import getopt
 import sys
-from elementtree.ElementTree import iterparse
+import os
+import multiprocessing
+import gzip
+import threading
+import Queue
+import re
+from cStringIO import StringIO
+try:
+    from xml.etree.cElementTree import iterparse, fromstring
+except ImportError:
+    from xml.etree.ElementTree import iterparse, fromstring
 
-usage = "Converts the ClinVar DB XML file to bed format\nUsage: python clinvarToBed_iterative.py -i ClinVarFullRelease_2015-04.xml\nArgs:\n-i: input file, clinVar XML file\nOutput:\n'clinvar.bed': clinVar DB in bed format"
+usage = "Converts the ClinVar DB XML file to bed format\nUsage: python clinvarToBed_iterative.py -i ClinVarFullRelease_2015-04.xml\nArgs:\n-i: input file, clinVar XML file (.xml.gz files are decompressed on the fly by a background thread)\n-a: comma-separated assemblies written in the same pass (default: GRCh37), e.g. GRCh37,GRCh38\n-z: write gzip-compressed output (.bed.gz)\n-t: number of processes, the file is split between ClinVarSet records into chunks parsed in parallel (same output as one process), 0 uses all available cores\n-s <clinvar.db>: record store (SQLite, see clinvarStore.py), only the records whose accession/version is not stored yet are parsed, records missing from the release are removed and the bed files are written from the store\nOutput:\n'clinvar.bed': clinVar DB in bed format, or 'clinvar_<assembly>.bed' for each assembly if several are given"
 
 def get_params(argv):
     try:
-        opts, args = getopt.getopt(argv, "i:", ["infile"])
+        opts, args = getopt.getopt(argv, "i:t:a:zs:", ["infile", "processes", "assemblies", "gzip", "store"])
     except getopt.GetoptError:
         sys.exit(usage)
     infilename = "none"
+    processes = 1
+    assemblies = ["GRCh37"]
+    gzipOutput = False
+    storeFile = "none"
     for opt,arg in opts:
         if opt =='-i':
             infilename = arg
-    return infilename
-
-
-def writeSequenceLocations(infileName):
-    outFile = open('clinvar.bed', 'w')
-    seqCount = 0
-    print "Parsing file and writing sequence locations..."
-    context = iterparse(infileName, events=("start", "end"))
-    context = iter(context)
-    event, root = context.next()
-    for event, elem in context:
-        if elem.tag == "MeasureRelationship":
+        if opt == '-t':
+            processes = int(arg)
+        if opt == '-a':
+            assemblies = [assembly for assembly in arg.split(",") if assembly != ""]
+        if opt == '-z':
+            gzipOutput = True
+        if opt == '-s':
+            storeFile = arg
+    return infilename, processes, assemblies, gzipOutput, storeFile
+
+READ_BLOCK_SIZE = 4194304
+# number of decompressed blocks the reading thread can get ahead of the parser
+QUEUE_SIZE = 8
+
+# file-like object reading a gzip file: blocks are inflated by a background thread while the parser works on the previous ones
+# (a decompression error is passed through the queue and raised by read, as with gzip.open)
+class ThreadedGzipReader(object):
+    def __init__(self, fileName):
+        self.blocks = Queue.Queue(QUEUE_SIZE)
+        self.block = ""
+        self.offset = 0
+        self.finished = False
+        self.thread = threading.Thread(target=self.inflate, args=(fileName,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def inflate(self, fileName):
+        try:
+            gFile = gzip.open(fileName, "rb")
+            block = gFile.read(READ_BLOCK_SIZE)
+            while block:
+                self.blocks.put(block)
+                block = gFile.read(READ_BLOCK_SIZE)
+            gFile.close()
+            self.blocks.put("")
+        except Exception:
+            self.blocks.put(sys.exc_info())
+
+    # returns False at the end of the file
+    def nextBlock(self):
+        block = self.blocks.get()
+        if isinstance(block, tuple):
+            self.finished = True
+            raise block[0], block[1], block[2]
+        if block == "":
+            self.finished = True
+            return False
+        self.block = block
+        self.offset = 0
+        return True
+
+    # only the returned bytes are copied, the current block is read from an offset
+    def read(self, size = -1):
+        parts = []
+        while size != 0:
+            if self.offset == len(self.block):
+                if self.finished or not self.nextBlock():
+                    break
+            if size < 0:
+                end = len(self.block)
+            else:
+                end = min(len(self.block), self.offset+size)
+                size = size-(end-self.offset)
+            parts.append(self.block[self.offset:end])
+            self.offset = end
+        if len(parts) == 1:
+            return parts[0]
+        return "".join(parts)
+
+def openClinVar(infileName):
+    if infileName.endswith(".gz"):
+        return ThreadedGzipReader(infileName)
+    return open(infileName, "rb")
+
+def getOutfileNames(assemblies, gzipOutput):
+    suffix = ".bed"
+    if gzipOutput:
+        suffix = ".bed.gz"
+    if len(assemblies) == 1:
+        return {assemblies[0]: "clinvar"+suffix}
+    return dict([(assembly, "clinvar_"+assembly+suffix) for assembly in assemblies])
+
+def openOutfile(outfileName, gzipOutput):
+    if gzipOutput:
+        return gzip.open(outfileName, "wb", 6)
+    return open(outfileName, "w", 1048576)
+
+
+# returns the BED line of a SequenceLocation element, or None if it has no coordinates
+def getLocationLine(seqLoc, acc):
+    start = seqLoc.get("start")
+    stop = seqLoc.get("stop")
+    if start is None or stop is None:
+        return None
+    strand = seqLoc.get("Strand")
+    if strand != "+" and strand != "-":
+        strand = "."
+    return "chr"+str(seqLoc.get("Chr"))+"\t"+start+"\t"+stop+"\t"+str(acc)+"\t0\t"+strand+"\n"
+
+# subscribes to end events only: the accession is read when its element is complete, locations when their Measure is complete
+# (locations of MeasureRelationship elements are not direct children of Measure and are skipped), each ClinVarSet is cleared once read
+# (its empty element stays in the root until the end of the source, see parseClinVarFile)
+# outFiles: one output file per assembly
+def parseClinVarSets(source, outFiles):
+    seqCounts = dict([(assembly, 0) for assembly in outFiles])
+    recordCount = 0
+    acc = "None"
+    for event, elem in iterparse(source, events=("end",)):
+        tag = elem.tag
+        if tag == "ClinVarAccession":
+            acc = elem.get("Acc")
+        elif tag == "Measure":
+            for seqLoc in elem.findall("SequenceLocation"):
+                assembly = seqLoc.get("Assembly")
+                if assembly in outFiles:
+                    line = getLocationLine(seqLoc, acc)
+                    if line is not None:
+                        outFiles[assembly].write(line)
+                        seqCounts[assembly] = seqCounts[assembly]+1
+            elem.clear()
+        elif tag == "MeasureRelationship":
             elem.clear()
-            root.clear()
+        elif tag == "ClinVarSet":
+            recordCount = recordCount+1
+            elem.clear()
+    return seqCounts, recordCount
+
+RECORD_TAG = "<ClinVarSet"
+# chunks are kept under this size so that each process only holds a small part of the file
+MAX_CHUNK_SIZE = 67108864
+SEARCH_BLOCK_SIZE = 1048576
+
+# returns the position of the first ClinVarSet start tag of text found after offset, -1 if there is none
+def findRecordTag(text, offset):
+    position = text.find(RECORD_TAG, offset)
+    while position != -1 and position+len(RECORD_TAG) < len(text) and not text[position+len(RECORD_TAG)] in " >\t\r\n":
+        position = text.find(RECORD_TAG, position+1)
+    return position
+
+# returns the position of the last complete ClinVarSet start tag of text, -1 if there is none
+def findLastRecordTag(text):
+    position = text.rfind(RECORD_TAG)
+    while position != -1 and (position+len(RECORD_TAG) >= len(text) or not text[position+len(RECORD_TAG)] in " >\t\r\n"):
+        position = text.rfind(RECORD_TAG, 0, position)
+    return position
+
+# returns a file-like object holding the records of text in a ReleaseSet element
+def wrapRecords(text):
+    return StringIO("<ReleaseSet>"+text+"</ReleaseSet>")
+
+# yields the text of consecutive whole ClinVarSet records read by blocks (the ReleaseSet header and closing tag are removed)
+def getRecordBlocks(xFile):
+    text = ""
+    started = False
+    block = xFile.read(READ_BLOCK_SIZE)
+    while block:
+        text = text+block
+        if not started:
+            position = findRecordTag(text, 0)
+            if position == -1:
+                text = text[-len(RECORD_TAG):]
+            else:
+                text = text[position:]
+                started = True
+        if started:
+            position = findLastRecordTag(text)
+            if position > 0:
+                yield text[:position]
+                text = text[position:]
+        block = xFile.read(READ_BLOCK_SIZE)
+    end = text.rfind("</ReleaseSet")
+    if end != -1:
+        text = text[:end]
+    if started and text != "":
+        yield text
+
+# parses the records block by block, so that only the (cleared) records of one block are held by an iterparse root
+def parseClinVarFile(xFile, outFiles):
+    seqCounts = dict([(assembly, 0) for assembly in outFiles])
+    recordCount = 0
+    for recordBlock in getRecordBlocks(xFile):
+        blockSeqCounts, blockRecordCount = parseClinVarSets(wrapRecords(recordBlock), outFiles)
+        for assembly in outFiles:
+            seqCounts[assembly] = seqCounts[assembly]+blockSeqCounts[assembly]
+        recordCount = recordCount+blockRecordCount
+    return seqCounts, recordCount
+
+# returns the offset of the first ClinVarSet start tag found after offset (or end if there is none before end)
+def findRecordStart(xFile, offset, end):
+    while offset < end:
+        xFile.seek(offset)
+        block = xFile.read(SEARCH_BLOCK_SIZE+len(RECORD_TAG))
+        position = findRecordTag(block, 0)
+        if position != -1:
+            return min(offset+position, end)
+        offset = offset+SEARCH_BLOCK_SIZE
+    return end
+
+# returns (start, end) byte ranges of the file, each one holding whole ClinVarSet records
+def getRecordChunks(infileName, processes):
+    fileSize = os.path.getsize(infileName)
+    xFile = open(infileName, "rb")
+    xFile.seek(max(0, fileSize-SEARCH_BLOCK_SIZE))
+    tail = xFile.read()
+    if tail.rfind("</ReleaseSet") == -1:
+        xFile.close()
+        sys.exit("'"+infileName+"' has no closing </ReleaseSet> tag in its last "+str(SEARCH_BLOCK_SIZE/1024)+"kb (truncated file?), the records cannot be split between processes.")
+    recordsEnd = max(0, fileSize-SEARCH_BLOCK_SIZE)+tail.rfind("</ReleaseSet")
+    recordsStart = findRecordStart(xFile, 0, recordsEnd)
+    chunkNumber = max(processes*4, (recordsEnd-recordsStart)/MAX_CHUNK_SIZE+1)
+    boundaries = [recordsStart]
+    for chunk in xrange(1, chunkNumber):
+        boundary = findRecordStart(xFile, recordsStart+((recordsEnd-recordsStart)*chunk)/chunkNumber, recordsEnd)
+        if boundary > boundaries[-1] and boundary < recordsEnd:
+            boundaries.append(boundary)
+    boundaries.append(recordsEnd)
+    xFile.close()
+    return [(boundaries[i], boundaries[i+1]) for i in xrange(len(boundaries)-1)]
+
+# worker: returns the BED lines (per assembly) of the records of one byte range
+def parseRecordChunk(args):
+    infileName, start, end, assemblies = args
+    xFile = open(infileName, "rb")
+    xFile.seek(start)
+    chunk = wrapRecords(xFile.read(end-start))
+    xFile.close()
+    outBuffers = dict([(assembly, StringIO()) for assembly in assemblies])
+    seqCounts, recordCount = parseClinVarSets(chunk, outBuffers)
+    return dict([(assembly, outBuffers[assembly].getvalue()) for assembly in assemblies]), seqCounts, recordCount
+
+def writeSequenceLocations(infileName, processes = 1, assemblies = ["GRCh37"], gzipOutput = False):
+    if processes > 1 and infileName.endswith(".gz"):
+        print "Compressed input cannot be split into byte ranges, parsing '"+infileName+"' in one process."
+        processes = 1
+    if processes > 1:
+        chunks = getRecordChunks(infileName, processes)
+    outfileNames = getOutfileNames(assemblies, gzipOutput)
+    outFiles = dict([(assembly, openOutfile(outfileNames[assembly], gzipOutput)) for assembly in assemblies])
+    print "Parsing file and writing sequence locations ("+", ".join(assemblies)+")..."
+    if processes > 1:
+        print "Splitting '"+infileName+"' into "+str(len(chunks))+" chunks parsed by "+str(processes)+" processes."
+        pool = multiprocessing.Pool(processes)
+        seqCounts = dict([(assembly, 0) for assembly in assemblies])
+        recordCount = 0
+        for lines, chunkSeqCounts, chunkRecordCount in pool.imap(parseRecordChunk, [(infileName, start, end, assemblies) for start, end in chunks]):
+            for assembly in assemblies:
+                outFiles[assembly].write(lines[assembly])
+                seqCounts[assembly] = seqCounts[assembly]+chunkSeqCounts[assembly]
+            recordCount = recordCount+chunkRecordCount
+        pool.close()
+        pool.join()
+    else:
+        seqCounts, recordCount = parseClinVarFile(openClinVar(infileName), outFiles)
+    print "Parsing done! "+str(recordCount)+" records."
+    for assembly in assemblies:
+        outFiles[assembly].flush()
+        outFiles[assembly].close()
+        print "Output file '"+outfileNames[assembly]+"': "+str(seqCounts[assembly])+" "+assembly+" locations found."
+    print "Finished!"
+
+ACCESSION_PATTERN = re.compile(r'<ClinVarAccession\s([^>]*)>')
+ACC_PATTERN = re.compile(r'\bAcc="([^"]*)"')
+VERSION_PATTERN = re.compile(r'\bVersion="([^"]*)"')
+RELEASE_PATTERN = re.compile(r'<ReleaseSet\s[^>]*\bDated="([^"]*)"')
+
+# yields the text of each ClinVarSet record, the first item is the text before the first record (ReleaseSet header)
+def getRecordTexts(xFile):
+    text = ""
+    start = 0
+    searchFrom = 0
+    block = xFile.read(READ_BLOCK_SIZE)
+    while block:
+        text = text[start:]+block
+        searchFrom = searchFrom-start
+        start = 0
+        position = findRecordTag(text, searchFrom)
+        while position != -1:
+            yield text[start:position]
+            start = position
+            position = findRecordTag(text, position+1)
+        searchFrom = max(start+1, len(text)-len(RECORD_TAG))
+        block = xFile.read(READ_BLOCK_SIZE)
+    text = text[start:]
+    end = text.rfind("</ReleaseSet")
+    if end != -1:
+        text = text[:end]
+    yield text
+
+# returns the RCV accession and version of a record (first ClinVarAccession element) without parsing the XML
+def getRecordVersion(recordText):
+    match = ACCESSION_PATTERN.search(recordText)
+    if match is None:
+        return "None", 0
+    acc = ACC_PATTERN.search(match.group(1))
+    version = VERSION_PATTERN.search(match.group(1))
+    return (acc and acc.group(1) or "None"), (version and int(version.group(1)) or 0)
+
+def getElementText(elem, path):
+    found = elem.find(path)
+    if found is None or found.text is None:
+        return "NA"
+    return found.text.strip()
+
+# returns (acc, version, name, clinSig, condition, locations) of a ClinVarSet record, locations: (assembly, BED line) of all assemblies
+def parseRecord(recordText, acc, version):
+    record = fromstring(recordText)
+    reference = record.find("ReferenceClinVarAssertion")
+    if reference is None:
+        reference = record
+    name = getElementText(reference, "MeasureSet/Measure/Name/ElementValue")
+    clinSig = getElementText(reference, "ClinicalSignificance/Description")
+    condition = ",".join(["MedGen:"+xref.get("ID") for xref in reference.findall("TraitSet/Trait/XRef") if xref.get("DB") == "MedGen"])
+    locations = []
+    locationAcc = "None"
+    for elem in record.iter():
+        if elem.tag == "ClinVarAccession":
+            locationAcc = elem.get("Acc")
+        elif elem.tag == "Measure":
+            for seqLoc in elem.findall("SequenceLocation"):
+                line = getLocationLine(seqLoc, locationAcc)
+                if line is not None:
+                    locations.append((seqLoc.get("Assembly"), line, seqLoc.get("referenceAllele"), seqLoc.get("alternateAllele")))
+    return acc, version, name, clinSig, condition, locations
+
+# records already stored with the same version are skipped before being parsed
+def updateStore(infileName, storeFile, assemblies = ["GRCh37"], gzipOutput = False):
+    import clinvarStore
+    connection = clinvarStore.openStore(storeFile)
+    storedVersions = clinvarStore.getStoredVersions(connection)
+    print "Reading store '"+storeFile+"': "+str(len(storedVersions))+" records."
+    xFile = openClinVar(infileName)
+    recordTexts = getRecordTexts(xFile)
+    header = next(recordTexts)
+    release = RELEASE_PATTERN.search(header)
+    if release is None:
+        release = infileName
+    else:
+        release = release.group(1)
+    print "Parsing file and updating records (release "+release+")..."
+    counts = {"added": 0, "updated": 0, "unchanged": 0}
+    accPositions = []
+    for recordText in recordTexts:
+        acc, version = getRecordVersion(recordText)
+        accPositions.append((acc, len(accPositions)))
+        if storedVersions.get(acc) == version:
+            counts["unchanged"] = counts["unchanged"]+1
             continue
-        for access in elem.findall("ClinVarAccession"):
-            acc = access.get("Acc")
-        for seqLoc in elem.findall("SequenceLocation"):
-            if seqLoc.get("Assembly") == "GRCh37" and event == "end":
-                chrom = "chr"+seqLoc.get("Chr")
-                start = seqLoc.get("start")
-                stop = seqLoc.get("stop")
-                if seqLoc.get("Strand") == "+" or seqLoc.get("Strand") == "-":
-                    strand = seqLoc.get("Strand")
-                else:
-                    strand = "."
-                seqTuple = (chrom, start, stop, acc, 0, strand)
-                if str(seqTuple[1]) != "None" and str(seqTuple[2]) != "None":
-                    line = str(seqTuple[0])+"\t"+str(seqTuple[1])+"\t"+str(seqTuple[2])+"\t"+str(seqTuple[3])+"\t"+str(seqTuple[4])+"\t"+str(seqTuple[5])+"\n"
-                    outFile.write(line)
-                    seqCount= seqCount+1
-                elem.clear()
-                root.clear()
-    print "Parsing done!"
-    outFile.flush()
-    outFile.close()
-    print "Output file 'clinvar.bed': "+str(seqCount)+" locations found."
+        change = "added"
+        if acc in storedVersions:
+            change = "updated"
+        clinvarStore.storeRecord(connection, parseRecord(recordText, acc, version), release, change)
+        storedVersions[acc] = version
+        counts[change] = counts[change]+1
+    if not isinstance(xFile, ThreadedGzipReader):
+        xFile.close()
+    clinvarStore.markSeen(connection, accPositions)
+    removed = clinvarStore.removeUnseen(connection, release)
+    connection.commit()
+    print "Parsing done! "+str(len(accPositions))+" records: "+str(counts["added"])+" added, "+str(counts["updated"])+" updated, "+str(counts["unchanged"])+" unchanged, "+str(removed)+" removed."
+    outfileNames = getOutfileNames(assemblies, gzipOutput)
+    for assembly in assemblies:
+        outFile = openOutfile(outfileNames[assembly], gzipOutput)
+        seqCount = clinvarStore.writeStoredLocations(connection, assembly, outFile)
+        outFile.flush()
+        outFile.close()
+        print "Output file '"+outfileNames[assembly]+"': "+str(seqCount)+" "+assembly+" locations found."
+    connection.close()
     print "Finished!"
-    
+
 if __name__ == '__main__':
-    infileName = get_params(sys.argv[1:])
-    if infileName=="none":
+    infileName, processes, assemblies, gzipOutput, storeFile = get_params(sys.argv[1:])
+    if infileName=="none" or len(assemblies) == 0:
         sys.exit(usage)
-    writeSequenceLocations(infileName)
+    if processes == 0:
+        processes = multiprocessing.cpu_count()
+    if storeFile != "none":
+        updateStore(infileName, storeFile, assemblies, gzipOutput)
+    else:
+        writeSequenceLocations(infileName, processes, assemblies, gzipOutput)
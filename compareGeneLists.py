@@ -6,8 +6,8 @@ Created on 11 mai 2015
 
 # Compares a gene list to a homer annotatePeaks.py output and finds common genes.
 # Requires:
-# -matplotlib: http://matplotlib.org/
-# -matplotlib-venn: https://pypi.python.org/pypi/matplotlib-venn
+# -matplotlib: http://matplotlib.org/ (only imported for displayed or saved plots, see plotFiles.py)
+# -matplotlib-venn: https://pypi.python.org/pypi/matplotlib-venn (only imported for displayed or saved plots)
 # Arguments:
 #-i <genes.txt>, gene list with two tab separated fields per line (ENSEMBL Gene ID, gene common name).
 #-h <homerOut.tsv>, annotated file from homer with ensembl transcriptID as reference.
@@ -16,6 +16,7 @@ Created on 11 mai 2015
 #-b true, if your '-i' file is also a homer annotation file.
 #-g true, if your '-h' file is also a list with gene IDs in the first column.
 #-q <N (INTEGER)>, only with '-g', divides the '-i' gene list into N sublists and compares them to the '-h' gene list.
+#-f <png|svg|pdf|tsv>, saves the plot (histogram of distances to TSS, or Venn diagram with '-g') to 'common_genes_tssHistogram.<format>' or 'venn.<format>' instead of displaying it, 'tsv' writes the plotted counts only.
 #
 #Examples:
 # Compares a gene list to a homer annotation file:
@@ -28,15 +29,16 @@ Created on 11 mai 2015
 
 import sys
 import getopt
-import pylab as P
-from matplotlib_venn import venn2
 import math
+import bisect
+import plotFiles
+import mapCache
 
-progHelp = "Compares a gene list to a homer annotatePeaks.py output and finds common genes.\nArguments:\n-i <genes.txt>, gene list with two tab separated fields per line (ENSEMBL Gene ID, gene common name).\n-h <homerOut.tsv>, annotated file from homer with ensembl transcriptID as reference.\n-e <biomartOut.tsv>, biomart output for your ensembl release and organism (two columns: geneID, transcriptID). If -g, first column has to be geneID then other fields are optional.\n Optional:\n-b true, if your '-i' file is also a homer annotation file.\n-g true, if your '-h' file is also a list with gene IDs in the first column.\n-q <N (INTEGER)>, only with '-g', divides the '-i' gene list into N sublists and compares them to the '-h' gene list.\n\nExamples:\nCompares a gene list to a homer annotation file:\npython compareGeneLists.py -i siSOX10_upreg_genes.txt -h chip_sox10_peaks_annotations.xls -e mart_export_hg19_release80.tsv\nCompares two annotation files:\npython compareGeneLists.py -i chip_sox10_peaks_annotations.xls -h chip_mitf_peaks_annotations.xls -e mart_export_hg19_release80.tsv -b true\nCompares two gene lists:\npython compareGeneLists.py -i siSOX10_upreg_genes.txt -h siMITF_upreg_genes.txt -e mart_export_hg19_release80.tsv -g true"
+progHelp = "Compares a gene list to a homer annotatePeaks.py output and finds common genes.\nArguments:\n-i <genes.txt>, gene list with two tab separated fields per line (ENSEMBL Gene ID, gene common name).\n-h <homerOut.tsv>, annotated file from homer with ensembl transcriptID as reference.\n-e <biomartOut.tsv>, biomart output for your ensembl release and organism (two columns: geneID, transcriptID). If -g, first column has to be geneID then other fields are optional.\n Optional:\n-b true, if your '-i' file is also a homer annotation file.\n-g true, if your '-h' file is also a list with gene IDs in the first column.\n-q <N (INTEGER)>, only with '-g', divides the '-i' gene list into N sublists and compares them to the '-h' gene list.\n-f <png|svg|pdf|tsv>, saves the plot (histogram of distances to TSS, or Venn diagram with '-g') to 'common_genes_tssHistogram.<format>' or 'venn.<format>' instead of displaying it, 'tsv' writes the plotted counts only.\n\nExamples:\nCompares a gene list to a homer annotation file:\npython compareGeneLists.py -i siSOX10_upreg_genes.txt -h chip_sox10_peaks_annotations.xls -e mart_export_hg19_release80.tsv\nCompares two annotation files:\npython compareGeneLists.py -i chip_sox10_peaks_annotations.xls -h chip_mitf_peaks_annotations.xls -e mart_export_hg19_release80.tsv -b true\nCompares two gene lists:\npython compareGeneLists.py -i siSOX10_upreg_genes.txt -h siMITF_upreg_genes.txt -e mart_export_hg19_release80.tsv -g true"
 
 def get_params(argv):
     try:
-        opts, args = getopt.getopt(argv, "i:h:e:b:g:q:", ["infilename", "homerFile", "ensemblFile", "bothHomer"])
+        opts, args = getopt.getopt(argv, "i:h:e:b:g:q:f:", ["infilename", "homerFile", "ensemblFile", "bothHomer"])
     except getopt.GetoptError:
         sys.exit("Invalid argument:\n"+progHelp)
     infilename = "none"
@@ -45,6 +47,7 @@ def get_params(argv):
     bothHomer = False
     bothLists = False
     quantiles = "none"
+    outFormat = "show"
     for opt,arg in opts:
         if opt =='-i':
             infilename = arg
@@ -58,7 +61,11 @@ def get_params(argv):
             bothLists = True
         if opt == '-q':
             quantiles = int(arg)     
-    return infilename, homerFile, ensemblFile, bothHomer, bothLists, quantiles
+        if opt == '-f':
+            outFormat = str(arg).lower().strip()
+            if not outFormat in plotFiles.OUTPUT_FORMATS:
+                sys.exit("Invalid format '"+arg+"':\n"+progHelp)
+    return infilename, homerFile, ensemblFile, bothHomer, bothLists, quantiles, outFormat
 
 def getHomerDictionary(homerFile, ensemblTransToGeneMap):
     homerDic = {}
@@ -124,15 +131,17 @@ def writeList(inList, outName, nameMap = "none"):
     outFile.flush()
     outFile.close()
     
-def getEnsemblTransToGeneMap(ensemblFile):
-    eFile = open(ensemblFile,"r")
-    geneMap = {}
+# yields (transcript ID, gene ID)
+def getTransToGeneEntries(ensemblFile):
+    eFile = open(ensemblFile,"r", 1048576)
     for line in eFile:
-        geneID = str(line).split("\t")[0].upper().strip()
-        transID = str(line).split("\t")[1].upper().strip()
-        geneMap[transID] = geneID
-    eFile.flush()
+        fields = str(line).split("\t")
+        yield fields[1].upper().strip(), fields[0].upper().strip()
     eFile.close()
+
+# compiled once into '<biomartOut.tsv>.transToGene.cache' (see mapCache.py)
+def getEnsemblTransToGeneMap(ensemblFile):
+    geneMap = mapCache.getCachedMap(ensemblFile, "transToGene", getTransToGeneEntries)
     print "Reading biomart output '"+str(ensemblFile)+"': "+str(len(geneMap))+" transcripts."
     return geneMap
 
@@ -143,14 +152,29 @@ def getDistanceList(commonGenesList, distanceMap):
         distanceList.append(int(distance))
     return distanceList
 
-def histDistances(commonGenesList, distanceMap):
+# returns the number of distances in each bin (the last bin includes its upper edge, as in pylab.hist)
+def getBinCounts(distanceList, dbin):
+    binCounts = [0 for i in xrange(len(dbin)-1)]
+    for distance in distanceList:
+        if distance < dbin[0] or distance > dbin[-1]:
+            continue
+        binIndex = min(bisect.bisect_right(dbin, distance)-1, len(binCounts)-1)
+        binCounts[binIndex] = binCounts[binIndex]+1
+    return binCounts
+
+def histDistances(commonGenesList, distanceMap, outFormat = "show"):
     distanceList = getDistanceList(commonGenesList, distanceMap)
     dbin = [-12000,-10000,-8000,-6000,-4000,-2000,0, 2000, 4000,6000,8000,10000,12000]
+    if outFormat == "tsv":
+        binCounts = getBinCounts(distanceList, dbin)
+        plotFiles.writeCounts("common_genes_tssHistogram", ["#Bin start", "Bin end", "Count"], [[dbin[i], dbin[i+1], binCounts[i]] for i in xrange(len(binCounts))])
+        return
+    P = plotFiles.getPyplot(outFormat)
     P.hist(distanceList, bins=dbin, color = 'blue')
     P.xlabel('Distance to TSS (pb)')
     P.ylabel('Count')
     P.xticks(dbin)
-    P.show()
+    plotFiles.showPlot(P, "common_genes_tssHistogram", outFormat)
  
 def compareGeneMaps(geneMap, refGeneMap):
     commonGenes = []
@@ -176,16 +200,18 @@ def getGeneMap(infilename, ensemblTransToGeneMap):
     print "Reading homer output '"+str(infilename)+"': "+str(len(geneMap))+" genes."
     return geneMap
 
-def getEnsemblMap(ensemblFile):
-    eFile = open(ensemblFile,"r")
-    geneMap = {}
+# yields (gene ID, line)
+def getGeneLineEntries(ensemblFile):
+    eFile = open(ensemblFile,"r", 1048576)
     for line in eFile:
         if str(line).isspace():
             continue
-        geneID = str(line).split("\t")[0].upper().strip()
-        geneMap[geneID] = line
-    eFile.flush()
+        yield str(line).split("\t")[0].upper().strip(), line
     eFile.close()
+
+# compiled once into '<biomartOut.tsv>.geneLines.cache' (see mapCache.py)
+def getEnsemblMap(ensemblFile):
+    geneMap = mapCache.getCachedMap(ensemblFile, "geneLines", getGeneLineEntries)
     print "Reading biomart output '"+str(ensemblFile)+"': "+str(len(geneMap))+" genes."
     return geneMap
 
@@ -240,10 +266,16 @@ def writeLines(inList, outName, lineMap):
     oFile.close()
     print "Writing '"+outName+"': "+str(len(inList))+" lines."
  
-def drawVennDiagram(list1, list2):
+def drawVennDiagram(list1, list2, outFormat = "show"):
+    set1, set2 = set(list1), set(list2)
+    if outFormat == "tsv":
+        plotFiles.writeCounts("venn", ["#list1 only", "list2 only", "common"], [[len(set1-set2), len(set2-set1), len(set1 & set2)]])
+        return
     print "Displaying Venn Diagram ..."
-    venn2([set(list1), set(list2)], ('list1', 'list2'))
-    P.show()
+    P = plotFiles.getPyplot(outFormat)
+    from matplotlib_venn import venn2
+    venn2([set1, set2], ('list1', 'list2'))
+    plotFiles.showPlot(P, "venn", outFormat)
     
 def divideIntoSublists(inputList, subListNumber):
     incr = int(math.ceil(float(len(inputList))/subListNumber))
@@ -256,7 +288,7 @@ def divideIntoSublists(inputList, subListNumber):
     return sublists
                                   
 if __name__ == '__main__':
-    infilename, homerFile, ensemblFile, bothHomer, bothLists, quantiles = get_params(sys.argv[1:])
+    infilename, homerFile, ensemblFile, bothHomer, bothLists, quantiles, outFormat = get_params(sys.argv[1:])
     if infilename == "none" or homerFile == "none" or ensemblFile == "none":
         sys.exit(progHelp)
     if bothHomer == False and bothLists == False:   
@@ -266,7 +298,7 @@ if __name__ == '__main__':
         commonGenesList, peakList = getCommonGenesList(refList, homerDic)
         writeList(commonGenesList, "common_genes.txt", geneIDToNameMap)
         writeList(peakList,"common_genes_reference_sequences.txt")
-        histDistances(commonGenesList, distanceMap)
+        histDistances(commonGenesList, distanceMap, outFormat)
     elif bothHomer == True and bothLists == False:
         ensemblMap = getEnsemblTransToGeneMap(ensemblFile)
         geneMap = getGeneMap(infilename, ensemblMap)
@@ -281,7 +313,7 @@ if __name__ == '__main__':
         writeLines(commonGenes, "common_genes.txt",ensemblMap)
         writeLines(uniqueL1, infilename.split(".")[0]+"_unique.txt", ensemblMap)
         writeLines(uniqueL2, homerFile.split(".")[0]+"_unique.txt", ensemblMap)
-        drawVennDiagram(list1, list2)
+        drawVennDiagram(list1, list2, outFormat)
         if not quantiles == "none":
             print "Dividing '"+infilename+"' into "+str(quantiles)+" quantiles."
             sublists = divideIntoSublists(list1, quantiles)
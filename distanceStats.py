@@ -0,0 +1,72 @@
+'''
+Distance to TSS statistics used by getFromAnnotations.py.
+'''
+
+# Distances are added by chunks (NumPy arrays) to fixed-size histograms, so that any number of annotation lines
+# (or concatenated annotation files) can be summarized without keeping the distances.
+# Requires:
+# -numpy: http://www.numpy.org/
+# Histograms (dictionary keys):
+# 'histogram': 1kb bins from -30kb to +30kb, 'tss': base pair resolution from -250 to +249, 'user': user-defined bin edges,
+# 'quantile': 10bp bins from -1Mb to +1Mb (first and last bins hold the distances outside), used for the quantiles,
+# 'farNegative', 'farPositive': log-spaced bins (1% wide) of the distances beyond -1Mb and +1Mb, so that quantiles in the tails
+# (peaks on gene-poor chromosomes) are approximated too.
+
+import numpy as np
+
+HIST_BINS = range(-30000,30001,1000)
+TSS_RANGE = 250
+QUANTILE_RANGE = 1000000
+QUANTILE_BIN = 10
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+FAR_RATIO = 1.01
+# up to 10Gb from the TSS
+FAR_BINS = int(np.ceil(np.log(10000000000.0/QUANTILE_RANGE)/np.log(FAR_RATIO)))
+
+def getDistanceStats(userBins = None):
+    stats = {"histogram": np.zeros(len(HIST_BINS)-1, dtype=np.int64), "tss": np.zeros(2*TSS_RANGE, dtype=np.int64), "quantile": np.zeros((2*QUANTILE_RANGE)/QUANTILE_BIN+2, dtype=np.int64), "farNegative": np.zeros(FAR_BINS, dtype=np.int64), "farPositive": np.zeros(FAR_BINS, dtype=np.int64), "count": 0, "min": None, "max": None, "userBins": userBins}
+    if userBins is not None:
+        stats["user"] = np.zeros(len(userBins)-1, dtype=np.int64)
+    return stats
+
+# distances: integer array, bins include their lower edge (the last bin of 'histogram' and 'user' also includes its upper edge, as in pylab.hist)
+def addDistances(stats, distances):
+    if len(distances) == 0:
+        return
+    stats["histogram"] += np.histogram(distances, HIST_BINS)[0]
+    if stats["userBins"] is not None:
+        stats["user"] += np.histogram(distances, stats["userBins"])[0]
+    tss = distances[(distances >= -TSS_RANGE) & (distances < TSS_RANGE)]
+    stats["tss"] += np.bincount(tss+TSS_RANGE, minlength=2*TSS_RANGE)
+    quantileBins = np.clip((distances+QUANTILE_RANGE)//QUANTILE_BIN+1, 0, len(stats["quantile"])-1)
+    stats["quantile"] += np.bincount(quantileBins, minlength=len(stats["quantile"]))
+    for farKey, farDistances in (("farNegative", -distances[quantileBins == 0]), ("farPositive", distances[quantileBins == len(stats["quantile"])-1])):
+        if len(farDistances) > 0:
+            stats[farKey] += np.bincount(getFarBins(farDistances), minlength=FAR_BINS)
+    stats["count"] = stats["count"]+len(distances)
+    if stats["min"] is None:
+        stats["min"], stats["max"] = int(distances.min()), int(distances.max())
+    else:
+        stats["min"], stats["max"] = min(stats["min"], int(distances.min())), max(stats["max"], int(distances.max()))
+
+# distances: absolute distances beyond 1Mb
+def getFarBins(distances):
+    return np.clip(np.floor(np.log(distances/float(QUANTILE_RANGE))/np.log(FAR_RATIO)).astype(np.int64), 0, FAR_BINS-1)
+
+# returns (quantile, distance) pairs, distances are approximated by the middle of their bin: 10bp within 1Mb of the TSS, 1% of the distance beyond
+def getQuantiles(stats, quantiles = QUANTILES):
+    if stats["count"] == 0:
+        return []
+    farValues = QUANTILE_RANGE*FAR_RATIO**(np.arange(FAR_BINS)+0.5)
+    nearValues = -QUANTILE_RANGE+np.arange(len(stats["quantile"])-2)*QUANTILE_BIN+QUANTILE_BIN/2
+    # bins from the most negative distance to the most positive one
+    counts = np.concatenate((stats["farNegative"][::-1], stats["quantile"][1:-1], stats["farPositive"]))
+    binValues = np.concatenate((-farValues[::-1], nearValues, farValues))
+    cumulative = np.cumsum(counts)
+    values = []
+    for quantile in quantiles:
+        binIndex = int(np.searchsorted(cumulative, max(1, int(np.ceil(quantile*stats["count"])))))
+        value = int(round(binValues[binIndex]))
+        value = min(max(value, stats["min"]), stats["max"])
+        values.append((quantile, value))
+    return values
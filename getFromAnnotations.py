@@ -6,36 +6,43 @@ Created on 5 juin 2015
 
 # Allows operations on homer 'annotatePeaks.pl' output file.
 # Requires:
-# -pylab module from package matplotlib (http://matplotlib.org/)
+# -matplotlib (http://matplotlib.org/), only imported for displayed or saved plots ('-h', '-p'), see plotFiles.py
 # Arguments:
 # -i <homer_annotation.txt>, homer output file.
 # Options:
-# -h <histogram title>, makes a histogram of distances to nearest TSS.
+# -h <histogram title>, makes a histogram of distances to nearest TSS (1kb bins from -30kb to 30kb, and a plot at base pair resolution from -250 to 250) and prints distance quantiles. Requires numpy (http://www.numpy.org/).
 # -p <piechart title>, makes a chart summarizing annotations (number of peaks annotated as 'promoter-TSS', 'exon, 'intron' ect...).
-# -r <keyword>, retrieves lines annotated as the keyword (<promoter-tss>, <exon>, <intron>, <TTS>, <intergenic>, <non-coding>, <3'UTR>, <5'UTR>)
+# -r <keyword>, retrieves lines annotated as the keyword (<promoter-tss>, <exon>, <intron>, <TTS>, <intergenic>, <non-coding>, <3'UTR>, <5'UTR>). Several keywords can be given (repeated '-r' or comma-separated), each one is written to its own file in the same pass.
 # -b <biomart_export.txt>, completes annotation with a biomart output file containing the following fields (in that order): transcript ID, gene ID, gene name, description. Adds these three fields to the homer file.
-# -l <peaks.txt>, retrieves lines corresponding to a list of peaks.
+# -l <peaks.txt>, retrieves lines corresponding to a list of peaks. Can be repeated: each list is written to 'foundLines_<peaks>.txt' in the same pass.
+# -d <bin edges>, with '-h', also makes a histogram of distances to nearest TSS with these comma-separated bin edges (e.g. -d -5000,-1000,0,1000,5000).
+# -f <png|svg|pdf|tsv>, saves the plots to '<homer_annotation>_<plot>.<format>' files (rendered in parallel, without display) instead of displaying them, 'tsv' writes the plotted counts only.
 #
 #Examples:
 # Makes a chart and a histogram summarizing annotations:
 #python getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -h 'MITF distances to nearest TSS' -p 'MITF Annotations'
+# Saves them as PDF files:
+#python getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -h 'MITF distances to nearest TSS' -p 'MITF Annotations' -f pdf
 # Adds ENSEMBL gene IDs, gene names and descriptions:
 #python getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -b mart_export_hg19_release69.tsv
 # Retrieves lines corresponding to TSS:
 #python getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -r 'promoter-tss'
+# Splits the file by annotation:
+#python getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -r "promoter-tss,exon,intron,tts,intergenic,non-coding,3',5'"
 # Retrieves lines corresponding to a list of peaks:
 #python getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -l mitf_sox_commonpeaks.txt
   
 import sys
+import os
 import getopt
-import pylab as P
-import matplotlib.pyplot as plt
+import plotFiles
+import mapCache
 
-progHelp = "Allows operations on homer 'annotatePeaks.pl' output file.\nRequires:\n -pylab module from package matplotlib (http://matplotlib.org/)\nArguments:\n -i <homer_annotation.txt>, homer output file.\nOptions:\n -h <histogram title>, makes a histogram of distances to nearest TSS.\n -p <piechart title>, makes a chart summarizing annotations (number of peaks annotated as 'promoter-TSS', 'exon, 'intron' ect...).\n -r <keyword>, retrieves lines annotated as the keyword (<promoter-tss>, <exon>, <intron>, <TTS>, <intergenic>, <non-coding>, <3'UTR>, <5'UTR>).\n -b <biomart_export.txt>, completes annotation with a biomart output file containing the following fields (in that order): transcript ID, gene ID, gene name, description. Adds these three fields to the homer file.\n-l <peaks.txt>, retrieves lines corresponding to a list of peaks.\n\nExamples:\nMakes a chart and a histogram summarizing annotations:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -h 'MITF distances to nearest TSS' -p 'MITF Annotations'\nAdds ENSEMBL gene IDs, gene names and descriptions:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -b mart_export_hg19_release69.tsv\nRetrieves lines corresponding to TSS:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -r 'promoter-tss'\nRetrieves lines corresponding to a list of peaks:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -l mitf_sox_commonpeaks.txt"
+progHelp = "Allows operations on homer 'annotatePeaks.pl' output file.\nRequires:\n -matplotlib (http://matplotlib.org/), only imported for displayed or saved plots ('-h', '-p'), see plotFiles.py\nArguments:\n -i <homer_annotation.txt>, homer output file.\nOptions:\n -h <histogram title>, makes a histogram of distances to nearest TSS (1kb bins from -30kb to 30kb, and a plot at base pair resolution from -250 to 250) and prints distance quantiles. Requires numpy (http://www.numpy.org/).\n -p <piechart title>, makes a chart summarizing annotations (number of peaks annotated as 'promoter-TSS', 'exon, 'intron' ect...).\n -r <keyword>, retrieves lines annotated as the keyword (<promoter-tss>, <exon>, <intron>, <TTS>, <intergenic>, <non-coding>, <3'UTR>, <5'UTR>). Several keywords can be given (repeated '-r' or comma-separated), each one is written to its own file in the same pass.\n -b <biomart_export.txt>, completes annotation with a biomart output file containing the following fields (in that order): transcript ID, gene ID, gene name, description. Adds these three fields to the homer file.\n-l <peaks.txt>, retrieves lines corresponding to a list of peaks. Can be repeated: each list is written to 'foundLines_<peaks>.txt' in the same pass.\n-d <bin edges>, with '-h', also makes a histogram of distances to nearest TSS with these comma-separated bin edges (e.g. -d -5000,-1000,0,1000,5000).\n-f <png|svg|pdf|tsv>, saves the plots to '<homer_annotation>_<plot>.<format>' files (rendered in parallel, without display) instead of displaying them, 'tsv' writes the plotted counts only.\n\nExamples:\nMakes a chart and a histogram summarizing annotations:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -h 'MITF distances to nearest TSS' -p 'MITF Annotations'\nSaves them as PDF files:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -h 'MITF distances to nearest TSS' -p 'MITF Annotations' -f pdf\nAdds ENSEMBL gene IDs, gene names and descriptions:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -b mart_export_hg19_release69.tsv\nRetrieves lines corresponding to TSS:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -r 'promoter-tss'\nSplits the file by annotation:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -r \"promoter-tss,exon,intron,tts,intergenic,non-coding,3',5'\"\nRetrieves lines corresponding to a list of peaks:\npython getFromAnnotations.py -i chip_mitf_peaks_annotations.xls -l mitf_sox_commonpeaks.txt"
 
 def get_params(argv):
     try:
-        opts, args  = getopt.getopt(argv, "i:h:p:r:b:l:", ["infile"])
+        opts, args  = getopt.getopt(argv, "i:h:p:r:b:l:f:d:", ["infile"])
     except getopt.GetoptError:
         sys.exit("Invalid argument:\n"+progHelp)
     infilename = "none"
@@ -44,10 +51,12 @@ def get_params(argv):
     plotLoc = False
     chartTitle = "pieChart"
     histTitle = "histogram"
-    typeToRetrieve = "none"
+    typesToRetrieve = []
     biomartFile = "none"
     completeFile = False
-    peakListFile = "none"
+    peakListFiles = []
+    outFormat = "show"
+    userBins = None
     for opt,arg in opts:
         if opt =='-i':
             infilename = arg
@@ -62,7 +71,9 @@ def get_params(argv):
             plotLoc = True
             chartTitle = arg
         if opt == '-r':
-            typeToRetrieve = str(arg).lower().strip()
+            for typeToRetrieve in str(arg).lower().split(","):
+                if typeToRetrieve.strip() != "" and not typeToRetrieve.strip() in typesToRetrieve:
+                    typesToRetrieve.append(typeToRetrieve.strip())
             queryType = "retrieveLines"
         if opt == "-b":
             biomartFile = arg
@@ -70,69 +81,124 @@ def get_params(argv):
             if queryType == "none":
                 queryType = "biomart" 
         if opt == "-l":
-            peakListFile = arg
+            peakListFiles.append(arg)
             if queryType == "none":
                 queryType = "peakList"
+        if opt == "-f":
+            outFormat = str(arg).lower().strip()
+            if not outFormat in plotFiles.OUTPUT_FORMATS:
+                sys.exit("Invalid format '"+arg+"':\n"+progHelp)
+        if opt == "-d":
+            userBins = sorted(set([int(edge) for edge in str(arg).split(",") if edge.strip() != ""]))
+            if len(userBins) < 2:
+                sys.exit("Invalid bin edges '"+arg+"':\n"+progHelp)
                            
-    return infilename, queryType, plotDist, plotLoc, chartTitle, histTitle, typeToRetrieve, biomartFile, completeFile, peakListFile
+    return infilename, queryType, plotDist, plotLoc, chartTitle, histTitle, typesToRetrieve, biomartFile, completeFile, peakListFiles, outFormat, userBins
 
-def getAnnotationList(annotationFile):
-    aFile = open(annotationFile, "r")
-    annList = []
+# Each operation is a pair of functions (addLine, finish): addLine(line, fields, first) is called on every line of the annotation file
+# during a single pass (fields: the line split once, first: True for the header line), finish() writes or displays the result.
+
+# returns the functions writing lines to outName as they come
+def getLineWriter(outName):
+    outFile = open(outName, "w", 1048576)
+    lineCount = [0]
+    def writeLine(line):
+        outFile.write(line)
+        lineCount[0] = lineCount[0]+1
+    def close():
+        print "Writing file '"+str(outName)+"': "+str(lineCount[0])+" lines."
+        outFile.flush()
+        outFile.close()
+    return writeLine, close
+
+def processAnnotations(annotationFile, operations):
+    aFile = open(annotationFile, "r", 1048576)
+    lineCount = 0
+    first = True
     for line in aFile:
-        annList.append(line)
-    aFile.flush()
+        fields = line.split("\t")
+        for addLine, finish in operations:
+            addLine(line, fields, first)
+        first = False
+        lineCount = lineCount+1
     aFile.close()
-    print "Reading homer annotation file '"+str(annotationFile)+"': "+str(len(annList))+" lines."
-    return annList
+    print "Reading homer annotation file '"+str(annotationFile)+"': "+str(lineCount)+" lines."
+    for addLine, finish in operations:
+        finish()
 
-def getDistanceList(annotationList):
-    distances = []
-    countMap = {}
-    for annotation in annotationList:
-        if str(annotation).startswith("Peak"):
-            continue
-        distance = int(annotation.split("\t")[9])
-        distances.append(distance)
-        if distance in countMap:
-            countMap[distance]=countMap[distance]+1
-        else:
-            countMap[distance] = 1
-    return distances, countMap
+# number of distances parsed before they are added to the histograms
+DISTANCE_CHUNK_SIZE = 1000000
 
-def histDistances(distanceList, hisTitle):
+# distances are added to the histograms of distanceStats.py by chunks, the plots are added to plotTasks (see plotFiles.py)
+def getDistanceOperation(histTitle, userBins, plotTasks, outName, outFormat):
+    import numpy as np
+    import distanceStats
+    stats = distanceStats.getDistanceStats(userBins)
+    chunk = []
+    def addLine(line, fields, first):
+        if line.startswith("Peak"):
+            return
+        chunk.append(int(fields[9]))
+        if len(chunk) == DISTANCE_CHUNK_SIZE:
+            distanceStats.addDistances(stats, np.array(chunk, dtype=np.int64))
+            del chunk[:]
+    def finish():
+        distanceStats.addDistances(stats, np.array(chunk, dtype=np.int64))
+        del chunk[:]
+        quantiles = distanceStats.getQuantiles(stats)
+        print "Distances to TSS: "+str(stats["count"])+" peaks, quantiles: "+", ".join([str(int(quantile*100))+"%: "+str(value) for quantile, value in quantiles])+"."
+        if outFormat == "tsv":
+            plotFiles.writeCounts(outName+"_tssQuantiles", ["#Quantile", "Distance to TSS"], quantiles)
+        plotTasks.append((histDistances, (distanceStats.HIST_BINS, stats["histogram"].tolist(), histTitle, outName+"_tssHistogram", outFormat)))
+        plotTasks.append((plotDistances, (stats["tss"].tolist(), outName+"_tssPlot", outFormat)))
+        if userBins is not None:
+            plotTasks.append((histDistances, (userBins, stats["user"].tolist(), histTitle, outName+"_tssBins", outFormat)))
+    return addLine, finish
+
+def histDistances(dbin, binCounts, hisTitle, outName, outFormat):
+    if outFormat == "tsv":
+        plotFiles.writeCounts(outName, ["#Bin start", "Bin end", "Count"], [[dbin[i], dbin[i+1], binCounts[i]] for i in xrange(len(binCounts))])
+        return
     print "Displaying histogram 'distances from nearest TSS' ..."
-    dbin = range(-30000,30001,1000)
-    P.hist(distanceList, bins=dbin, color = ['blue'])
+    P = plotFiles.getPyplot(outFormat)
+    P.hist(dbin[:-1], bins=dbin, weights=binCounts, color = ['blue'])
     P.xlabel('Distance to TSS (pb)')
     P.ylabel('Count')
-    P.xticks(range(-30000,30001,10000))
+    if dbin == range(-30000,30001,1000):
+        P.xticks(range(-30000,30001,10000))
     P.title(hisTitle, bbox={'facecolor':'0.8', 'pad':5})
-    P.show()
+    plotFiles.showPlot(P, outName, outFormat)
 
     
     
-def getPieChartMap(annotationList):
+def getLocationKey(location):
+    if location.startswith("3'"):
+        return "3'UTR"
+    elif location.startswith("5'"):
+        return "5'UTR"
+    elif location.startswith("exon"):
+        return "Exon"
+    elif location.startswith("Intergenic"):
+        return "Intergenic"
+    elif location.startswith("intron"):
+        return "Intron"
+    elif location.startswith("promoter"):
+        return "promoter-TSS"
+    elif location.startswith("TTS"):
+        return "TTS"
+    elif location.startswith("non-coding"):
+        return "non-coding"
+    return None
+
+def getPieChartOperation(chartTitle, plotTasks, outName, outFormat):
     countMap = {"3'UTR": 0, "5'UTR": 0, "Exon":0, "Intergenic": 0, "Intron": 0, "promoter-TSS": 0, "TTS": 0, "non-coding": 0}
-    for ann in annotationList:
-        location = str(str(ann).split("\t")[7])
-        if location.startswith("3'"):
-            countMap["3'UTR"] = countMap["3'UTR"]+1
-        elif location.startswith("5'"):
-            countMap["5'UTR"] = countMap["5'UTR"]+1
-        elif location.startswith("exon"):
-            countMap["Exon"] = countMap["Exon"]+1
-        elif location.startswith("Intergenic"):
-            countMap["Intergenic"] = countMap["Intergenic"]+1
-        elif location.startswith("intron"):
-            countMap["Intron"] = countMap["Intron"]+1
-        elif location.startswith("promoter"):
-            countMap["promoter-TSS"] = countMap["promoter-TSS"]+1
-        elif location.startswith("TTS"):
-            countMap["TTS"] = countMap["TTS"]+1
-        elif location.startswith("non-coding"):
-            countMap["non-coding"] = countMap["non-coding"]+1     
-    return countMap
+    def addLine(line, fields, first):
+        key = getLocationKey(fields[7])
+        if key is not None:
+            countMap[key] = countMap[key]+1
+    def finish():
+        plotTasks.append((pieChart, (countMap, chartTitle, outName+"_annotations", outFormat)))
+    return addLine, finish
 
 def getSumFromMap(aMap):
     total = 0
@@ -141,12 +207,16 @@ def getSumFromMap(aMap):
         total = int(total+val)
     return total
     
-def pieChart(pieChartMap, chartTitle):
+def pieChart(pieChartMap, chartTitle, outName, outFormat):
+    total = getSumFromMap(pieChartMap)
+    if outFormat == "tsv":
+        plotFiles.writeCounts(outName, ["#Annotation", "Count", "Percentage"], [[key, pieChartMap[key], "{:.2f}".format((float(pieChartMap[key])/total)*100)] for key in pieChartMap.keys()])
+        return
     print "Displaying Annotation Chart ..."
+    P = plotFiles.getPyplot(outFormat)
     P.figure(1, figsize=(15,15))
     labels = []
     fracs = []
-    total = getSumFromMap(pieChartMap)
     colors = ['yellowgreen', 'gold', 'lightskyblue', 'cyan', 'lightcoral', 'lightgreen', 'gray', 'pink']
     for key in pieChartMap.keys():
         count = pieChartMap[key]
@@ -158,48 +228,69 @@ def pieChart(pieChartMap, chartTitle):
     P.pie(fracs,colors=colors, autopct='%1.1f%%', shadow=False, startangle=90)
     P.title(chartTitle, bbox={'facecolor':'0.8', 'pad':5})
     P.legend(labels, bbox_to_anchor=(1, 1))
-    P.show()
+    plotFiles.showPlot(P, outName, outFormat)
 
-def getLinesFromType(annotationList, typeToRetrieve):
-    rLines = []
-    rLines.append(annotationList[0])
-    for ann in annotationList:
-        location = str(str(ann).split("\t")[7]).lower().strip()
-        if location.startswith(typeToRetrieve):
-            rLines.append(ann)
-    print "Looking for lines with annotation '"+typeToRetrieve+"': "+str(len(rLines))+" lines found."
-    return rLines
+# one file per keyword, the header line is kept in each
+def getTypeOperation(typesToRetrieve):
+    writers = [getLineWriter("retrievedAnnotations_"+typeToRetrieve+".xls") for typeToRetrieve in typesToRetrieve]
+    foundCounts = [0 for typeToRetrieve in typesToRetrieve]
+    def addLine(line, fields, first):
+        if first == True:
+            for writeLine, close in writers:
+                writeLine(line)
+        location = fields[7].lower().strip()
+        for i in xrange(len(typesToRetrieve)):
+            if location.startswith(typesToRetrieve[i]):
+                writers[i][0](line)
+                foundCounts[i] = foundCounts[i]+1
+    def finish():
+        for i in xrange(len(typesToRetrieve)):
+            print "Looking for lines with annotation '"+typesToRetrieve[i]+"': "+str(foundCounts[i]+1)+" lines found."
+            writers[i][1]()
+    return addLine, finish
 
-def getLinesFromPeaks(annotationList, peakList):
-    rLines = []
-    for ann in annotationList:
-        peakID = str(ann).split("\t")[0].upper().strip()
-        if peakID in peakList:
-            rLines.append(ann)
-    return rLines
+def getPeakListOutNames(peakListFiles):
+    if len(peakListFiles) == 1:
+        return ["foundLines.txt"]
+    return ["foundLines_"+os.path.splitext(os.path.basename(peakListFile))[0]+".txt" for peakListFile in peakListFiles]
 
-def getEnsemblMap(biomartFile):
-    bFile = open(biomartFile, "r")
-    ensemblMap = {}
+# each line is routed with one lookup to the files of all the lists containing its peak
+def getPeakListOperation(peakSets, outNames):
+    writers = [getLineWriter(outName) for outName in outNames]
+    peakWriters = {}
+    for peakSet, writer in zip(peakSets, writers):
+        for peakID in peakSet:
+            if not peakID in peakWriters:
+                peakWriters[peakID] = []
+            peakWriters[peakID].append(writer[0])
+    def addLine(line, fields, first):
+        lineWriters = peakWriters.get(fields[0].upper().strip())
+        if lineWriters is not None:
+            for writeLine in lineWriters:
+                writeLine(line)
+    def finish():
+        for writeLine, close in writers:
+            close()
+    return addLine, finish
+
+# yields (transcript ID, gene ID + gene name + description)
+def getEnsemblEntries(biomartFile):
+    bFile = open(biomartFile, "r", 1048576)
     for line in bFile:
-        transID = str(line).split("\t")[0].strip().upper()
-        geneID = str(line).split("\t")[1]
-        geneName = str(line).split("\t")[2]
-        geneDesc = str(line).split("\t")[3].strip()
-        ensemblMap[transID] = geneID+"\t"+geneName+"\t"+geneDesc
-    print "Reading biomart file '"+str(biomartFile)+"': "+str(len(ensemblMap))+" transcripts."
-    bFile.flush()
+        fields = str(line).split("\t")
+        transID = fields[0].strip().upper()
+        geneID = fields[1]
+        geneName = fields[2]
+        geneDesc = fields[3].strip()
+        yield transID, geneID+"\t"+geneName+"\t"+geneDesc
     bFile.close()
+
+# compiled once into '<biomart_export.txt>.transcriptGenes.cache' (see mapCache.py)
+def getEnsemblMap(biomartFile):
+    ensemblMap = mapCache.getCachedMap(biomartFile, "transcriptGenes", getEnsemblEntries)
+    print "Reading biomart file '"+str(biomartFile)+"': "+str(len(ensemblMap))+" transcripts."
     return ensemblMap
     
-def writeList(inList, outName):
-    outFile = open(outName, "w")
-    for elem in inList:
-        outFile.write(str(elem))
-    print "Writing file '"+str(outName)+"': "+str(len(inList))+" lines."
-    outFile.flush()
-    outFile.close()
-    
 def fillLine(line, featureNumber):
     fieldsToAdd = int(featureNumber-len(line.split("\t")))
     filledLine = line
@@ -208,78 +299,78 @@ def fillLine(line, featureNumber):
         fieldsToAdd = fieldsToAdd -1
     return filledLine
 
-def completeAnnotations(annotationList, ensemblMap):
-    detailedLines = []
-    firstLine = True
-    for line in annotationList:
-        if firstLine == True:
-            firstline = str(line).strip()+"\tGene ID\tGene Name\tGene Description\n"
-            detailedLines.append(firstline)
-            featureNumber = len(line.split("\t"))
-            firstLine = False
-            continue
-        transID = str(line).split("\t")[10].upper().strip()
+# adds the biomart gene ID, name and description of the nearest transcript to each line
+def getBiomartOperation(ensemblMap, outName):
+    writeLine, close = getLineWriter(outName)
+    featureNumber = [0]
+    def addLine(line, fields, first):
+        if first == True:
+            writeLine(str(line).strip()+"\tGene ID\tGene Name\tGene Description\n")
+            featureNumber[0] = len(fields)
+            return
+        transID = fields[10].upper().strip()
         addedAnnotations = "NA"
         if transID in ensemblMap:
             addedAnnotations = ensemblMap[transID]
         else:
             print "ID not found in biomart file: "+str(transID)+" !"
         newline = str(line).strip()
-        newline = fillLine(newline, featureNumber)
-        newline = newline+"\t"+addedAnnotations+"\n"
-        detailedLines.append(newline)
-    return detailedLines
+        newline = fillLine(newline, featureNumber[0])
+        writeLine(newline+"\t"+addedAnnotations+"\n")
+    return addLine, close
 
-def getIDList(fileName):
+def getIDSet(fileName):
     iFile = open(fileName, "r")
-    idList = []
+    idSet = set()
     for line in iFile:
         if str(line).isspace():
             continue
         peakID = str(line).split("\t")[3].upper().strip()
-        idList.append(peakID)
+        idSet.add(peakID)
     iFile.flush()
     iFile.close()
-    print "Reading peak list '"+str(fileName)+"': "+str(len(idList))+" IDs."
-    return idList
+    print "Reading peak list '"+str(fileName)+"': "+str(len(idSet))+" IDs."
+    return idSet
 
-def plotDistances(countMap):
+# tssCounts: number of peaks at each distance from -250 to +249
+def plotDistances(tssCounts, outName, outFormat):
     distances = []
     distCount = []
     keys = range(-250,250,1)
-    for key in keys:
-        if key in countMap:
-            distances.append(key)
-            distCount.append(countMap[key])
+    for i in xrange(len(keys)):
+        if tssCounts[i] > 0:
+            distances.append(keys[i])
+            distCount.append(tssCounts[i])
+    if outFormat == "tsv":
+        plotFiles.writeCounts(outName, ["#Distance to TSS", "Peak Count"], zip(distances, distCount))
+        return
     print "Displaying TSS plot at base pair resolution..."
+    plt = plotFiles.getPyplot(outFormat)
     plt.plot(distances,distCount, 'ro-')
     plt.xticks(range(-250,250,20))
     plt.grid(True)
     plt.xlabel("Distance to TSS (pb)")
     plt.ylabel("Peak Count")
-    plt.show()
+    plotFiles.showPlot(plt, outName, outFormat)
                  
 if __name__ == '__main__':
-    infilename, queryType, plotDist, plotLoc, chartTitle, histTitle, typeToRetrieve, biomartFile, completeFile, peakListFile = get_params(sys.argv[1:])
+    infilename, queryType, plotDist, plotLoc, chartTitle, histTitle, typesToRetrieve, biomartFile, completeFile, peakListFiles, outFormat, userBins = get_params(sys.argv[1:])
     if infilename == "none" or queryType == "none":
         sys.exit(progHelp)
-    annotationList = getAnnotationList(infilename)
+    operations = []
+    plotTasks = []
     if plotDist == True:
-        distanceList,countMap = getDistanceList(annotationList)
-        histDistances(distanceList, histTitle)
-        plotDistances(countMap)
+        operations.append(getDistanceOperation(histTitle, userBins, plotTasks, str(infilename).split(".")[0], outFormat))
     if plotLoc == True:
-        pieChartMap = getPieChartMap(annotationList)
-        pieChart(pieChartMap, chartTitle)
+        operations.append(getPieChartOperation(chartTitle, plotTasks, str(infilename).split(".")[0], outFormat))
     if queryType == "retrieveLines":
-        retLines = getLinesFromType(annotationList, typeToRetrieve)
-        writeList(retLines, "retrievedAnnotations_"+typeToRetrieve+".xls")
+        operations.append(getTypeOperation(typesToRetrieve))
     if completeFile == True:
         ensemblMap = getEnsemblMap(biomartFile)
-        detailedLines = completeAnnotations(annotationList, ensemblMap)
-        writeList(detailedLines, str(infilename).split(".")[0]+"_detailed.xls")
-    if not peakListFile == "none":
-        peakList = getIDList(peakListFile)
-        retLines = getLinesFromPeaks(annotationList, peakList)
-        writeList(retLines, "foundLines.txt")
+        operations.append(getBiomartOperation(ensemblMap, str(infilename).split(".")[0]+"_detailed.xls"))
+    if len(peakListFiles) > 0:
+        peakSets = [getIDSet(peakListFile) for peakListFile in peakListFiles]
+        operations.append(getPeakListOperation(peakSets, getPeakListOutNames(peakListFiles)))
+    processAnnotations(infilename, operations)
+    plotFiles.renderPlots(plotTasks, outFormat)
     print "Finished."
\ No newline at end of file
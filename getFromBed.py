@@ -5,23 +5,41 @@ Created on 7 mai 2015
 '''
 
 # Allows operations on BED Files.
+# Requires:
+# -numpy: http://www.numpy.org/ (only with '-w')
 # Arguments:
 #-i <file1.bed>, input file in bed format
 # Options (choose one):
-#-o <offset(integer)>, changes the coordinates of each entry of the input file by the offset amount (start-offset, end+offset)
+#-o <offset(integer)>, changes the coordinates of each entry of the input file by the offset amount (start-offset, end+offset). Streams the file line by line, use '-i -' to read from stdin and write to stdout.
 #-b <file2.bed>, finds all entries in file2 which ID/name matches any ID/name in file1 (4th column). Can be a simple list of IDs (one ID per line) then set '-f' to 1.
+#-v <file2.bed>, finds all entries in file2 which overlap an entry of file1 (writes the file1 entry followed by the file2 entry).
+#-n <file2.bed>, finds the nearest entry in file2 for each entry of file1 (writes the file1 entry, the file2 entry and the distance).
+#-w <minWidth-maxWidth>, keeps the entries which width (end-start) is within the range (only the first six columns are written).
+#-x true, compresses a sorted BED file (sort -k1,1 -k2,2n) into blocks ('file1.bed.gz', bgzip compatible) and indexes their coordinates ('file1.bed.gz.idx').
+#-r <chr:start-end>, with '-i file1.bed.gz' (built with '-x'), retrieves the entries overlapping the region by reading only the blocks which contain them. Can be repeated (several regions), thousands separators are allowed (chr1:1,000,000-2,000,000).
 # Optional:
 #-f <field number(integer)>, only with '-b', field (column) which contains IDs for file2.bed (default:4)
+#-m <memory(MB)>, only with '-b', memory budget: if both files do not fit in it, they are sorted by ID on disk and joined in a single streaming pass (output is then ordered by ID)
+#-d <distance(integer)>, only with '-v', also reports file2 entries found within this distance of a file1 entry (default:0)
 
 
 import sys
 import getopt
+import os
+import time
+import heapq
+import tempfile
+import struct
+import zlib
+from itertools import groupby
+from bisect import bisect_left, bisect_right
+from collections import deque
 
-progHelp = "Allows operations on BED Files.\nArguments:\n-i <file1.bed>, input file in bed format\nOptions (choose one):\n-o <offset(integer)>, changes the coordinates of each entry of the input file by the offset amount (start-offset, end+offset)\n-b <file2.bed>, finds all entries in file2 which ID/name matches any ID/name in file1(4th column). Can be a simple list of IDs (one ID per line) then set '-f' to 1.\nOptional:\n-f <field number(integer)>, only with '-b', field (column) which contains IDs for file2.bed (default:4)"
+progHelp = "Allows operations on BED Files.\nArguments:\n-i <file1.bed>, input file in bed format\nOptions (choose one):\n-o <offset(integer)>, changes the coordinates of each entry of the input file by the offset amount (start-offset, end+offset). Streams the file line by line, use '-i -' to read from stdin and write to stdout.\n-b <file2.bed>, finds all entries in file2 which ID/name matches any ID/name in file1(4th column). Can be a simple list of IDs (one ID per line) then set '-f' to 1.\n-v <file2.bed>, finds all entries in file2 which overlap an entry of file1 (writes the file1 entry followed by the file2 entry).\n-n <file2.bed>, finds the nearest entry in file2 for each entry of file1 (writes the file1 entry, the file2 entry and the distance).\n-w <minWidth-maxWidth>, keeps the entries which width (end-start) is within the range (only the first six columns are written).\n-x true, compresses a sorted BED file (sort -k1,1 -k2,2n) into blocks ('file1.bed.gz', bgzip compatible) and indexes their coordinates ('file1.bed.gz.idx').\n-r <chr:start-end>, with '-i file1.bed.gz' (built with '-x'), retrieves the entries overlapping the region by reading only the blocks which contain them. Can be repeated (several regions), thousands separators are allowed (chr1:1,000,000-2,000,000).\nOptional:\n-f <field number(integer)>, only with '-b', field (column) which contains IDs for file2.bed (default:4)\n-m <memory(MB)>, only with '-b', memory budget: if both files do not fit in it, they are sorted by ID on disk and joined in a single streaming pass (output is then ordered by ID)\n-d <distance(integer)>, only with '-v', also reports file2 entries found within this distance of a file1 entry (default:0)"
 
 def get_params(argv):
     try:
-        opts, args = getopt.getopt(argv, "i:o:b:f:", ["infilename", "offset", "secondBedFile","idField"])
+        opts, args = getopt.getopt(argv, "i:o:b:f:v:n:d:m:w:x:r:", ["infilename", "offset", "secondBedFile","idField","overlapFile","nearestFile","distance","memory","widthRange","buildIndex","regions"])
     except getopt.GetoptError:
         sys.exit("Invalid argument:\n"+progHelp)
     infilename = "none"
@@ -29,6 +47,10 @@ def get_params(argv):
     offset = "none"
     secondBedFile = "none"
     idField = 4
+    distance = 0
+    memory = "none"
+    widthRange = "none"
+    regions = []
     for opt,arg in opts:
         if opt =='-i':
             infilename = arg
@@ -40,7 +62,25 @@ def get_params(argv):
             queryType = "CommonLinesID"
         if opt == "-f":
             idField = int(arg)
-    return infilename, offset, queryType, secondBedFile, idField
+        if opt == "-v":
+            secondBedFile = arg
+            queryType = "Overlap"
+        if opt == "-n":
+            secondBedFile = arg
+            queryType = "Nearest"
+        if opt == "-d":
+            distance = int(arg)
+        if opt == "-m":
+            memory = int(arg)
+        if opt == "-w":
+            widthRange = (int(arg.split("-")[0]), int(arg.split("-")[1]))
+            queryType = "Width"
+        if opt == "-x":
+            queryType = "BuildIndex"
+        if opt == "-r":
+            regions.append(str(arg))
+            queryType = "Regions"
+    return infilename, offset, queryType, secondBedFile, idField, distance, memory, widthRange, regions
 
 
 def getBedList(infileName):
@@ -53,24 +93,43 @@ def getBedList(infileName):
     print "Reading Input file "+infileName+" : "+str(len(bedList))+" lines."
     return bedList
 
-def changeCoord(bedList, offset):
-    newList = []
-    for entry in bedList:
-        fnum=0
-        newEntry=""
-        for field in entry.split("\t"):
-            if fnum == 1:
-                newStart = int(field)-offset
-                newEntry = newEntry+str(newStart)+"\t"
-            elif fnum == 2:
-                newEnd = int(field)+offset
-                newEntry = newEntry+str(newEnd)+"\t"
-            else:
-                newEntry = newEntry+str(field)+"\t"
-            fnum = fnum+1
-        newList.append(newEntry.strip())
-    return newList
-                
+def offsetLine(line, offset):
+    fields = line.split("\t", 3)
+    fields[1] = str(int(fields[1])-offset)
+    if len(fields) == 3:
+        fields[2] = str(int(fields[2])+offset)+"\n"
+    else:
+        fields[2] = str(int(fields[2])+offset)
+    return "\t".join(fields)
+
+# streams the input file (or stdin) and writes each entry with its new coordinates, only one line is kept in memory
+def streamOffset(infileName, outfileName, offset):
+    if infileName == "-":
+        inFile = sys.stdin
+        outFile = sys.stdout
+        log = sys.stderr
+    else:
+        inFile = open(infileName, "r", 1048576)
+        outFile = open(outfileName, "w", 1048576)
+        log = sys.stdout
+    lineCount = 0
+    startTime = time.time()
+    for line in inFile:
+        if line.startswith("#") or line.startswith("track") or line.startswith("browser") or line.isspace():
+            outFile.write(line)
+            continue
+        if not line.endswith("\n"):
+            line = line+"\n"
+        outFile.write(offsetLine(line, offset))
+        lineCount = lineCount+1
+    outFile.flush()
+    if not infileName == "-":
+        inFile.close()
+        outFile.close()
+        log.write("Writing '"+outfileName+"': "+str(lineCount)+" lines.\n")
+    elapsed = max(time.time()-startTime, 1e-6)
+    log.write("Offset applied to "+str(lineCount)+" lines in "+str("{:.2f}".format(elapsed))+"s ("+str(int(lineCount/elapsed))+" rows/s).\n")
+
 def writeBed(bedList, outfileName):
     outfile = open(outfileName, "w")
     for line in bedList:
@@ -93,20 +152,413 @@ def getLinesWithIDs(bedList, idMap, idField = 4):
         if sbID in idMap:
             foundLines.append(str(idMap[sbID]).strip())
     return foundLines
-    
+
+# estimated memory used by one (key, line) entry of a run on top of the line itself
+RUN_ENTRY_OVERHEAD = 150
+# maximum number of run files merged at once
+MAX_OPEN_RUNS = 200
+
+def writeRun(entries, tmpDir):
+    entries.sort(key=lambda entry: entry[0])
+    runFile = tempfile.NamedTemporaryFile("w", dir=tmpDir, prefix="run_", suffix=".txt", delete=False)
+    for key, line in entries:
+        runFile.write(key+"\t"+line)
+    runFile.close()
+    return runFile.name
+
+def readRun(runName, runNum):
+    runFile = open(runName, "r", 65536)
+    lineNum = 0
+    for runLine in runFile:
+        key, line = runLine.split("\t", 1)
+        yield (key, runNum, lineNum, line)
+        lineNum = lineNum+1
+    runFile.close()
+
+# merges runs into one sorted stream, equal keys keep the order of the input file
+def mergeRuns(runNames):
+    return heapq.merge(*[readRun(runName, runNum) for runNum, runName in enumerate(runNames)])
+
+# splits the file into runs sorted by ID which each fit in maxBytes, returns the run file names
+def getSortedRuns(infileName, idField, maxBytes, tmpDir):
+    inFile = open(infileName, "r", 1048576)
+    runNames = []
+    entries = []
+    entryBytes = 0
+    lineCount = 0
+    for line in inFile:
+        if not line.endswith("\n"):
+            line = line+"\n"
+        key = line.split("\t", idField)[(idField-1)].strip().upper()
+        entries.append((key, line))
+        entryBytes = entryBytes+len(line)+len(key)+RUN_ENTRY_OVERHEAD
+        lineCount = lineCount+1
+        if entryBytes >= maxBytes:
+            runNames.append(writeRun(entries, tmpDir))
+            entries = []
+            entryBytes = 0
+    if len(entries) > 0 or len(runNames) == 0:
+        runNames.append(writeRun(entries, tmpDir))
+    inFile.close()
+    while len(runNames) > MAX_OPEN_RUNS:
+        mergedNames = []
+        for i in xrange(0, len(runNames), MAX_OPEN_RUNS):
+            group = runNames[i:i+MAX_OPEN_RUNS]
+            runFile = tempfile.NamedTemporaryFile("w", dir=tmpDir, prefix="run_", suffix=".txt", delete=False)
+            for key, runNum, lineNum, line in mergeRuns(group):
+                runFile.write(key+"\t"+line)
+            runFile.close()
+            for runName in group:
+                os.remove(runName)
+            mergedNames.append(runFile.name)
+        runNames = mergedNames
+    print "Sorting '"+infileName+"' by ID: "+str(lineCount)+" lines in "+str(len(runNames))+" run(s)."
+    return runNames
+
+# same result as getIDMap + getLinesWithIDs (the last file1 line of an ID is used) but both files are streamed from sorted runs
+def writeLinesWithIDsSorted(infileName, secondBedFile, outfileName, idField, memory):
+    tmpDir = tempfile.mkdtemp(prefix="getFromBed_")
+    maxBytes = memory*1048576
+    runNames = []
+    try:
+        firstRuns = getSortedRuns(infileName, 4, maxBytes, tmpDir)
+        runNames.extend(firstRuns)
+        secondRuns = getSortedRuns(secondBedFile, idField, maxBytes, tmpDir)
+        runNames.extend(secondRuns)
+        firstGroups = groupby(mergeRuns(firstRuns), key=lambda entry: entry[0])
+        secondGroups = groupby(mergeRuns(secondRuns), key=lambda entry: entry[0])
+        outFile = open(outfileName, "w", 1048576)
+        lineCount = 0
+        firstKey, firstEntries = next(firstGroups, (None, None))
+        secondKey, secondEntries = next(secondGroups, (None, None))
+        while firstKey is not None and secondKey is not None:
+            if firstKey < secondKey:
+                firstKey, firstEntries = next(firstGroups, (None, None))
+            elif secondKey < firstKey:
+                secondKey, secondEntries = next(secondGroups, (None, None))
+            else:
+                for entry in firstEntries:
+                    foundLine = entry[3].strip()
+                for entry in secondEntries:
+                    outFile.write(foundLine+"\n")
+                    lineCount = lineCount+1
+                firstKey, firstEntries = next(firstGroups, (None, None))
+                secondKey, secondEntries = next(secondGroups, (None, None))
+        outFile.flush()
+        outFile.close()
+    finally:
+        for runName in runNames:
+            if os.path.exists(runName):
+                os.remove(runName)
+        os.rmdir(tmpDir)
+    print "Writing '"+outfileName+"': "+str(lineCount)+" lines."
+
+# nested containment list: intervals sorted by start (longest first), each interval contained in another one is moved to the sublist
+# of its container, so that starts and ends both increase within every list and the overlaps of a region are found by one binary search
+# per list holding an overlap (a long interval no longer makes every query scan the intervals it contains)
+# returns (starts, ends, ranks, sublist firsts, sublist lasts, root list size) in layout order, ranks: index of the interval in starts/ends given
+def getContainmentList(starts, ends):
+    order = sorted(xrange(len(starts)), key=lambda i: (starts[i], -ends[i]))
+    children = {-1: []}
+    containers = []
+    for i in order:
+        while len(containers) > 0 and ends[containers[-1]] < ends[i]:
+            containers.pop()
+        if len(containers) > 0:
+            parent = containers[-1]
+        else:
+            parent = -1
+        if parent in children:
+            children[parent].append(i)
+        else:
+            children[parent] = [i]
+        containers.append(i)
+    layout = []
+    sublists = {}
+    parents = deque([-1])
+    while len(parents) > 0:
+        parent = parents.popleft()
+        sublist = children.get(parent, [])
+        sublists[parent] = (len(layout), len(layout)+len(sublist))
+        layout.extend(sublist)
+        parents.extend([i for i in sublist if i in children])
+    subFirsts = [sublists.get(i, (0, 0))[0] for i in layout]
+    subLasts = [sublists.get(i, (0, 0))[1] for i in layout]
+    return ([starts[i] for i in layout], [ends[i] for i in layout], layout, subFirsts, subLasts, len(children[-1]))
+
+# returns the ranks (sorted) of the intervals overlapping [start, end)
+def getContainedOverlaps(containmentList, start, end):
+    listStarts, listEnds, ranks, subFirsts, subLasts, rootSize = containmentList
+    found = []
+    lists = [(0, rootSize)]
+    while len(lists) > 0:
+        first, last = lists.pop()
+        i = bisect_right(listEnds, start, first, last)
+        while i < last and listStarts[i] < end:
+            found.append(ranks[i])
+            if subFirsts[i] < subLasts[i]:
+                lists.append((subFirsts[i], subLasts[i]))
+            i = i+1
+    found.sort()
+    return found
+
+# returns hashmap: key = chromosome, value = (starts, ends, containment list, lines, sortedEnds, sortedEndLines)
+# entries are sorted by start, the entries overlapping a region are found through the containment list
+def getIntervalIndex(bedList):
+    entryMap = {}
+    for line in bedList:
+        if line.startswith("#") or line.startswith("track") or line.startswith("browser") or line.isspace():
+            continue
+        fields = line.split("\t", 3)
+        chrom = fields[0]
+        entry = (int(fields[1]), int(fields[2]), line.rstrip("\r\n"))
+        if chrom in entryMap:
+            entryMap[chrom].append(entry)
+        else:
+            entryMap[chrom] = [entry]
+    intervalIndex = {}
+    for chrom in entryMap.keys():
+        entries = entryMap[chrom]
+        entries.sort(key=lambda entry: entry[0])
+        starts = [entry[0] for entry in entries]
+        ends = [entry[1] for entry in entries]
+        lines = [entry[2] for entry in entries]
+        containmentList = getContainmentList(starts, ends)
+        entries.sort(key=lambda entry: entry[1])
+        sortedEnds = [entry[1] for entry in entries]
+        sortedEndLines = [entry[2] for entry in entries]
+        intervalIndex[chrom] = (starts, ends, containmentList, lines, sortedEnds, sortedEndLines)
+        del entryMap[chrom]
+    print "Indexing intervals: "+str(len(bedList))+" lines on "+str(len(intervalIndex))+" chromosomes."
+    return intervalIndex
+
+def getOverlaps(intervalIndex, chrom, start, end):
+    if not chrom in intervalIndex:
+        return []
+    starts, ends, containmentList, lines = intervalIndex[chrom][:4]
+    return [lines[i] for i in getContainedOverlaps(containmentList, start, end)]
+
+# returns the nearest entries (ties included) and their distance, 0 if they overlap, 1 if they are book-ended
+def getNearest(intervalIndex, chrom, start, end):
+    overlaps = getOverlaps(intervalIndex, chrom, start, end)
+    if len(overlaps) > 0 or not chrom in intervalIndex:
+        return overlaps, 0
+    starts, ends, containmentList, lines, sortedEnds, sortedEndLines = intervalIndex[chrom]
+    nearest = []
+    distance = -1
+    down = bisect_left(starts, end)
+    if down < len(starts):
+        downStart = starts[down]
+        distance = downStart-end+1
+        while down < len(starts) and starts[down] == downStart:
+            nearest.append(lines[down])
+            down = down+1
+    up = bisect_right(sortedEnds, start)-1
+    if up >= 0:
+        upDistance = start-sortedEnds[up]+1
+        if distance == -1 or upDistance < distance:
+            nearest = []
+            distance = upDistance
+        if upDistance == distance:
+            upEnd = sortedEnds[up]
+            while up >= 0 and sortedEnds[up] == upEnd:
+                nearest.append(sortedEndLines[up])
+                up = up-1
+    return nearest, distance
+
+# streams file1 and queries the index of file2 for each entry
+def writeIntervalQueries(infileName, intervalIndex, outfileName, queryType, distance = 0):
+    inFile = open(infileName, "r")
+    outFile = open(outfileName, "w")
+    queryCount = 0
+    foundCount = 0
+    lineCount = 0
+    for line in inFile:
+        if line.startswith("#") or line.startswith("track") or line.startswith("browser") or line.isspace():
+            continue
+        fields = line.split("\t", 3)
+        chrom = fields[0]
+        start = int(fields[1])
+        end = int(fields[2])
+        line = line.rstrip("\r\n")
+        queryCount = queryCount+1
+        if queryType == "Nearest":
+            found, foundDistance = getNearest(intervalIndex, chrom, start, end)
+            suffix = "\t"+str(foundDistance)
+        else:
+            found = getOverlaps(intervalIndex, chrom, start-distance, end+distance)
+            suffix = ""
+        if len(found) > 0:
+            foundCount = foundCount+1
+        for foundLine in found:
+            outFile.write(line+"\t"+foundLine+suffix+"\n")
+            lineCount = lineCount+1
+    inFile.close()
+    outFile.flush()
+    outFile.close()
+    print "Querying '"+infileName+"': "+str(foundCount)+" of "+str(queryCount)+" entries found in the index."
+    print "Writing '"+outfileName+"': "+str(lineCount)+" lines."
+
+# uncompressed size of a block, compressed blocks must stay under 64kb
+BLOCK_SIZE = 60000
+BGZF_EOF = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+# returns a gzip member with the BGZF extra field (block size), readable by gzip/zcat and tabix
+def getBgzfBlock(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data)+compressor.flush()
+    header = struct.pack("<BBBBIBBHBBHH", 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(compressed)+25)
+    footer = struct.pack("<II", zlib.crc32(data) & 0xffffffff, len(data))
+    return header+compressed+footer
+
+# writes the block and returns its index line: chromosome, first start, largest end, offset and size of the block
+def writeBlock(outFile, chrom, lines, firstStart, maxEnd):
+    block = getBgzfBlock("".join(lines))
+    offset = outFile.tell()
+    outFile.write(block)
+    return chrom+"\t"+str(firstStart)+"\t"+str(maxEnd)+"\t"+str(offset)+"\t"+str(len(block))+"\n"
+
+# blocks never span two chromosomes, so that a region query only reads blocks of its chromosome
+def writeBlockIndex(infileName):
+    outfileName = infileName+".gz"
+    inFile = open(infileName, "r", 1048576)
+    outFile = open(outfileName, "wb")
+    indexFile = open(outfileName+".idx", "w")
+    seenChroms = set()
+    blockChrom = None
+    blockLines = []
+    blockBytes = 0
+    blockCount = 0
+    lineCount = 0
+    for line in inFile:
+        if line.startswith("#") or line.startswith("track") or line.startswith("browser") or line.isspace():
+            continue
+        if not line.endswith("\n"):
+            line = line+"\n"
+        fields = line.split("\t", 3)
+        chrom = fields[0]
+        start = int(fields[1])
+        end = int(fields[2])
+        if chrom != blockChrom or blockBytes+len(line) > BLOCK_SIZE:
+            if len(blockLines) > 0:
+                indexFile.write(writeBlock(outFile, blockChrom, blockLines, firstStart, maxEnd))
+                blockCount = blockCount+1
+            if chrom != blockChrom:
+                if chrom in seenChroms:
+                    sys.exit("'"+infileName+"' is not sorted (sort -k1,1 -k2,2n), found '"+chrom+"' twice.")
+                seenChroms.add(chrom)
+            else:
+                if start < lastStart:
+                    sys.exit("'"+infileName+"' is not sorted (sort -k1,1 -k2,2n), line "+str(lineCount+1)+".")
+            blockChrom = chrom
+            blockLines = []
+            blockBytes = 0
+            firstStart = start
+            maxEnd = end
+        elif start < lastStart:
+            sys.exit("'"+infileName+"' is not sorted (sort -k1,1 -k2,2n), line "+str(lineCount+1)+".")
+        blockLines.append(line)
+        blockBytes = blockBytes+len(line)
+        lastStart = start
+        if end > maxEnd:
+            maxEnd = end
+        lineCount = lineCount+1
+    if len(blockLines) > 0:
+        indexFile.write(writeBlock(outFile, blockChrom, blockLines, firstStart, maxEnd))
+        blockCount = blockCount+1
+    outFile.write(BGZF_EOF)
+    inFile.close()
+    outFile.close()
+    indexFile.close()
+    print "Writing '"+outfileName+"': "+str(lineCount)+" lines in "+str(blockCount)+" blocks, index '"+outfileName+".idx'."
+
+# returns hashmap: key = chromosome, value = (first starts, largest ends, offsets, sizes, containment list) of its blocks
+def getBlockIndex(indexFileName):
+    iFile = open(indexFileName, "r")
+    blockIndex = {}
+    for line in iFile:
+        chrom, firstStart, maxEnd, offset, size = line.split("\t")
+        if not chrom in blockIndex:
+            blockIndex[chrom] = ([], [], [], [])
+        firstStarts, maxEnds, offsets, sizes = blockIndex[chrom]
+        firstStarts.append(int(firstStart))
+        maxEnds.append(int(maxEnd))
+        offsets.append(int(offset))
+        sizes.append(int(size))
+    iFile.close()
+    for chrom in blockIndex:
+        firstStarts, maxEnds, offsets, sizes = blockIndex[chrom]
+        blockIndex[chrom] = (firstStarts, maxEnds, offsets, sizes, getContainmentList(firstStarts, maxEnds))
+    return blockIndex
+
+# commas are thousands separators, several regions are given with repeated '-r'
+def parseRegion(region):
+    try:
+        chrom, coords = region.strip().rsplit(":", 1)
+        start, end = coords.replace(",", "").split("-")
+        if ":" in chrom:
+            raise ValueError
+        return chrom, int(start), int(end)
+    except ValueError:
+        sys.exit("Cannot read region '"+region+"', expected <chr:start-end> (repeat '-r' for several regions).")
+
+def getRegionLines(bgzFile, blockIndex, chrom, start, end):
+    if not chrom in blockIndex:
+        return []
+    firstStarts, maxEnds, offsets, sizes, containmentList = blockIndex[chrom]
+    regionLines = []
+    for i in getContainedOverlaps(containmentList, start, end):
+        bgzFile.seek(offsets[i])
+        for line in zlib.decompress(bgzFile.read(sizes[i]), 31).splitlines():
+            fields = line.split("\t", 3)
+            if int(fields[1]) < end and int(fields[2]) > start:
+                regionLines.append(line)
+    return regionLines
+
+def writeRegionLines(infileName, regions, outfileName):
+    blockIndex = getBlockIndex(infileName+".idx")
+    bgzFile = open(infileName, "rb")
+    regionLines = []
+    for region in regions:
+        chrom, start, end = parseRegion(region)
+        lines = getRegionLines(bgzFile, blockIndex, chrom, start, end)
+        print "Region "+chrom+":"+str(start)+"-"+str(end)+": "+str(len(lines))+" lines."
+        regionLines.extend(lines)
+    bgzFile.close()
+    writeBed(regionLines, outfileName)
+
 if __name__ == '__main__':
-    infileName, offset, queryType, secondBedFile, idField = get_params(sys.argv[1:])
+    infileName, offset, queryType, secondBedFile, idField, distance, memory, widthRange, regions = get_params(sys.argv[1:])
     if infileName == "none" or queryType == "none":
         sys.exit(progHelp)
     if queryType == "Offset":
-        bedList = getBedList(infileName)
-        newBedList = changeCoord(bedList, offset)
         outfileName = str(infileName).split(".")[0]+"_offset"+str(offset)+".bed"
-        writeBed(newBedList, outfileName)
-    if queryType == "CommonLinesID":
+        streamOffset(infileName, outfileName, offset)
+        if infileName == "-":
+            sys.exit(0)
+    if queryType == "CommonLinesID" and not memory == "none" and os.path.getsize(infileName)+os.path.getsize(secondBedFile) > memory*1048576:
+        print "Input files do not fit in "+str(memory)+"MB, joining sorted runs."
+        writeLinesWithIDsSorted(infileName, secondBedFile, "commonLines.bed", idField, memory)
+    elif queryType == "CommonLinesID":
         bedList = getBedList(infileName)
         secondBedList = getBedList(secondBedFile)
         idMap = getIDMap(bedList)
         commonLineList = getLinesWithIDs(secondBedList, idMap, idField)
         writeBed(commonLineList, "commonLines.bed")
+    if queryType == "Overlap" or queryType == "Nearest":
+        intervalIndex = getIntervalIndex(getBedList(secondBedFile))
+        if queryType == "Overlap":
+            writeIntervalQueries(infileName, intervalIndex, "overlappingLines.bed", queryType, distance)
+        else:
+            writeIntervalQueries(infileName, intervalIndex, "nearestLines.bed", queryType)
+    if queryType == "Width":
+        import bedColumns
+        columns = bedColumns.readBedColumns(infileName)
+        widthMask = bedColumns.getWidthMask(columns, widthRange[0], widthRange[1])
+        outfileName = str(infileName).split(".")[0]+"_width"+str(widthRange[0])+"-"+str(widthRange[1])+".bed"
+        bedColumns.writeBedColumns(bedColumns.selectRows(columns, widthMask), outfileName)
+    if queryType == "BuildIndex":
+        writeBlockIndex(infileName)
+    if queryType == "Regions":
+        writeRegionLines(infileName, regions, "regionLines.bed")
     print "Finished !"
\ No newline at end of file
@@ -12,10 +12,14 @@ Created on 4 mai 2015
 # -i <file.fasta>, sequence(s) file in fasta format
 # Options (choose one):
 # -r <regexp>,  looks for a regular expression within input sequences.
-# -u true, generates a new multi fasta file with new uniques IDs for each sequence.
-# -f <ids.txt>, file containing a list of sequences IDs (1 per line) to retrieve from '-i' file.
+# -u true, generates a new multi fasta file ('output.fasta') with new uniques IDs for each sequence. Only header lines are rewritten, sequence lines are copied unchanged (gzipped input is read directly).
+# -m <motifs>, looks for consensus motifs (IUPAC codes, comma separated, or a file with one motif per line) on both strands of the input sequences, overlapping hits included. Writes one line per hit in 'motif_hits.bed' (sequence ID, start, end, motif, 0, strand).
+# -f <ids.txt>, file containing a list of sequences IDs (1 per line) to retrieve from '-i' file. Sequences are read through an index of the fasta file ('file.fasta.idx', built on first use) and written in the order of the fasta file, every sequence matching an ID is written.
 # Optional:
+# -t <processes(integer)>, only if '-r' or '-m', splits the fasta file into chunks of whole records which are scanned in parallel (results keep the order of the input file).
 # -p <separator>, only if '-f', parses the IDs of both files (ex: sequenceID(file.fasta): MITF_peak_201, ID(ids.txt): CT_HG19_MITF_peak_201, then use either 'MITF' or 'peak' as separator).
+# -z true, only if '-u', writes a gzipped output ('output.fasta.gz').
+# -k <ids_map.tsv>, only if '-u', writes the old ID and the new ID of each sequence.
 #
 #Examples:
 #Retrieves sequences from a list of IDs:
@@ -24,19 +28,26 @@ Created on 4 mai 2015
 #python getFromFasta.py -i unnamed_sequences.fasta -u true
 #Looks for TAAA or TAAAA in the input sequences:
 #python getFromFasta.py -i chip_mitf_peaks.fasta -r 'TA{3,4}'
+#Writes the locations of E-box and SOX motifs on both strands:
+#python getFromFasta.py -i chip_mitf_peaks.fasta -m 'CACGTG,ACAAWG'
 
 import sys
+import os
 import getopt
+import multiprocessing
+import itertools
+import string
+import gzip
+import sqlite3
 import Bio.SeqIO
 from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
 import re
 
-progHelp = "Allows different operations on fasta files.\nArguments:\n -i <file>, sequence(s) file in fasta format\nOptions (choose one):\n -r <regexp>,  looks for a regular expression within input sequences.\n -u true, generates a new multi fasta file with new uniques IDs for each sequence.\n -f <ids.txt>, file containing a list of sequences IDs (1 per line) to retrieve from '-i' file.\nOptional:\n -p <separator>, only if '-f', parses the IDs of both files (ex: sequenceID(file.fasta): MITF_peak_201, ID(ids.txt): CT_HG19_MITF_peak_201, then use either 'MITF' or 'peak' as separator).\n\nExamples:\nRetrieves sequences from a list of IDs:\npython getFromFasta.py -i chip_mitf_peaks.fasta -f peak_ids.txt\nGenerates new IDs for each sequences:\npython getFromFasta.py -i unnamed_sequences.fasta -u true\nLooks for TAAA or TAAAA in the input sequences:\npython getFromFasta.py -i chip_mitf_peaks.fasta -r 'TA{3,4}'"
+progHelp = "Allows different operations on fasta files.\nArguments:\n -i <file>, sequence(s) file in fasta format\nOptions (choose one):\n -r <regexp>,  looks for a regular expression within input sequences.\n -u true, generates a new multi fasta file ('output.fasta') with new uniques IDs for each sequence. Only header lines are rewritten, sequence lines are copied unchanged (gzipped input is read directly).\n -m <motifs>, looks for consensus motifs (IUPAC codes, comma separated, or a file with one motif per line) on both strands of the input sequences, overlapping hits included. Writes one line per hit in 'motif_hits.bed' (sequence ID, start, end, motif, 0, strand).\n -f <ids.txt>, file containing a list of sequences IDs (1 per line) to retrieve from '-i' file. Sequences are read through an index of the fasta file ('file.fasta.idx', built on first use) and written in the order of the fasta file, every sequence matching an ID is written.\nOptional:\n -t <processes(integer)>, only if '-r' or '-m', splits the fasta file into chunks of whole records which are scanned in parallel (results keep the order of the input file).\n -p <separator>, only if '-f', parses the IDs of both files (ex: sequenceID(file.fasta): MITF_peak_201, ID(ids.txt): CT_HG19_MITF_peak_201, then use either 'MITF' or 'peak' as separator).\n -z true, only if '-u', writes a gzipped output ('output.fasta.gz').\n -k <ids_map.tsv>, only if '-u', writes the old ID and the new ID of each sequence.\n\nExamples:\nRetrieves sequences from a list of IDs:\npython getFromFasta.py -i chip_mitf_peaks.fasta -f peak_ids.txt\nGenerates new IDs for each sequences:\npython getFromFasta.py -i unnamed_sequences.fasta -u true\nLooks for TAAA or TAAAA in the input sequences:\npython getFromFasta.py -i chip_mitf_peaks.fasta -r 'TA{3,4}'\nWrites the locations of E-box and SOX motifs on both strands:\npython getFromFasta.py -i chip_mitf_peaks.fasta -m 'CACGTG,ACAAWG'"
 
 def get_params(argv):
     try:
-        opts, args = getopt.getopt(argv, "i:r:u:f:p:", ["infile", "regexp","uniqueIDs","idFile","parseIDs"])
+        opts, args = getopt.getopt(argv, "i:r:u:f:p:t:m:z:k:", ["infile", "regexp","uniqueIDs","idFile","parseIDs","processes","motifs","gzipOutput","idMapFile"])
     except getopt.GetoptError:
         sys.exit("Invalid argument:\n"+progHelp)
     infilename = "none"
@@ -45,6 +56,9 @@ def get_params(argv):
     idFile = "none"
     parseIDs = False
     expName = "none"
+    processes = 1
+    gzipOutput = False
+    idMapFile = "none"
     for opt,arg in opts:
         if opt =='-i':
             infilename = arg
@@ -58,14 +72,34 @@ def get_params(argv):
             queryType = "getSequences"
         if opt == "-p":
             parseIDs = True
-            expName = arg      
-    return infilename, pattern, queryType, idFile, parseIDs, expName
+            expName = arg
+        if opt == "-t":
+            processes = int(arg)
+        if opt == "-m":
+            pattern = str(arg)
+            queryType = "motifs"
+        if opt == "-z":
+            gzipOutput = True
+        if opt == "-k":
+            idMapFile = arg
+    return infilename, pattern, queryType, idFile, parseIDs, expName, processes, gzipOutput, idMapFile
 
 def getRecordDic(infileName):
     recordDic = Bio.SeqIO.index(infileName, "fasta")
     print "Reading Input file '"+infileName+"': "+str(len(recordDic))+" sequence(s)."
     return recordDic
 
+# persistent offset index (SQLite) of the records, rebuilt when the fasta file is newer than the index
+def getRecordIndex(infileName):
+    indexName = infileName+".idx"
+    if os.path.exists(indexName) and os.path.getmtime(indexName) < os.path.getmtime(infileName):
+        os.remove(indexName)
+    if not os.path.exists(indexName):
+        print "Indexing '"+infileName+"': writing '"+indexName+"'."
+    recordIndex = Bio.SeqIO.index_db(indexName, infileName, "fasta")
+    print "Reading Input file '"+infileName+"': "+str(len(recordIndex))+" sequence(s)."
+    return recordIndex
+
 def searchRegexp(pattern, recordDic):
     prog = re.compile(pattern)
     idList = []
@@ -80,22 +114,287 @@ def searchRegexp(pattern, recordDic):
                 print match
             idList.append(rID)
     print "Found "+str(len(idList))+" sequences with match(es)."
-    return idList        
+    return idList
+
+# returns (start, end) byte ranges of the file, each range starts on a header line so that records are never split
+def getFastaChunks(infileName, chunkNumber):
+    fileSize = os.path.getsize(infileName)
+    fFile = open(infileName, "rb")
+    boundaries = [0]
+    for chunk in xrange(1, chunkNumber):
+        fFile.seek((fileSize*chunk)/chunkNumber)
+        fFile.readline()
+        while True:
+            lineStart = fFile.tell()
+            line = fFile.readline()
+            if not line:
+                lineStart = fileSize
+                break
+            if line.startswith(">"):
+                break
+        if lineStart > boundaries[-1] and lineStart < fileSize:
+            boundaries.append(lineStart)
+    fFile.close()
+    boundaries.append(fileSize)
+    return [(boundaries[i], boundaries[i+1]) for i in xrange(len(boundaries)-1)]
+
+# yields (ID, sequence) for the records starting in the byte range
+def readChunkRecords(infileName, start, end):
+    fFile = open(infileName, "rb")
+    fFile.seek(start)
+    rID = None
+    seqLines = []
+    position = start
+    while position < end:
+        line = fFile.readline()
+        if not line:
+            break
+        position = position+len(line)
+        if line.startswith(">"):
+            if rID is not None:
+                yield rID, "".join(seqLines)
+            header = line[1:].split(None, 1)
+            if len(header) > 0:
+                rID = header[0]
+            else:
+                rID = ""
+            seqLines = []
+        elif rID is not None:
+            seqLines.append(line.strip())
+    if rID is not None:
+        yield rID, "".join(seqLines)
+    fFile.close()
+
+# worker: returns [(ID, matches)] for the records of one chunk
+def searchChunk(args):
+    infileName, start, end, pattern = args
+    prog = re.compile(pattern)
+    chunkResults = []
+    for rID, seq in readChunkRecords(infileName, start, end):
+        result = prog.findall(seq)
+        if len(result) > 0:
+            chunkResults.append((rID, result))
+    return chunkResults
+
+# same output as searchRegexp, chunks are scanned by a pool of processes and their results are read back in file order
+def searchRegexpParallel(pattern, infileName, processes):
+    chunks = getFastaChunks(infileName, processes*4)
+    print "Scanning '"+infileName+"' in "+str(len(chunks))+" chunks with "+str(processes)+" processes."
+    pool = multiprocessing.Pool(processes)
+    idList = []
+    for chunkResults in pool.imap(searchChunk, [(infileName, start, end, pattern) for start, end in chunks]):
+        for rID, result in chunkResults:
+            print "Found "+str(len(result))+" matches in '"+str(rID)+"':"
+            for match in result:
+                print match
+            idList.append(rID)
+    pool.close()
+    pool.join()
+    print "Found "+str(len(idList))+" sequences with match(es)."
+    return idList
                     
-def getUniqueRecords(recordList):
-    newRecordList = []
-    idCount = 0
-    for record in recordList:
-        newID = "sequence_"+str(idCount)
-        idCount = idCount+1
-        newRecord = SeqRecord(seq=record.seq, id=newID, name=record.name, description=record.description)
-        newRecordList.append(newRecord)
-    return newRecordList
-
-def getRecordList(infileName):
-    records = list(Bio.SeqIO.parse(infileName, "fasta"))
-    print "Reading Input file '"+str(infileName)+"': "+str(len(records))+" sequence(s)."
-    return records
+IUPAC_CODES = {"A":"A", "C":"C", "G":"G", "T":"T", "U":"T", "R":"AG", "Y":"CT", "S":"CG", "W":"AT", "K":"GT", "M":"AC", "B":"CGT", "D":"AGT", "H":"ACT", "V":"ACG", "N":"ACGT"}
+COMPLEMENT = string.maketrans("ACGTURYSWKMBDHVN[]", "TGCAAYRSWMKVHDBN][")
+# consensus motifs matching more k-mers than this are searched with a regexp instead of the automaton
+MAX_MOTIF_KMERS = 50000
+# scanner used by the motif scanning processes, set by setMotifScanner
+motifScanner = None
+
+def reverseComplement(seq):
+    return seq.translate(COMPLEMENT)[::-1]
+
+def getMotifs(motifArg):
+    if os.path.isfile(motifArg):
+        mFile = open(motifArg, "r")
+        motifs = [line.strip().upper() for line in mFile if not line.isspace() and not line.startswith("#")]
+        mFile.close()
+    else:
+        motifs = [motif.strip().upper() for motif in motifArg.split(",") if motif.strip() != ""]
+    for motif in motifs:
+        for base in motif:
+            if not base in IUPAC_CODES:
+                sys.exit("Invalid IUPAC code '"+base+"' in motif '"+motif+"'.")
+    print "Reading motifs: "+str(len(motifs))+" motif(s)."
+    return motifs
+
+def getKmerNumber(motif):
+    kmerNumber = 1
+    for base in motif:
+        kmerNumber = kmerNumber*len(IUPAC_CODES[base])
+    return kmerNumber
+
+def expandMotif(motif):
+    return ["".join(kmer) for kmer in itertools.product(*[IUPAC_CODES[base] for base in motif])]
+
+# Aho-Corasick automaton: all k-mers (both strands) are found in one pass over the sequence
+# returns (transitions, outputs): transitions[state][base] = next state, outputs[state] = [(motif, strand, length)]
+def getAutomaton(kmerList):
+    goto = [{}]
+    outputs = [[]]
+    for kmer, label in kmerList:
+        state = 0
+        for base in kmer:
+            if not base in goto[state]:
+                goto.append({})
+                outputs.append([])
+                goto[state][base] = len(goto)-1
+            state = goto[state][base]
+        outputs[state].append(label)
+    fail = [0]*len(goto)
+    transitions = [None]*len(goto)
+    transitions[0] = {}
+    for base in "ACGT":
+        transitions[0][base] = goto[0].get(base, 0)
+    queue = [goto[0][base] for base in goto[0]]
+    while len(queue) > 0:
+        state = queue.pop(0)
+        outputs[state] = outputs[state]+outputs[fail[state]]
+        transitions[state] = {}
+        for base in "ACGT":
+            if base in goto[state]:
+                nextState = goto[state][base]
+                fail[nextState] = transitions[fail[state]][base]
+                transitions[state][base] = nextState
+                queue.append(nextState)
+            else:
+                transitions[state][base] = transitions[fail[state]][base]
+    return transitions, outputs
+
+def getMotifRegexp(motif):
+    return re.compile("(?=("+"".join(["["+IUPAC_CODES[base]+"]" for base in motif])+"))")
+
+# returns (automaton, regexps): k-mers of small motifs go into the automaton, large degenerate motifs are searched with regexps
+def getMotifScanner(motifs):
+    kmerList = []
+    regexps = []
+    for motif in motifs:
+        if getKmerNumber(motif) > MAX_MOTIF_KMERS:
+            regexps.append((getMotifRegexp(motif), (motif, "+", len(motif))))
+            regexps.append((getMotifRegexp(reverseComplement(motif)), (motif, "-", len(motif))))
+            continue
+        for kmer in expandMotif(motif):
+            kmerList.append((kmer, (motif, "+", len(motif))))
+            kmerList.append((reverseComplement(kmer), (motif, "-", len(motif))))
+    return getAutomaton(kmerList), regexps
+
+# returns hits as (start, end, motif, strand), 0-based coordinates
+def scanMotifs(seq, scanner):
+    (transitions, outputs), regexps = scanner
+    seq = seq.upper()
+    hits = []
+    state = 0
+    for i, base in enumerate(seq):
+        if base in "ACGT":
+            state = transitions[state][base]
+        else:
+            state = 0
+            continue
+        for motif, strand, length in outputs[state]:
+            hits.append((i-length+1, i+1, motif, strand))
+    for prog, (motif, strand, length) in regexps:
+        for match in prog.finditer(seq):
+            hits.append((match.start(), match.start()+length, motif, strand))
+    hits.sort()
+    return hits
+
+def setMotifScanner(motifs):
+    global motifScanner
+    motifScanner = getMotifScanner(motifs)
+
+# worker: returns the BED lines of the motif hits in one chunk
+def scanMotifChunk(args):
+    infileName, start, end = args
+    chunkLines = []
+    for rID, seq in readChunkRecords(infileName, start, end):
+        for hitStart, hitEnd, motif, strand in scanMotifs(seq, motifScanner):
+            chunkLines.append(rID+"\t"+str(hitStart)+"\t"+str(hitEnd)+"\t"+motif+"\t0\t"+strand)
+    return chunkLines
+
+def writeMotifHits(infileName, motifs, processes, outName = "motif_hits.bed"):
+    outFile = open(outName, "w", 1048576)
+    lineCount = 0
+    if processes > 1:
+        chunks = getFastaChunks(infileName, processes*4)
+        print "Scanning '"+infileName+"' in "+str(len(chunks))+" chunks with "+str(processes)+" processes."
+        pool = multiprocessing.Pool(processes, setMotifScanner, (motifs,))
+        chunkResults = pool.imap(scanMotifChunk, [(infileName, start, end) for start, end in chunks])
+    else:
+        setMotifScanner(motifs)
+        chunkResults = [scanMotifChunk((infileName, 0, os.path.getsize(infileName)))]
+    for chunkLines in chunkResults:
+        for line in chunkLines:
+            outFile.write(line+"\n")
+        lineCount = lineCount+len(chunkLines)
+    if processes > 1:
+        pool.close()
+        pool.join()
+    outFile.flush()
+    outFile.close()
+    print "Writing file '"+outName+"': "+str(lineCount)+" motif hits."
+
+# size of the blocks copied from the input to the output
+COPY_BLOCK_SIZE = 4194304
+HEADER_PROG = re.compile("^>([^\r\n]*)", re.M)
+
+def openFasta(fileName, mode):
+    if fileName.endswith(".gz"):
+        return gzip.open(fileName, mode)
+    return open(fileName, mode, COPY_BLOCK_SIZE)
+
+# streams the fasta file by blocks cut on line ends, headers become '>sequence_N <old header>' and sequence lines are copied unchanged
+def writeUniqueRecords(infileName, outName = "output.fasta", idMapFile = "none"):
+    inFile = openFasta(infileName, "rb")
+    outFile = openFasta(outName, "wb")
+    mapFile = None
+    if not idMapFile == "none":
+        mapFile = open(idMapFile, "w")
+    idCount = [0]
+    def renameHeader(match):
+        oldHeader = match.group(1)
+        newID = "sequence_"+str(idCount[0])
+        idCount[0] = idCount[0]+1
+        if mapFile is not None:
+            oldID = oldHeader.split(None, 1)
+            if len(oldID) > 0:
+                oldID = oldID[0]
+            else:
+                oldID = ""
+            mapFile.write(oldID+"\t"+newID+"\n")
+        return ">"+newID+" "+oldHeader
+    # only a partial header line is kept for the next block, sequence lines are written up to the end of each block
+    remainder = ""
+    atLineStart = True
+    while True:
+        block = inFile.read(COPY_BLOCK_SIZE)
+        if not block:
+            break
+        if not atLineStart:
+            cut = block.find("\n")+1
+            if cut == 0:
+                outFile.write(block)
+                continue
+            outFile.write(block[:cut])
+            block = block[cut:]
+        block = remainder+block
+        cut = block.rfind("\n")+1
+        remainder = ""
+        atLineStart = True
+        if block.startswith(">", cut):
+            remainder = block[cut:]
+            block = block[:cut]
+        elif cut < len(block):
+            atLineStart = False
+        if ">" in block:
+            block = HEADER_PROG.sub(renameHeader, block)
+        outFile.write(block)
+    if remainder != "":
+        outFile.write(HEADER_PROG.sub(renameHeader, remainder))
+    inFile.close()
+    outFile.close()
+    if mapFile is not None:
+        mapFile.close()
+        print "Writing ID map '"+idMapFile+"'."
+    print "Writing Output File:'"+outName+"': "+str(idCount[0])+" sequence(s)."
 
 def parsePeakNumber(peakID, expName):
     peakNum = peakID.split(expName+"_")[1]
@@ -116,26 +415,47 @@ def writeRecords(recordList, outName = "output.fasta"):
     print "Writing Output File:'"+outName+"'."
     Bio.SeqIO.write(recordList, outName, "fasta")
 
-def getRecordListFromIDs(recordList, idList, parseIDs = False, expName = "peak"):
+# record keys in the order of the fasta file (offsets of the index)
+def getIndexKeys(infileName):
+    connection = sqlite3.connect(infileName+".idx")
+    keys = [str(row[0]) for row in connection.execute("SELECT key FROM offset_data ORDER BY file_number, offset")]
+    connection.close()
+    return keys
+
+# returns the normalized ID, None if it does not contain the separator
+def getNormalizedID(seqID, parseIDs = False, expName = "peak"):
+    if parseIDs == True:
+        if not expName+"_" in seqID:
+            return None
+        return parsePeakNumber(seqID.strip(), expName).strip()
+    return str(seqID).strip()
+
+# IDs of the list are normalized once and looked up in a hashmap while reading the record keys in the order of the fasta file,
+# every record matching an ID is kept (with '-p', 'expA_peak_5' and 'expB_peak_5' both match '5'), only these records are read from the fasta file
+def getRecordListFromIDs(recordIndex, recordKeys, idList, parseIDs = False, expName = "peak"):
+    if len(recordKeys) > 0 and len(idList) > 0:
+        print "Sequence file ID is like: "+str(recordKeys[0])
+        print "List ID is like: "+str(idList[0]).strip()
+        if parseIDs == True:
+            print "Parsing IDs using '"+expName+"_' as separator."
+    normIDs = set()
+    skippedIDs = 0
+    for seqID in idList:
+        normID = getNormalizedID(seqID, parseIDs, expName)
+        if normID is None:
+            skippedIDs = skippedIDs+1
+        else:
+            normIDs.add(normID)
     records = []
-    displayID = True
-    for record in recordList:       
-        if displayID == True:
-            print "Sequence file ID is like: "+str(record.id)
-            print "List ID is like: "+str(idList[0])
-            if parseIDs == True:
-                print "Parsing IDs using '"+expName+"_' as separator."
-            displayID = False
-        for seqID in idList:
-            if parseIDs == True:
-                id1 = parsePeakNumber(record.id, expName)
-                id2 = parsePeakNumber(seqID, expName)
-            else:
-                id1 = str(record.id).strip()
-                id2 = str(seqID).strip()
-            if id1 == id2:
-                print id1,id2
-                records.append(record)
+    skippedKeys = 0
+    for key in recordKeys:
+        normID = getNormalizedID(key, parseIDs, expName)
+        if normID is None:
+            skippedKeys = skippedKeys+1
+        elif normID in normIDs:
+            records.append(recordIndex[key])
+    if skippedIDs > 0 or skippedKeys > 0:
+        print "Skipped "+str(skippedIDs)+" list ID(s) and "+str(skippedKeys)+" sequence ID(s) without the '"+expName+"_' separator."
     print "Found "+str(len(records))+" sequences matching IDs."
     return records
 
@@ -148,20 +468,27 @@ def writeList(inList, outName):
     outFile.close()
                        
 if __name__ == '__main__':
-    infileName, pattern, queryType, idFile, parseIDs, expName = get_params(sys.argv[1:])
+    infileName, pattern, queryType, idFile, parseIDs, expName, processes, gzipOutput, idMapFile = get_params(sys.argv[1:])
     if infileName == "none" or queryType == "none":
         sys.exit(progHelp)  
-    if queryType == "regexp":
+    if queryType == "regexp" and processes > 1:
+        idList = searchRegexpParallel(pattern, infileName, processes)
+        writeList(idList, "sequences_with_pattern.txt")
+    elif queryType == "regexp":
         recordDic = getRecordDic(infileName)
         idList = searchRegexp(pattern, recordDic)
         writeList(idList, "sequences_with_pattern.txt")
+    if queryType == "motifs":
+        motifs = getMotifs(pattern)
+        writeMotifHits(infileName, motifs, processes)
     if queryType == "uniqueIDs":
-        oldRecordList = getRecordList(infileName)
-        recordList = getUniqueRecords(oldRecordList)
-        writeRecords(recordList)
+        if gzipOutput == True:
+            writeUniqueRecords(infileName, "output.fasta.gz", idMapFile)
+        else:
+            writeUniqueRecords(infileName, "output.fasta", idMapFile)
     if queryType == "getSequences":
-        recordList = getRecordList(infileName)
+        recordIndex = getRecordIndex(infileName)
         idList = getIDList(idFile)
-        records = getRecordListFromIDs(recordList, idList, parseIDs, expName)
+        records = getRecordListFromIDs(recordIndex, getIndexKeys(infileName), idList, parseIDs, expName)
         writeRecords(records, "retrieved_sequences.fasta")      
     print "Finished."     
\ No newline at end of file
@@ -0,0 +1,270 @@
+'''
+Peak sequences from a 2bit genome.
+'''
+
+# Writes the sequences of BED entries from a genome stored in 2bit format (UCSC format, memory-mapped: no parsing at query time).
+# Requires:
+# -numpy: http://www.numpy.org/
+# Arguments:
+# -g <genome.2bit>, genome in 2bit format.
+# Options (choose one):
+# -c <genome.fasta>, converts the genome fasta file into the '-g' 2bit file (to do once per genome), letters other than A, C, G, T (IUPAC codes) are written as N.
+# -b <peaks.bed>, writes the sequence of each entry of the BED file in 'peaks.fasta' (sequence ID: name field, or chr:start-end).
+# Optional:
+# -s <N(integer)>, only with '-b', writes the sequence of the center of each entry +/- N (summit +/- N with a MACS summits file).
+# -t <processes(integer)>, only with '-b', number of processes extracting sequences (they share the memory-mapped genome).
+#
+#Examples:
+# Converts the genome once:
+#python getFromGenome.py -g hg19.2bit -c hg19.fa
+# Writes the sequences of the summits +/- 50bp:
+#python getFromGenome.py -g hg19.2bit -b chip_mitf_summits.bed -s 50
+
+import sys
+import getopt
+import os
+import mmap
+import struct
+import tempfile
+import shutil
+import multiprocessing
+import numpy as np
+
+progHelp = "Writes the sequences of BED entries from a genome stored in 2bit format (UCSC format, memory-mapped: no parsing at query time).\nRequires:\n -numpy: http://www.numpy.org/\nArguments:\n -g <genome.2bit>, genome in 2bit format.\nOptions (choose one):\n -c <genome.fasta>, converts the genome fasta file into the '-g' 2bit file (to do once per genome), letters other than A, C, G, T (IUPAC codes) are written as N.\n -b <peaks.bed>, writes the sequence of each entry of the BED file in 'peaks.fasta' (sequence ID: name field, or chr:start-end).\nOptional:\n -s <N(integer)>, only with '-b', writes the sequence of the center of each entry +/- N (summit +/- N with a MACS summits file).\n -t <processes(integer)>, only with '-b', number of processes extracting sequences (they share the memory-mapped genome).\n\nExamples:\nConverts the genome once:\npython getFromGenome.py -g hg19.2bit -c hg19.fa\nWrites the sequences of the summits +/- 50bp:\npython getFromGenome.py -g hg19.2bit -b chip_mitf_summits.bed -s 50"
+
+def get_params(argv):
+    try:
+        opts, args = getopt.getopt(argv, "g:c:b:s:t:", ["genome", "fastaFile", "bedFile", "summitWindow", "processes"])
+    except getopt.GetoptError:
+        sys.exit("Invalid argument:\n"+progHelp)
+    genomeFile = "none"
+    queryType = "none"
+    fastaFile = "none"
+    bedFile = "none"
+    summitWindow = "none"
+    processes = 1
+    for opt,arg in opts:
+        if opt == '-g':
+            genomeFile = arg
+        if opt == '-c':
+            fastaFile = arg
+            queryType = "convert"
+        if opt == '-b':
+            bedFile = arg
+            queryType = "sequences"
+        if opt == '-s':
+            summitWindow = int(arg)
+        if opt == '-t':
+            processes = int(arg)
+    return genomeFile, queryType, fastaFile, bedFile, summitWindow, processes
+
+TWOBIT_SIGNATURE = 0x1A412743
+# 2bit base codes: T=0, C=1, A=2, G=3. Any other letter (N, IUPAC codes such as R, Y, K, M, S, W) is packed as T and covered
+# by an N block, so it is read back as N (n if lower case), as with UCSC faToTwoBit
+PACK_TABLE = np.zeros(256, dtype=np.uint8)
+IS_ACGT = np.zeros(256, dtype=np.bool_)
+for base, code in (("T", 0), ("C", 1), ("A", 2), ("G", 3)):
+    PACK_TABLE[ord(base)] = code
+    PACK_TABLE[ord(base.lower())] = code
+    IS_ACGT[ord(base)] = True
+    IS_ACGT[ord(base.lower())] = True
+# UNPACK_TABLE[byte] = the four bases packed in the byte
+UNPACK_TABLE = np.array([[ord("TCAG"[(byte >> shift) & 3]) for shift in (6, 4, 2, 0)] for byte in range(256)], dtype=np.uint8)
+FASTA_LINE_WIDTH = 60
+
+# returns (starts, sizes) of the runs of True in a boolean array
+def getRuns(mask):
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends-starts
+
+# returns the 2bit record of one sequence (size, N blocks, lower case (mask) blocks, reserved field and packed bases)
+# and the number of letters other than A, C, G, T and N written as N
+def getTwoBitRecord(seq):
+    bases = np.frombuffer(seq, dtype=np.uint8)
+    nMask = ~IS_ACGT[bases]
+    otherCount = int(np.count_nonzero(nMask & (bases != ord("N")) & (bases != ord("n"))))
+    nStarts, nSizes = getRuns(nMask)
+    maskStarts, maskSizes = getRuns(bases >= ord("a"))
+    codes = PACK_TABLE[bases]
+    padding = (-len(codes)) % 4
+    if padding > 0:
+        codes = np.concatenate((codes, np.zeros(padding, dtype=np.uint8)))
+    codes = codes.reshape(-1, 4)
+    packed = (codes[:,0] << 6) | (codes[:,1] << 4) | (codes[:,2] << 2) | codes[:,3]
+    header = struct.pack("<II", len(bases), len(nStarts))+nStarts.astype("<u4").tostring()+nSizes.astype("<u4").tostring()
+    header = header+struct.pack("<I", len(maskStarts))+maskStarts.astype("<u4").tostring()+maskSizes.astype("<u4").tostring()+struct.pack("<I", 0)
+    return header+packed.astype(np.uint8).tostring(), otherCount
+
+# yields (name, sequence) one sequence at a time
+def readFastaSequences(fastaFile):
+    fFile = open(fastaFile, "r", 1048576)
+    name = None
+    seqLines = []
+    for line in fFile:
+        if line.startswith(">"):
+            if name is not None:
+                yield name, "".join(seqLines)
+            name = line[1:].split()[0]
+            seqLines = []
+        elif name is not None:
+            seqLines.append(line.strip())
+    if name is not None:
+        yield name, "".join(seqLines)
+    fFile.close()
+
+# records are written to a temporary file first since the index (at the beginning of the file) needs their offsets
+def writeTwoBit(fastaFile, genomeFile):
+    recordFile = tempfile.TemporaryFile()
+    names = []
+    recordSizes = []
+    for name, seq in readFastaSequences(fastaFile):
+        record, otherCount = getTwoBitRecord(seq)
+        recordFile.write(record)
+        names.append(name)
+        recordSizes.append(len(record))
+        if otherCount > 0:
+            print "Converting '"+name+"': "+str(len(seq))+"pb, "+str(otherCount)+" IUPAC or other letters written as N."
+        else:
+            print "Converting '"+name+"': "+str(len(seq))+"pb."
+    gFile = open(genomeFile, "wb")
+    gFile.write(struct.pack("<IIII", TWOBIT_SIGNATURE, 0, len(names), 0))
+    offset = 16+sum([1+len(name)+4 for name in names])
+    for name, recordSize in zip(names, recordSizes):
+        if offset > 0xFFFFFFFF:
+            sys.exit("Genome too large for the 2bit format.")
+        gFile.write(struct.pack("<B", len(name))+name+struct.pack("<I", offset))
+        offset = offset+recordSize
+    recordFile.seek(0)
+    shutil.copyfileobj(recordFile, gFile, 16777216)
+    recordFile.close()
+    gFile.close()
+    print "Writing '"+genomeFile+"': "+str(len(names))+" sequences."
+
+# returns (memory map, hashmap: key = sequence name, value = record offset); records are parsed on first use
+def openTwoBit(genomeFile):
+    gFile = open(genomeFile, "rb")
+    genomeMap = mmap.mmap(gFile.fileno(), 0, access=mmap.ACCESS_READ)
+    gFile.close()
+    signature, version, seqCount, reserved = struct.unpack("<IIII", genomeMap[0:16])
+    if signature != TWOBIT_SIGNATURE:
+        sys.exit("'"+genomeFile+"' is not a 2bit file (or was written on a big-endian machine).")
+    offsetMap = {}
+    position = 16
+    for i in xrange(seqCount):
+        nameSize = ord(genomeMap[position])
+        name = genomeMap[position+1:position+1+nameSize]
+        offsetMap[name] = struct.unpack("<I", genomeMap[position+1+nameSize:position+5+nameSize])[0]
+        position = position+5+nameSize
+    return genomeMap, offsetMap, {}
+
+# returns (size, N starts, N ends, mask starts, mask ends, offset of the packed bases)
+def getTwoBitRecordInfo(genome, name):
+    genomeMap, offsetMap, recordCache = genome
+    if name in recordCache:
+        return recordCache[name]
+    offset = offsetMap[name]
+    seqSize, nCount = struct.unpack("<II", genomeMap[offset:offset+8])
+    offset = offset+8
+    nStarts = np.frombuffer(genomeMap[offset:offset+4*nCount], dtype="<u4").astype(np.int64)
+    nEnds = nStarts+np.frombuffer(genomeMap[offset+4*nCount:offset+8*nCount], dtype="<u4")
+    offset = offset+8*nCount
+    maskCount = struct.unpack("<I", genomeMap[offset:offset+4])[0]
+    offset = offset+4
+    maskStarts = np.frombuffer(genomeMap[offset:offset+4*maskCount], dtype="<u4").astype(np.int64)
+    maskEnds = maskStarts+np.frombuffer(genomeMap[offset+4*maskCount:offset+8*maskCount], dtype="<u4")
+    offset = offset+8*maskCount+4
+    recordCache[name] = (seqSize, nStarts, nEnds, maskStarts, maskEnds, offset)
+    return recordCache[name]
+
+# applies function to the bases of the region covered by the blocks (sorted, not overlapping)
+def applyBlocks(bases, start, end, blockStarts, blockEnds, function):
+    for i in xrange(np.searchsorted(blockEnds, start, "right"), np.searchsorted(blockStarts, end)):
+        blockStart = max(blockStarts[i], start)-start
+        blockEnd = min(blockEnds[i], end)-start
+        bases[blockStart:blockEnd] = function(bases[blockStart:blockEnd])
+
+def getSequence(genome, chrom, start, end):
+    seqSize, nStarts, nEnds, maskStarts, maskEnds, dnaOffset = getTwoBitRecordInfo(genome, chrom)
+    start = max(start, 0)
+    end = min(end, seqSize)
+    if end <= start:
+        return ""
+    packed = np.frombuffer(genome[0][dnaOffset+start/4:dnaOffset+(end+3)/4], dtype=np.uint8)
+    bases = UNPACK_TABLE[packed].ravel()[start%4:start%4+end-start]
+    applyBlocks(bases, start, end, nStarts, nEnds, lambda block: ord("N"))
+    applyBlocks(bases, start, end, maskStarts, maskEnds, lambda block: block+32)
+    return bases.tostring()
+
+# returns (sequence ID, chromosome, start, end) for each BED entry
+def getRegionList(bedFile, summitWindow = "none"):
+    bFile = open(bedFile, "r")
+    regionList = []
+    for line in bFile:
+        if line.startswith("#") or line.startswith("track") or line.startswith("browser") or line.isspace():
+            continue
+        fields = line.rstrip("\r\n").split("\t")
+        chrom = fields[0]
+        start = int(fields[1])
+        end = int(fields[2])
+        if len(fields) > 3:
+            seqID = fields[3]
+        else:
+            seqID = chrom+":"+str(start)+"-"+str(end)
+        if not summitWindow == "none":
+            center = start+(end-start)/2
+            start = center-summitWindow
+            end = center+summitWindow+1
+        regionList.append((seqID, chrom, start, end))
+    bFile.close()
+    print "Reading '"+bedFile+"': "+str(len(regionList))+" regions."
+    return regionList
+
+# genome opened by each extraction process
+processGenome = None
+
+def openProcessGenome(genomeFile):
+    global processGenome
+    processGenome = openTwoBit(genomeFile)
+
+# worker: returns the fasta text of a list of regions
+def getFastaText(regionList):
+    fastaLines = []
+    for seqID, chrom, start, end in regionList:
+        if not chrom in processGenome[1]:
+            continue
+        seq = getSequence(processGenome, chrom, start, end)
+        fastaLines.append(">"+seqID+"\n")
+        for i in xrange(0, len(seq), FASTA_LINE_WIDTH):
+            fastaLines.append(seq[i:i+FASTA_LINE_WIDTH]+"\n")
+    return "".join(fastaLines)
+
+def writeSequences(genomeFile, regionList, outName, processes = 1):
+    batchSize = 10000
+    batches = [regionList[i:i+batchSize] for i in xrange(0, len(regionList), batchSize)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, openProcessGenome, (genomeFile,))
+        fastaTexts = pool.imap(getFastaText, batches)
+    else:
+        openProcessGenome(genomeFile)
+        fastaTexts = (getFastaText(batch) for batch in batches)
+    oFile = open(outName, "w", 1048576)
+    for fastaText in fastaTexts:
+        oFile.write(fastaText)
+    oFile.close()
+    if processes > 1:
+        pool.close()
+        pool.join()
+    print "Writing '"+outName+"': "+str(len(regionList))+" sequences."
+
+if __name__ == '__main__':
+    genomeFile, queryType, fastaFile, bedFile, summitWindow, processes = get_params(sys.argv[1:])
+    if genomeFile == "none" or queryType == "none":
+        sys.exit(progHelp)
+    if queryType == "convert":
+        writeTwoBit(fastaFile, genomeFile)
+    if queryType == "sequences":
+        regionList = getRegionList(bedFile, summitWindow)
+        writeSequences(genomeFile, regionList, os.path.basename(bedFile).split(".")[0]+".fasta", processes)
+    print "Finished."
@@ -4,6 +4,8 @@ Created on 20 mai 2015
 @author: gdavidson
 '''
 #Writes the genomic locations of a MEME-found motif in bed format.
+# Requires:
+# -numpy: http://www.numpy.org/
 # Arguments:
 #-m <meme_motif.txt>, copy paste the locations from the MEME HTML output into a .txt file (example line:'1684.    hg19_ct_macs2summits_2357_sox10_peak_3016    -    49    1.24e-8    ACAACAACAC    AAAAGGCCCCTTTGT    TACGGCCCTG')
 #-p <macs_peaks.bed>, MACS predicted peaks in bed format.
@@ -11,111 +13,330 @@ Created on 20 mai 2015
 #-n <experiment name>, name of the experiment, must be the '-n' argument you used in MACS.
 # Optional:
 #-f true, if your '-m' file is an output from FiMo
+#-s <peaks.fasta>, scans the sequences of the peaks (sequence IDs: peak names) with the first motif of '-m', which is then a MEME format motif file (meme.txt). '-w' defaults to the motif width.
+#-v <p-value(float)>, only with '-s', p-value threshold of the motif hits (default: 1e-4)
+#-t <processes(integer)>, number of processes scanning the sequences (with '-s') or reading the motif files (several '-m')
+#
+# Several motifs and experiments can be processed in one run: repeat '-m' (as '-m <file>,<width>,<motif name>', width and name are optional) and repeat '-p' with the matching '-n'.
+# Each peak file is read once, each motif file is read once and its hits are sent to the experiment found in the peak IDs. Writes one '<experiment name>_<motif name>_motif.bed' file per motif and experiment with hits, motifs with the same name are numbered by their position in the command line ('<motif name>_<n>').
+#
+#Examples:
+# 2 motifs in 2 experiments:
+#python getMotifLocations.py -m sox10_fimo.txt,12,SOX10 -m mitf_fimo.txt,10,MITF -f true -p sox10_peaks.bed -n sox10 -p mitf_peaks.bed -n mitf -t 2
 
 import sys
+import os
 import getopt
+import multiprocessing
+import numpy as np
+import bedColumns
 
-progHelp = "Writes the genomic locations of a MEME-found motif in bed format.\nArguments:\n-m <meme_motif.txt>, copy paste the locations from the MEME HTML output into a .txt file (example line:'1684.    hg19_ct_macs2summits_2357_sox10_peak_3016    -    49    1.24e-8    ACAACAACAC    AAAAGGCCCCTTTGT    TACGGCCCTG')\n-p <macs_peaks.bed>, MACS predicted peaks in bed format.\n-w <motif width(integer)>, width of the motif (you can fiddle with the size)\n-n <experiment name>, name of the experiment, must be the '-n' argument you used in MACS.\nOptional:\n-f true, if your '-m' file is an output from FiMo"
+progHelp = "Writes the genomic locations of a MEME-found motif in bed format.\nArguments:\n-m <meme_motif.txt>, copy paste the locations from the MEME HTML output into a .txt file (example line:'1684.    hg19_ct_macs2summits_2357_sox10_peak_3016    -    49    1.24e-8    ACAACAACAC    AAAAGGCCCCTTTGT    TACGGCCCTG')\n-p <macs_peaks.bed>, MACS predicted peaks in bed format.\n-w <motif width(integer)>, width of the motif (you can fiddle with the size)\n-n <experiment name>, name of the experiment, must be the '-n' argument you used in MACS.\nOptional:\n-f true, if your '-m' file is an output from FiMo\n-s <peaks.fasta>, scans the sequences of the peaks (sequence IDs: peak names) with the first motif of '-m', which is then a MEME format motif file (meme.txt). '-w' defaults to the motif width.\n-v <p-value(float)>, only with '-s', p-value threshold of the motif hits (default: 1e-4)\n-t <processes(integer)>, number of processes scanning the sequences (with '-s') or reading the motif files (several '-m')\n\nSeveral motifs and experiments can be processed in one run: repeat '-m' (as '-m <file>,<width>,<motif name>', width and name are optional) and repeat '-p' with the matching '-n'.\nEach peak file is read once, each motif file is read once and its hits are sent to the experiment found in the peak IDs. Writes one '<experiment name>_<motif name>_motif.bed' file per motif and experiment with hits, motifs with the same name are numbered by their position in the command line ('<motif name>_<n>').\n\nExamples:\n2 motifs in 2 experiments:\npython getMotifLocations.py -m sox10_fimo.txt,12,SOX10 -m mitf_fimo.txt,10,MITF -f true -p sox10_peaks.bed -n sox10 -p mitf_peaks.bed -n mitf -t 2"
 
 def get_params(argv):
     try:
-        opts, args = getopt.getopt(argv, "m:p:w:n:f:", ["memeFile", "peakFile", "motifWidth", "expName","fimo"])
+        opts, args = getopt.getopt(argv, "m:p:w:n:f:s:v:t:", ["memeFile", "peakFile", "motifWidth", "expName","fimo","sequenceFile","pValue","processes"])
     except getopt.GetoptError:
         sys.exit("Invalid argument:\n"+progHelp)
-    memeFile = "none"
-    peakFile = "none"
+    motifList = []
+    peakFiles = []
     motifWidth = "none"
-    expName = "none"
+    expNames = []
     fimo = False
+    sequenceFile = "none"
+    pValue = 1e-4
+    processes = 1
     for opt,arg in opts:
         if opt =='-m':
-            memeFile = arg
+            motifList.append(str(arg).split(","))
         if opt =="-p":
-            peakFile = arg
+            peakFiles.append(arg)
         if opt == "-w":
             motifWidth = arg
         if opt == "-n":
-            expName = arg
+            expNames.append(arg)
         if opt == "-f":
-            fimo = True  
-    return memeFile, peakFile, motifWidth, expName, fimo
+            fimo = True
+        if opt == "-s":
+            sequenceFile = arg
+        if opt == "-v":
+            pValue = float(arg)
+        if opt == "-t":
+            processes = int(arg)
+    motifs = []
+    for motif in motifList:
+        width = motifWidth
+        name = os.path.basename(motif[0]).split(".")[0]
+        if len(motif) > 1 and motif[1] != "":
+            width = motif[1]
+        if len(motif) > 2:
+            name = motif[2]
+        motifs.append((motif[0], width, name))
+    # two motifs with the same name (e.g. two 'meme.txt' files) would write to the same output files
+    names = [name for memeFile, width, name in motifs]
+    for i in xrange(len(motifs)):
+        memeFile, width, name = motifs[i]
+        if names.count(name) > 1:
+            motifs[i] = (memeFile, width, name+"_"+str(i+1))
+    return motifs, peakFiles, expNames, fimo, sequenceFile, pValue, processes
 
 def parsePeakNumber(peakID, expName):
     peakNum = peakID.split(expName+"_")[1]
     return peakNum
 
-# returns hashmap: key = peak number, value = list of motif starts     
-def getMotifPeakLocationMap(memeFile, expName, fimo = False):
-    mFile = open(memeFile, "r")
-    memeMap = {}
-    printBool = True
+# yields (peak ID, motif start) for each line of the MEME/FiMo file
+def readMotifHits(memeFile, fimo = False):
+    mFile = open(memeFile, "r", 1048576)
+    if fimo == True:
+        print "File from FiMo, reading motif start in column 3."
+        startField = 2
+    else:
+        print "File from MEME, reading motif start in column 4."
+        startField = 3
     for line in mFile:
-        if line.startswith("#"):
+        if line.startswith("#") or line.isspace():
             continue
-        peakID = str(line).split("\t")[1]
-        if fimo == True:
-            motifStart = str(line).split("\t")[2]
-            if printBool == True:
-                print "File from FiMo, reading motif start in column 3."
-                printBool = False
-        else:
-            motifStart = str(line).split("\t")[3]
-            if printBool == True:
-                print "File from MEME, reading motif start in column 4."
-                printBool = False
-        peakNum = str(parsePeakNumber(peakID, expName)).strip()
-        if not peakNum in memeMap:
-            memeMap[peakNum] = [motifStart]
-        else:
-            starts = memeMap[peakNum]
-            starts.append(motifStart)
-            memeMap[peakNum] = starts
-            
-    print "Reading meme output '"+str(memeFile)+"': motif found in "+str(len(memeMap))+" sequences."
-    return memeMap
-
-def getPeaksWithMotif(peakFile, memeMap, expName):
-    pFile = open(peakFile, "r")
-    peakList = []
-    for line in pFile:
-        if str(line).startswith("#") or str(line).startswith("track"):
+        fields = line.split("\t", startField+1)
+        yield fields[1], int(fields[startField])
+    mFile.close()
+
+# log-odds scores are rounded to 1/SCORE_SCALE bits to compute the exact score distribution
+SCORE_SCALE = 100
+PSEUDOCOUNT = 0.1
+# base index in the position weight matrix, other letters (N) get index 4 and can not be part of a hit
+BASE_INDEX = np.zeros(256, dtype=np.int64)+4
+for base, index in (("A", 0), ("C", 1), ("G", 2), ("T", 3)):
+    BASE_INDEX[ord(base)] = index
+    BASE_INDEX[ord(base.lower())] = index
+# scanning matrices and score threshold used by the scanning processes, set by setMotifMatrices
+motifMatrices = None
+
+# returns (motif name, probability matrix (width x ACGT), number of sites, background frequencies) of the first motif of a MEME file
+def getMemeMotif(motifFile):
+    mFile = open(motifFile, "r")
+    lines = mFile.readlines()
+    mFile.close()
+    background = np.array([0.25, 0.25, 0.25, 0.25])
+    motifName = "none"
+    for i, line in enumerate(lines):
+        if line.startswith("Background letter frequencies"):
+            fields = lines[i+1].split()
+            frequencies = dict(zip(fields[0::2], [float(field) for field in fields[1::2]]))
+            background = np.array([frequencies[base] for base in "ACGT"])
+        if line.startswith("MOTIF"):
+            motifName = line.split()[1]
+        if line.strip().startswith("letter-probability matrix") and motifName != "none":
+            header = line.split(":", 1)[1].replace("= ", "=").split()
+            header = dict([field.split("=") for field in header if "=" in field])
+            width = int(header["w"])
+            siteNumber = float(header.get("nsites", 20))
+            matrix = np.array([[float(field) for field in row.split()] for row in lines[i+1:i+1+width]])
+            print "Reading MEME motif '"+motifName+"' from '"+motifFile+"': width "+str(width)+"."
+            return motifName, matrix, siteNumber, background
+    sys.exit("No motif found in MEME file '"+motifFile+"'.")
+
+# returns the scaled log-odds matrix (width x ACGTN) and the score threshold reaching the p-value
+def getScoreMatrix(matrix, siteNumber, background, pValue):
+    probabilities = (matrix*siteNumber+PSEUDOCOUNT*background)/(siteNumber+PSEUDOCOUNT)
+    scores = np.round(np.log2(probabilities/background)*SCORE_SCALE).astype(np.int64)
+    # exact distribution of the scores of random sequences (background model), one column at a time
+    minScore = 0
+    distribution = np.ones(1)
+    for column in scores:
+        columnMin = column.min()
+        newDistribution = np.zeros(len(distribution)+column.max()-columnMin)
+        for baseScore, frequency in zip(column, background):
+            shift = baseScore-columnMin
+            newDistribution[shift:shift+len(distribution)] += distribution*frequency
+        distribution = newDistribution
+        minScore = minScore+columnMin
+    survival = np.cumsum(distribution[::-1])[::-1]
+    passing = np.flatnonzero(survival <= pValue)
+    if len(passing) == 0:
+        sys.exit("No score reaches the p-value "+str(pValue)+" with this motif.")
+    threshold = minScore+passing[0]
+    forbidden = np.zeros((len(scores), 1), dtype=np.int64)-SCORE_SCALE*1000*len(scores)
+    return np.hstack((scores, forbidden)), threshold
+
+def setMotifMatrices(scoreMatrix, threshold):
+    global motifMatrices
+    reverseMatrix = np.hstack((scoreMatrix[::-1, 3::-1], scoreMatrix[::-1, 4:]))
+    motifMatrices = (scoreMatrix, reverseMatrix, threshold)
+
+# returns the 1-based starts (as in FiMo output) of the hits on both strands
+def scanSequence(seq, scoreMatrix, reverseMatrix, threshold):
+    width = len(scoreMatrix)
+    positionNumber = len(seq)-width+1
+    if positionNumber <= 0:
+        return []
+    indexes = BASE_INDEX[np.frombuffer(seq, dtype=np.uint8)]
+    forwardScores = np.zeros(positionNumber, dtype=np.int64)
+    reverseScores = np.zeros(positionNumber, dtype=np.int64)
+    for j in xrange(width):
+        window = indexes[j:j+positionNumber]
+        forwardScores += scoreMatrix[j][window]
+        reverseScores += reverseMatrix[j][window]
+    hits = np.sort(np.concatenate((np.flatnonzero(forwardScores >= threshold), np.flatnonzero(reverseScores >= threshold))))
+    return [str(start+1) for start in hits]
+
+# worker: returns [(sequence ID, hit starts)] for a list of sequences
+def scanSequences(sequenceList):
+    scoreMatrix, reverseMatrix, threshold = motifMatrices
+    results = []
+    for seqID, seq in sequenceList:
+        starts = scanSequence(seq, scoreMatrix, reverseMatrix, threshold)
+        if len(starts) > 0:
+            results.append((seqID, starts))
+    return results
+
+# yields lists of (ID, sequence)
+def readFastaBatches(fastaFile, batchSize = 1000):
+    fFile = open(fastaFile, "r", 1048576)
+    batch = []
+    seqID = None
+    seqLines = []
+    for line in fFile:
+        if line.startswith(">"):
+            if seqID is not None:
+                batch.append((seqID, "".join(seqLines)))
+                if len(batch) == batchSize:
+                    yield batch
+                    batch = []
+            seqID = line[1:].split()[0]
+            seqLines = []
+        elif seqID is not None:
+            seqLines.append(line.strip())
+    if seqID is not None:
+        batch.append((seqID, "".join(seqLines)))
+    if len(batch) > 0:
+        yield batch
+    fFile.close()
+
+# yields (peak ID, motif start) for each hit found by scanning the sequences with the motif
+def scanMotifHits(scoreMatrix, threshold, sequenceFile, processes = 1):
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, setMotifMatrices, (scoreMatrix, threshold))
+        batchResults = pool.imap(scanSequences, readFastaBatches(sequenceFile))
+    else:
+        setMotifMatrices(scoreMatrix, threshold)
+        batchResults = (scanSequences(batch) for batch in readFastaBatches(sequenceFile))
+    for results in batchResults:
+        for seqID, starts in results:
+            for motifStart in starts:
+                yield seqID, int(motifStart)
+    if processes > 1:
+        pool.close()
+        pool.join()
+
+# returns the peak file columns and hashmap: key = peak number, value = row of the peak, peaks are read once into arrays
+def getPeakIndex(peakFile, expName):
+    peakColumns = bedColumns.readBedColumns(peakFile)
+    peakColumns["name"] = np.char.strip(peakColumns["name"])
+    rowMap = {}
+    for row, peakID in enumerate(peakColumns["name"]):
+        if expName+"_" in peakID:
+            rowMap[str(parsePeakNumber(peakID, expName)).strip()] = row
+    print "Indexing peakfile '"+str(peakFile)+"': "+str(len(rowMap))+" peaks."
+    return peakColumns, rowMap
+
+# motif coordinates of a batch of hits are computed at once from the rows of their peaks
+def writeMotifBatch(outFile, peakColumns, rows, motifStarts, motifWidth):
+    rows = np.array(rows, dtype=np.int64)
+    newStarts = peakColumns["start"][rows]+np.array(motifStarts, dtype=np.int64)
+    chromNames = peakColumns["chromNames"]
+    chroms = [chromNames[code] for code in peakColumns["chrom"][rows]]
+    lines = zip(chroms, newStarts.tolist(), (newStarts+int(motifWidth)).tolist(), peakColumns["name"][rows].tolist())
+    outFile.write("".join([chrom+"\t"+str(start)+"\t"+str(end)+"\t"+peakID+"\n" for chrom, start, end, peakID in lines]))
+
+# hits are written as they are read, only the peak indexes are kept in memory
+# experiments: list of (experiment name, peak columns, peak number to row hashmap), each hit goes to the experiments named in its peak ID
+# an output file is only created once a hit is written to it, unless writeEmpty (single motif and experiment)
+def writeMotifLocations(motifHits, experiments, motifWidth, outfileNames, batchSize = 10000, writeEmpty = False):
+    outFiles = [None]*len(outfileNames)
+    if writeEmpty == True:
+        outFiles = [open(outfileName, "w", 1048576) for outfileName in outfileNames]
+    peaksWithMotif = [np.zeros(bedColumns.getRowNumber(peakColumns), dtype=bool) for expName, peakColumns, rowMap in experiments]
+    rowBatches = [[] for experiment in experiments]
+    startBatches = [[] for experiment in experiments]
+    lineCounts = [0]*len(experiments)
+    hitCount = 0
+    for peakID, motifStart in motifHits:
+        hitCount = hitCount+1
+        for i, (expName, peakColumns, rowMap) in enumerate(experiments):
+            if not expName+"_" in peakID:
+                continue
+            peakNum = str(parsePeakNumber(peakID, expName)).strip()
+            if not peakNum in rowMap:
+                continue
+            rowBatches[i].append(rowMap[peakNum])
+            startBatches[i].append(motifStart)
+            if len(rowBatches[i]) == batchSize:
+                if outFiles[i] is None:
+                    outFiles[i] = open(outfileNames[i], "w", 1048576)
+                writeMotifBatch(outFiles[i], peakColumns, rowBatches[i], startBatches[i], motifWidth)
+                peaksWithMotif[i][rowBatches[i]] = True
+                lineCounts[i] = lineCounts[i]+len(rowBatches[i])
+                rowBatches[i] = []
+                startBatches[i] = []
+    print "Reading motif hits: "+str(hitCount)+" hits."
+    for i, (expName, peakColumns, rowMap) in enumerate(experiments):
+        if len(rowBatches[i]) > 0:
+            if outFiles[i] is None:
+                outFiles[i] = open(outfileNames[i], "w", 1048576)
+            writeMotifBatch(outFiles[i], peakColumns, rowBatches[i], startBatches[i], motifWidth)
+            peaksWithMotif[i][rowBatches[i]] = True
+            lineCounts[i] = lineCounts[i]+len(rowBatches[i])
+        if outFiles[i] is None:
+            print "No hit in experiment '"+expName+"': '"+outfileNames[i]+"' not written."
             continue
-        peakID = str(line).split("\t")[3]
-        peakNum = str(parsePeakNumber(peakID, expName)).strip()
-        if peakNum in memeMap:
-            peakList.append(line)
-    print "Reading peakfile '"+str(peakFile)+"': found "+str(len(peakList))+" peaks with motif."
-    return peakList
-
-def getMotifList(peakList, memeMap, expName, motifWidth):
-    motifList = []
-    for line in peakList:
-        peakID = str(line).split("\t")[3].strip()
-        peakNum = str(parsePeakNumber(peakID, expName)).strip()
-        starts = memeMap[peakNum]
-        for motifStart in starts:
-            peakStart= str(line).split("\t")[1]
-            newStart = int(peakStart)+int(motifStart)
-            newEnd = int(newStart)+int(motifWidth)
-            newLine =  str(line).split("\t")[0]+"\t"+str(newStart)+"\t"+str(newEnd)+"\t"+peakID
-            motifList.append(newLine)
-    return motifList
-
-def writeBed(bedList, outfileName):
-    outfile = open(outfileName, "w")
-    for line in bedList:
-        outfile.write(line+"\n")
-    print "Writing: '"+outfileName+"', "+str(len(bedList))+" lines."
-    outfile.flush()
-    outfile.close()
-           
+        outFiles[i].flush()
+        outFiles[i].close()
+        print "Writing: '"+outfileNames[i]+"', "+str(lineCounts[i])+" hits, "+str(int(peaksWithMotif[i].sum()))+" peaks with motif."
+
+# peak indexes shared by the processes reading the motif files, set before the processes are started
+sharedExperiments = None
+
+def getOutfileNames(experiments, motifName, singleMotif):
+    if singleMotif == True and len(experiments) == 1:
+        return [experiments[0][0]+"_motif.bed"]
+    return [expName+"_"+motifName+"_motif.bed" for expName, peakColumns, rowMap in experiments]
+
+# worker: writes the locations of one MEME/FiMo motif file in every experiment
+def processMotifFile(task):
+    memeFile, motifWidth, motifName, fimo, singleMotif = task
+    print "Reading motif '"+motifName+"': '"+memeFile+"'."
+    writeMotifLocations(readMotifHits(memeFile, fimo), sharedExperiments, motifWidth, getOutfileNames(sharedExperiments, motifName, singleMotif), writeEmpty = singleMotif == True and len(sharedExperiments) == 1)
+    return motifName
+
 if __name__ == '__main__':
-    memeFile, peakFile, motifWidth, expName, fimo = get_params(sys.argv[1:])
-    if memeFile == "none" or peakFile == "none" or motifWidth == "none" or expName == "none":
+    motifs, peakFiles, expNames, fimo, sequenceFile, pValue, processes = get_params(sys.argv[1:])
+    if len(motifs) == 0 or len(peakFiles) == 0 or len(peakFiles) != len(expNames):
         sys.exit(progHelp)
-    memeMap = getMotifPeakLocationMap(memeFile, expName, fimo)
-    peakList = getPeaksWithMotif(peakFile, memeMap, expName)
-    motifList = getMotifList(peakList, memeMap, expName, motifWidth)
-    writeBed(motifList, expName+"_motif.bed")
+    for memeFile, motifWidth, motifName in motifs:
+        if motifWidth == "none" and sequenceFile == "none":
+            sys.exit("Missing motif width for '"+memeFile+"'.\n"+progHelp)
+    sharedExperiments = []
+    for peakFile, expName in zip(peakFiles, expNames):
+        peakColumns, rowMap = getPeakIndex(peakFile, expName)
+        sharedExperiments.append((expName, peakColumns, rowMap))
+    singleMotif = len(motifs) == 1
+    if not sequenceFile == "none":
+        for memeFile, motifWidth, motifName in motifs:
+            motifID, matrix, siteNumber, background = getMemeMotif(memeFile)
+            scoreMatrix, threshold = getScoreMatrix(matrix, siteNumber, background, pValue)
+            print "Scanning '"+sequenceFile+"' with '"+motifID+"': p-value < "+str(pValue)+" (score >= "+str(float(threshold)/SCORE_SCALE)+" bits)."
+            if motifWidth == "none":
+                motifWidth = len(matrix)
+            motifHits = scanMotifHits(scoreMatrix, threshold, sequenceFile, processes)
+            writeMotifLocations(motifHits, sharedExperiments, motifWidth, getOutfileNames(sharedExperiments, motifName, singleMotif), writeEmpty = singleMotif == True and len(sharedExperiments) == 1)
+    else:
+        tasks = [(memeFile, motifWidth, motifName, fimo, singleMotif) for memeFile, motifWidth, motifName in motifs]
+        if processes > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(processes, len(tasks)))
+            pool.map(processMotifFile, tasks)
+            pool.close()
+            pool.join()
+        else:
+            for task in tasks:
+                processMotifFile(task)
     print "Finished."
-     
\ No newline at end of file
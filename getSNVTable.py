@@ -6,38 +6,63 @@ Created on 22 mai 2015
 
 # Writes a table summarizing single-nucleotide variants (SNVs) found in a motif.
 # Arguments:
-# -i <intersect_motif_peaks.bed>, output file from intersectBed with '-a': clinvar Bed file, '-b': the motif locations (from getMotifLocations.py) and '-wo'.
+# -i <intersect_motif_peaks.bed>, output file from intersectBed with '-a': clinvar Bed file, '-b': the motif locations (from getMotifLocations.py) and '-wo'. Can be repeated (one table per file).
 # Optional:
+# -a <clinvar.bed> -b <motif.bed>, used instead of '-i': the variant and motif bed files are intersected directly, both must be sorted with 'LC_ALL=C sort -k1,1 -k2,2n'. '-b' can be repeated (one table per motif file).
 # -v <clinvarMain.bed>, clinvar bed file (with all columns) containing more information on the variants. The output will contain more details on each SNV.
 # -h <homer_annotation.txt>, homer annotation  of the peak file containing the motif. The output will contain annotation details of the peak containing the variant.
 # -d <disease_name.txt>, clinvar disease file (ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/disease_names)
+# -x, index the variant file ('-v') in '<clinvarMain.bed>.idx' (SQLite, rebuilt when older than the variant file) and only read the variants of the intersect file from it.
+# -s <clinvar.db>, record store written by clinvarToBed_iterative.py '-s', used instead of '-v': only the variants of the intersect file are read, the SNV nucleotide comes from the stored alternate allele.
+# -t <processes>, number of processes building the tables when there are several inputs (the reference files are read once).
+# Output:
+# 'variantTable.xls', or '<input>_variantTable.xls' for each input if there are several ('<input>_<input number>_variantTable.xls' for inputs with the same file name)
 
 import sys
+import os
 import getopt
+import sqlite3
+import multiprocessing
+import mapCache
 
 
-progHelp = "Writes a table summarizing single-nucleotide variants (SNVs) found in a motif.\n Arguments:\n-i <intersect_motif_peaks.bed>, output file from intersectBed with '-a': clinvar Bed file, '-b': the motif locations (from getMotifLocations.py) and '-wo'.\n Optional:\n-v <clinvarMain.bed>, clinvar bed file (with all columns) containing more information on the variants. The output will contain more details on each SNV.\n-h <homer_annotation.txt>, homer annotation  of the peak file containing the motif. The output will contain annotation details of the peak containing the variant.\n-d <disease_name.txt>, clinvar disease file (ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/disease_names)"
+progHelp = "Writes a table summarizing single-nucleotide variants (SNVs) found in a motif.\n Arguments:\n-i <intersect_motif_peaks.bed>, output file from intersectBed with '-a': clinvar Bed file, '-b': the motif locations (from getMotifLocations.py) and '-wo'. Can be repeated (one table per file).\n Optional:\n-a <clinvar.bed> -b <motif.bed>, used instead of '-i': the variant and motif bed files are intersected directly, both must be sorted with 'LC_ALL=C sort -k1,1 -k2,2n'. '-b' can be repeated (one table per motif file).\n-v <clinvarMain.bed>, clinvar bed file (with all columns) containing more information on the variants. The output will contain more details on each SNV.\n-h <homer_annotation.txt>, homer annotation  of the peak file containing the motif. The output will contain annotation details of the peak containing the variant.\n-d <disease_name.txt>, clinvar disease file (ftp://ftp.ncbi.nlm.nih.gov/pub/clinvar/disease_names)\n-x, index the variant file ('-v') in '<clinvarMain.bed>.idx' (SQLite, rebuilt when older than the variant file) and only read the variants of the intersect file from it.\n-s <clinvar.db>, record store written by clinvarToBed_iterative.py '-s', used instead of '-v': only the variants of the intersect file are read, the SNV nucleotide comes from the stored alternate allele.\n-t <processes>, number of processes building the tables when there are several inputs (the reference files are read once).\n Output:\n'variantTable.xls', or '<input>_variantTable.xls' for each input if there are several ('<input>_<input number>_variantTable.xls' for inputs with the same file name)"
 
 def get_params(argv):
     try:
-        opts, args  = getopt.getopt(argv, "i:v:h:d:", ["infile"])
+        opts, args  = getopt.getopt(argv, "i:v:h:d:s:xa:b:t:", ["infile"])
     except getopt.GetoptError:
         sys.exit("Invalid argument:\n"+progHelp)
-    infilename = "none"
+    infilenames = []
     variantFile = "none"
     homerFile = "none"
     diseaseFile = "none"
+    storeFile = "none"
+    indexVariants = False
+    variantBed = "none"
+    motifBeds = []
+    processes = 1
     for opt,arg in opts:
         if opt =='-i':
-            infilename = arg
+            infilenames.append(arg)
         if opt =='-v':
             variantFile = arg
         if opt == '-h':
             homerFile = arg
         if opt == '-d':
             diseaseFile = arg
+        if opt == '-s':
+            storeFile = arg
+        if opt == '-x':
+            indexVariants = True
+        if opt == '-a':
+            variantBed = arg
+        if opt == '-b':
+            motifBeds.append(arg)
+        if opt == '-t':
+            processes = int(arg)
 
-    return infilename, variantFile, homerFile, diseaseFile
+    return infilenames, variantFile, homerFile, diseaseFile, storeFile, indexVariants, variantBed, motifBeds, processes
 
 def parseBed(bedFile):
     bFile = open(bedFile,"r")
@@ -60,20 +85,137 @@ def parseBed(bedFile):
         variantTupleList.append(varTuple)
     bFile.close()
     bFile.close()
-    print "Reading '"+infilename+"', found "+str(len(variantTupleList))+" SNVs, motif length: "+str(motifWidth)+"pb."
+    print "Reading '"+bedFile+"', found "+str(len(variantTupleList))+" SNVs, motif length: "+str(motifWidth)+"pb."
     return variantTupleList, motifWidth
-    
-def mapTSVcolumns(tsvFile, col1, col2):
-    tFile = open(tsvFile, "r")
-    colMap = {}
+
+# yields (chrom, start, end, name) of each line, exits if the file is not sorted by chromosome then start
+def readSortedBed(bedFile):
+    bFile = open(bedFile, "r", 1048576)
+    chromsDone = set()
+    lastChrom = None
+    lastStart = 0
+    for line in bFile:
+        if line.startswith("#") or line.startswith("track") or line.startswith("browser") or line.isspace():
+            continue
+        fields = line.rstrip("\r\n").split("\t", 4)
+        chrom = fields[0]
+        start = int(fields[1])
+        if chrom != lastChrom:
+            if chrom in chromsDone or (lastChrom is not None and chrom < lastChrom):
+                sys.exit("'"+bedFile+"' is not sorted, use: LC_ALL=C sort -k1,1 -k2,2n")
+            chromsDone.add(chrom)
+            lastChrom = chrom
+        elif start < lastStart:
+            sys.exit("'"+bedFile+"' is not sorted, use: LC_ALL=C sort -k1,1 -k2,2n")
+        lastStart = start
+        name = "."
+        if len(fields) > 3:
+            name = fields[3]
+        yield chrom, start, int(fields[2]), name
+    bFile.close()
+
+# sweep line over both sorted files: only the motifs that can still overlap the next variants are kept in memory
+# zero-length variants (clinvar SNVs are written with start == stop) are padded by one base on each side, as intersectBed does
+# returns the same SNV tuples as parseBed
+def intersectSortedBeds(variantBed, motifBed):
+    motifs = readSortedBed(motifBed)
+    nextMotif = next(motifs, None)
+    window = []
+    windowChrom = None
+    motifWidth = 0
+    variantTupleList = []
+    for vChrom, vStart, vEnd, varID in readSortedBed(variantBed):
+        if vChrom != windowChrom:
+            window = []
+            windowChrom = vChrom
+        overlapStart, overlapEnd = vStart, vEnd
+        if vStart == vEnd:
+            overlapStart, overlapEnd = vStart-1, vEnd+1
+        while nextMotif is not None and (nextMotif[0] < vChrom or (nextMotif[0] == vChrom and nextMotif[1] < overlapEnd)):
+            if nextMotif[0] == vChrom:
+                window.append(nextMotif)
+            nextMotif = next(motifs, None)
+        # padded variants can start one base before the previous variant
+        window = [motif for motif in window if motif[2] > vStart-1]
+        if (vEnd - vStart)>2:
+            continue
+        for mChrom, mStart, mEnd, peakID in window:
+            if mStart >= overlapEnd or mEnd <= overlapStart:
+                continue
+            if motifWidth == 0:
+                motifWidth = mEnd-mStart
+            variantTupleList.append(((vStart - mStart)+1, varID, peakID))
+    print "Intersecting '"+variantBed+"' and '"+motifBed+"', found "+str(len(variantTupleList))+" SNVs, motif length: "+str(motifWidth)+"pb."
+    return variantTupleList, motifWidth
+
+# variant file columns: key (accession) -> name, clinical significance, condition
+VARIANT_KEY_COLUMN = 20
+VARIANT_VALUE_COLUMNS = [4, 17, 22]
+
+# yields (key, values) of each line, reading col1 and the cols2 columns with one split
+def getTSVcolumns(tsvFile, col1, cols2):
+    tFile = open(tsvFile, "r", 1048576)
+    lastCol = max([col1]+cols2)
     for line in tFile:
-        key = str(line).split("\t")[(col1-1)].strip()
-        val = str(line).split("\t")[(col2-1)].strip()
-        colMap[key] = val
-    print "Reading '"+tsvFile+"', mapping column "+str(col1)+" to column "+str(col2)+"."
-    tFile.flush()
+        fields = line.split("\t", lastCol)
+        if len(fields) < lastCol:
+            continue
+        yield fields[col1-1].strip(), [fields[col2-1].strip() for col2 in cols2]
     tFile.close()
-    return colMap
+
+# returns one map per column of cols2, all read in the same pass and compiled once into '<tsvFile>.columns_<col1>_<cols2>.cache' (see mapCache.py)
+def mapTSVcolumns(tsvFile, col1, cols2):
+    colMaps = mapCache.getCachedMaps(tsvFile, "columns_"+str(col1)+"_"+"_".join([str(col2) for col2 in cols2]), lambda fileName: getTSVcolumns(fileName, col1, cols2), len(cols2))
+    print "Reading '"+tsvFile+"', mapping column "+str(col1)+" to columns "+", ".join([str(col2) for col2 in cols2])+"."
+    return colMaps
+
+# SQLite index of the variant file keyed by col1, rebuilt when older than the file
+def getTSVIndex(tsvFile, col1, cols2):
+    indexName = tsvFile+".idx"
+    if os.path.exists(indexName) and os.path.getmtime(indexName) < os.path.getmtime(tsvFile):
+        os.remove(indexName)
+    if not os.path.exists(indexName):
+        print "Indexing '"+tsvFile+"': writing '"+indexName+"'."
+        # renamed once complete, so that an interrupted build is never read as an index
+        tempName = indexName+"."+str(os.getpid())+".tmp"
+        if os.path.exists(tempName):
+            os.remove(tempName)
+        connection = sqlite3.connect(tempName)
+        connection.text_factory = str
+        connection.execute("CREATE TABLE columns (key TEXT PRIMARY KEY, "+", ".join(["col"+str(col2)+" TEXT" for col2 in cols2])+")")
+        connection.executemany("INSERT OR REPLACE INTO columns VALUES ("+",".join(["?"]*(len(cols2)+1))+")", ([key]+values for key, values in getTSVcolumns(tsvFile, col1, cols2)))
+        connection.commit()
+        connection.close()
+        os.rename(tempName, indexName)
+    return indexName
+
+# returns one map per column of cols2, only for the keys given
+def mapIndexedColumns(indexName, keys, cols2):
+    connection = sqlite3.connect(indexName)
+    connection.text_factory = str
+    keys = list(set(keys))
+    colMaps = [{} for col2 in cols2]
+    # SQLite limits the number of query parameters
+    for i in xrange(0, len(keys), 500):
+        batch = keys[i:i+500]
+        for row in connection.execute("SELECT * FROM columns WHERE key IN ("+",".join(["?"]*len(batch))+")", batch):
+            for j in xrange(len(cols2)):
+                colMaps[j][row[0]] = row[j+1]
+    connection.close()
+    print "Reading '"+indexName+"': "+str(len(colMaps[0]))+" of "+str(len(keys))+" variants found."
+    return colMaps
+
+# returns the name, clinical significance and condition maps of the variants from the record store (see clinvarStore.py)
+# the store names are HGVS expressions, the nucleotide is read from the stored alleles (single-nucleotide variants only)
+def getStoreMaps(storeFile, variantTupleList):
+    import clinvarStore
+    annotations = clinvarStore.getRecordAnnotations(storeFile, [str(vTuple[1]).strip() for vTuple in variantTupleList])
+    idToNameMap, idToClinSinMap, idToConditionMap, idToNucleotideMap = {}, {}, {}, {}
+    for varID in annotations:
+        idToNameMap[varID], idToClinSinMap[varID], idToConditionMap[varID], alleles = annotations[varID]
+        if alleles is not None and alleles[0] in ["A", "C", "G", "T"] and alleles[1] in ["A", "C", "G", "T"]:
+            idToNucleotideMap[varID] = alleles[1]
+    return idToNameMap, idToClinSinMap, idToConditionMap, idToNucleotideMap
 
 def getSNVRepresentation(seqLength, snvPosition, nucleotide):
     snvRep = []
@@ -92,7 +234,7 @@ def parseMedGenID(condition):
             medID = fullID.split(":")[1].strip()
     return medID
                  
-def getTableList(variantTupleList, motifWidth, idToNameMap = "none", idToClinSinMap = "none",  homerMap = "none", idToConditionMap = "none", diseaseMap = "none"):
+def getTableList(variantTupleList, motifWidth, idToNameMap = "none", idToClinSinMap = "none",  homerMap = "none", idToConditionMap = "none", diseaseMap = "none", idToNucleotideMap = "none"):
     tableList = []
     for vTuple in variantTupleList:
         varLoc = vTuple[0]
@@ -100,11 +242,14 @@ def getTableList(variantTupleList, motifWidth, idToNameMap = "none", idToClinSin
         peakID = vTuple[2]
         varName = ""
         nucleotide = "X"
+        clinSin, diseaseName = "NA", "NA"
         if not idToNameMap == "none":
             varName = idToNameMap[varID]
             if varName.startswith("A") or varName.startswith("T") or varName.startswith("G") or varName.startswith("C"):
                 nucleotide = varName.split(">")[1]
             clinSin = idToClinSinMap[varID]
+        if not idToNucleotideMap == "none" and varID in idToNucleotideMap:
+            nucleotide = idToNucleotideMap[varID]
         distance, geneName, geneDesc = "NA", "NA", "NA"
         if not homerMap == "none":
             geneTuple = homerMap[peakID]
@@ -123,16 +268,16 @@ def getTableList(variantTupleList, motifWidth, idToNameMap = "none", idToClinSin
         tableList.append(tableRow)
     return tableList
 
-def writeTable(tableList):
+def writeTable(tableList, outName = "variantTable.xls"):
     header = "#Motif\tSNV AccVar\tFound in Peak\tPosition in motif\tSNV Name\tClinical Significance\tCondition\tNearest Gene Name\tGene Description\tDistance to TSS"
-    outFile = open("variantTable.xls","w")
+    outFile = open(outName,"w")
     outFile.write(header+"\n")
     outFile.write(""+"\n")
     for row in tableList:
         outFile.write(row+"\n")
     outFile.flush()
     outFile.close()
-    print "Writing 'variantTable.xls: "+str((len(tableList)+2))+" lines."
+    print "Writing '"+outName+"': "+str((len(tableList)+2))+" lines."
         
 def getHomerMap(homerFile):
     hFile = open(homerFile, "r")
@@ -158,20 +303,75 @@ def getDiseaseMap(diseaseFile):
     dFile.close()
     return diseaseMap
                             
+# (idToNameMap, idToClinSinMap, homerMap, idToConditionMap, diseaseMap, idToNucleotideMap), read once before the processes are started
+sharedMaps = None
+
+# inputs sharing a file name (from different directories) get their input number: '<input>_<number>_variantTable.xls'
+def getOutfileNames(inputNames):
+    if len(inputNames) == 1:
+        return ["variantTable.xls"]
+    baseNames = [os.path.splitext(os.path.basename(inputName))[0] for inputName in inputNames]
+    outfileNames = []
+    for i, baseName in enumerate(baseNames):
+        if baseNames.count(baseName) > 1:
+            baseName = baseName+"_"+str(i+1)
+        outfileNames.append(baseName+"_variantTable.xls")
+    if len(set(outfileNames)) < len(outfileNames):
+        sys.exit("Several inputs would write the same table, rename the input files: "+", ".join(inputNames))
+    return outfileNames
+
+# worker: returns the SNV tuples and motif width of one input, (intersect file) or (variant bed, motif bed)
+def readVariantTuples(inputFiles):
+    if len(inputFiles) == 2:
+        return intersectSortedBeds(inputFiles[0], inputFiles[1])
+    return parseBed(inputFiles[0])
+
+# worker: writes the table of one input with the shared maps
+def processVariantTuples(task):
+    variantTupleList, motifWidth, outName = task
+    idToNameMap, idToClinSinMap, homerMap, idToConditionMap, diseaseMap, idToNucleotideMap = sharedMaps
+    writeTable(getTableList(variantTupleList, motifWidth, idToNameMap, idToClinSinMap, homerMap, idToConditionMap, diseaseMap, idToNucleotideMap), outName)
+    return outName
+
 if __name__ == '__main__':
-    infilename, variantFile, homerFile, diseaseFile = get_params(sys.argv[1:])
-    if infilename == "none":
+    infilenames, variantFile, homerFile, diseaseFile, storeFile, indexVariants, variantBed, motifBeds, processes = get_params(sys.argv[1:])
+    if not variantBed == "none" and len(motifBeds) > 0:
+        inputs = [(variantBed, motifBed) for motifBed in motifBeds]
+        inputNames = motifBeds
+    elif len(infilenames) > 0:
+        inputs = [(infilename,) for infilename in infilenames]
+        inputNames = infilenames
+    else:
         sys.exit(progHelp)
-    variantTupleList, motifWidth = parseBed(infilename)
-    idToNameMap, idToClinSinMap, idToConditionMap, homerMap, diseaseMap = "none", "none", "none", "none", "none"
-    if not variantFile == "none":
-        idToNameMap = mapTSVcolumns(variantFile, 20, 4)
-        idToClinSinMap = mapTSVcolumns(variantFile, 20, 17)
-        idToConditionMap = mapTSVcolumns(variantFile, 20, 22)
+    processes = min(processes, len(inputs))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        inputTuples = pool.map(readVariantTuples, inputs)
+        pool.close()
+        pool.join()
+    else:
+        inputTuples = [readVariantTuples(inputFiles) for inputFiles in inputs]
+    allVariantTuples = [vTuple for variantTupleList, motifWidth in inputTuples for vTuple in variantTupleList]
+    idToNameMap, idToClinSinMap, idToConditionMap, homerMap, diseaseMap, idToNucleotideMap = "none", "none", "none", "none", "none", "none"
+    if not variantFile == "none" and indexVariants:
+        indexName = getTSVIndex(variantFile, VARIANT_KEY_COLUMN, VARIANT_VALUE_COLUMNS)
+        idToNameMap, idToClinSinMap, idToConditionMap = mapIndexedColumns(indexName, [str(vTuple[1]).strip() for vTuple in allVariantTuples], VARIANT_VALUE_COLUMNS)
+    elif not variantFile == "none":
+        idToNameMap, idToClinSinMap, idToConditionMap = mapTSVcolumns(variantFile, VARIANT_KEY_COLUMN, VARIANT_VALUE_COLUMNS)
+    if not storeFile == "none":
+        idToNameMap, idToClinSinMap, idToConditionMap, idToNucleotideMap = getStoreMaps(storeFile, allVariantTuples)
     if not homerFile == "none":
         homerMap = getHomerMap(homerFile)
     if not diseaseFile == "none":
         diseaseMap = getDiseaseMap(diseaseFile)
-    varList = getTableList(variantTupleList, motifWidth, idToNameMap, idToClinSinMap, homerMap, idToConditionMap, diseaseMap)
-    writeTable(varList)
-    print "Finished"
\ No newline at end of file
+    sharedMaps = (idToNameMap, idToClinSinMap, homerMap, idToConditionMap, diseaseMap, idToNucleotideMap)
+    tasks = [(variantTupleList, motifWidth, outName) for (variantTupleList, motifWidth), outName in zip(inputTuples, getOutfileNames(inputNames))]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        pool.map(processVariantTuples, tasks)
+        pool.close()
+        pool.join()
+    else:
+        for task in tasks:
+            processVariantTuples(task)
+    print "Finished"
@@ -0,0 +1,171 @@
+'''
+Compiled cache of biomart and other tab-delimited mapping tables, shared by getFromAnnotations.py, compareGeneLists.py and getSNVTable.py.
+'''
+
+# A mapping read from a text file is compiled once into '<file>.<name>.cache': the records (keys sorted, with their values) behind a table of offsets
+# and a hash table of record numbers (CRC32 of the key, linear probing).
+# Later runs memory-map the cache instead of parsing the text file, and processes using the same cache share its pages.
+# The cache is rebuilt when the source file changes: same modification time and size are trusted, otherwise the MD5 hash of the source is compared.
+# If the cache cannot be written (read-only directory), the mapping is read into a dictionary as before.
+
+import os
+import mmap
+import struct
+import hashlib
+import zlib
+
+CACHE_MAGIC = "MAPCACHE2"
+# magic, column number, record number, hash table size, source modification time, source size, source MD5 (hex)
+HEADER_FORMAT = "<9sxxxIQQdQ32s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+OFFSET_SIZE = 8
+KEY_SEPARATOR = "\x00"
+VALUE_SEPARATOR = "\x01"
+
+# read-only mapping over one value column of a compiled cache, used like a dictionary
+class MappedTable(object):
+    def __init__(self, data, column):
+        magic, columnNumber, self.count, self.bucketNumber, mtime, size, md5 = struct.unpack_from(HEADER_FORMAT, data, 0)
+        self.data = data
+        self.column = column
+        self.bucketStart = HEADER_SIZE+OFFSET_SIZE*(self.count+1)
+        self.dataStart = self.bucketStart+OFFSET_SIZE*self.bucketNumber
+
+    def getOffset(self, index):
+        return self.dataStart+struct.unpack_from("<Q", self.data, HEADER_SIZE+OFFSET_SIZE*index)[0]
+
+    def getKey(self, index):
+        start = self.getOffset(index)
+        return self.data[start:self.data.find(KEY_SEPARATOR, start)]
+
+    # returns the record index of key, -1 if it is not found
+    def findKey(self, key):
+        if self.bucketNumber == 0:
+            return -1
+        bucket = getBucket(key, self.bucketNumber)
+        while True:
+            index = struct.unpack_from("<Q", self.data, self.bucketStart+OFFSET_SIZE*bucket)[0]
+            if index == 0:
+                return -1
+            if self.getKey(index-1) == key:
+                return index-1
+            bucket = (bucket+1) & (self.bucketNumber-1)
+
+    def getValue(self, index):
+        start = self.getOffset(index)
+        record = self.data[self.data.find(KEY_SEPARATOR, start)+1:self.getOffset(index+1)]
+        return record.split(VALUE_SEPARATOR)[self.column]
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        return self.findKey(key) != -1
+
+    def __getitem__(self, key):
+        index = self.findKey(key)
+        if index == -1:
+            raise KeyError(key)
+        return self.getValue(index)
+
+    def get(self, key, default = None):
+        index = self.findKey(key)
+        if index == -1:
+            return default
+        return self.getValue(index)
+
+    def keys(self):
+        return [self.getKey(index) for index in xrange(self.count)]
+
+    def __iter__(self):
+        for index in xrange(self.count):
+            yield self.getKey(index)
+
+# bucketNumber: a power of two
+def getBucket(key, bucketNumber):
+    return zlib.crc32(key) & (bucketNumber-1)
+
+def getFileHash(fileName):
+    md5 = hashlib.md5()
+    sFile = open(fileName, "rb")
+    block = sFile.read(4194304)
+    while block:
+        md5.update(block)
+        block = sFile.read(4194304)
+    sFile.close()
+    return md5.hexdigest()
+
+# entries: (key, values) in file order, the last value of a key is kept (as when filling a dictionary)
+def writeCache(cacheName, entries, columnNumber, sourceFile):
+    table = {}
+    for key, values in entries:
+        table[key] = VALUE_SEPARATOR.join(values)
+    keys = sorted(table)
+    offsets = [0]
+    for key in keys:
+        offsets.append(offsets[-1]+len(key)+1+len(table[key]))
+    # at most half full, buckets hold record index+1 (0: empty)
+    bucketNumber = 0
+    if len(keys) > 0:
+        bucketNumber = 1
+        while bucketNumber < 2*len(keys):
+            bucketNumber = bucketNumber*2
+    buckets = [0]*bucketNumber
+    for index in xrange(len(keys)):
+        bucket = getBucket(keys[index], bucketNumber)
+        while buckets[bucket] != 0:
+            bucket = (bucket+1) & (bucketNumber-1)
+        buckets[bucket] = index+1
+    tempName = cacheName+"."+str(os.getpid())+".tmp"
+    cFile = open(tempName, "wb", 1048576)
+    cFile.write(struct.pack(HEADER_FORMAT, CACHE_MAGIC, columnNumber, len(keys), bucketNumber, os.path.getmtime(sourceFile), os.path.getsize(sourceFile), getFileHash(sourceFile)))
+    for numbers in [offsets, buckets]:
+        for i in xrange(0, len(numbers), 65536):
+            cFile.write(struct.pack("<"+str(len(numbers[i:i+65536]))+"Q", *numbers[i:i+65536]))
+    for key in keys:
+        cFile.write(key+KEY_SEPARATOR+table[key])
+    cFile.close()
+    # renamed once complete, so that other processes never read a partial cache
+    os.rename(tempName, cacheName)
+
+# returns True if the cache was compiled from the current source file (the header is updated if only the modification time changed)
+def isCacheValid(cacheName, sourceFile, columnNumber):
+    if not os.path.exists(cacheName) or os.path.getsize(cacheName) < HEADER_SIZE:
+        return False
+    cFile = open(cacheName, "rb")
+    magic, cacheColumns, count, bucketNumber, mtime, size, md5 = struct.unpack(HEADER_FORMAT, cFile.read(HEADER_SIZE))
+    cFile.close()
+    if magic != CACHE_MAGIC or cacheColumns != columnNumber or size != os.path.getsize(sourceFile):
+        return False
+    if mtime == os.path.getmtime(sourceFile):
+        return True
+    if md5 != getFileHash(sourceFile):
+        return False
+    cFile = open(cacheName, "r+b")
+    cFile.write(struct.pack(HEADER_FORMAT, magic, cacheColumns, count, bucketNumber, os.path.getmtime(sourceFile), size, md5))
+    cFile.close()
+    return True
+
+# returns one mapping (MappedTable, or dictionary if the cache cannot be written) per value column
+# getEntries(sourceFile): yields (key, values) with columnNumber values, name: identifies the mapping among the caches of the same file
+def getCachedMaps(sourceFile, name, getEntries, columnNumber):
+    cacheName = sourceFile+"."+name+".cache"
+    try:
+        if not isCacheValid(cacheName, sourceFile, columnNumber):
+            print "Compiling '"+sourceFile+"' into '"+cacheName+"'."
+            writeCache(cacheName, getEntries(sourceFile), columnNumber, sourceFile)
+    except (IOError, OSError):
+        print "Cannot write '"+cacheName+"', reading '"+sourceFile+"' without cache."
+        maps = [{} for column in xrange(columnNumber)]
+        for key, values in getEntries(sourceFile):
+            for column in xrange(columnNumber):
+                maps[column][key] = values[column]
+        return maps
+    cFile = open(cacheName, "rb")
+    data = mmap.mmap(cFile.fileno(), 0, access=mmap.ACCESS_READ)
+    cFile.close()
+    return [MappedTable(data, column) for column in xrange(columnNumber)]
+
+# getEntries(sourceFile): yields (key, value)
+def getCachedMap(sourceFile, name, getEntries):
+    return getCachedMaps(sourceFile, name, lambda fileName: ((key, [value]) for key, value in getEntries(fileName)), 1)[0]
@@ -0,0 +1,56 @@
+'''
+Plot output shared by getFromAnnotations.py and compareGeneLists.py.
+'''
+
+# matplotlib is only imported when a plot is drawn. With a file format ('png', 'svg', 'pdf') plots are rendered by the non-interactive
+# 'Agg' backend and saved instead of displayed, with 'tsv' the plotted counts are written and matplotlib is not needed.
+# Requires:
+# -matplotlib: http://matplotlib.org/ (displayed or saved plots only)
+# Formats:
+# 'show' (default, interactive window), 'png', 'svg', 'pdf', 'tsv'
+
+import multiprocessing
+
+PLOT_FORMATS = ["png", "svg", "pdf"]
+OUTPUT_FORMATS = ["show"]+PLOT_FORMATS+["tsv"]
+
+def getPyplot(outFormat):
+    import matplotlib
+    if outFormat in PLOT_FORMATS:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+# displays the current figure, or saves it as '<outName>.<outFormat>'
+def showPlot(plt, outName, outFormat):
+    if outFormat in PLOT_FORMATS:
+        plt.savefig(outName+"."+outFormat, bbox_inches="tight")
+        plt.close()
+        print "Writing plot '"+outName+"."+outFormat+"'."
+    else:
+        plt.show()
+
+# writes '<outName>.tsv', rows: lists of fields
+def writeCounts(outName, header, rows):
+    outFile = open(outName+".tsv", "w")
+    outFile.write("\t".join(header)+"\n")
+    for row in rows:
+        outFile.write("\t".join([str(field) for field in row])+"\n")
+    outFile.flush()
+    outFile.close()
+    print "Writing counts '"+outName+".tsv': "+str(len(rows))+" lines."
+
+def renderPlot(task):
+    plotFunction, args = task
+    plotFunction(*args)
+
+# tasks: (plot function, arguments), saved plots are rendered in parallel processes (each one imports its own matplotlib)
+def renderPlots(tasks, outFormat):
+    if outFormat in PLOT_FORMATS and len(tasks) > 1:
+        pool = multiprocessing.Pool(len(tasks))
+        pool.map(renderPlot, tasks)
+        pool.close()
+        pool.join()
+    else:
+        for task in tasks:
+            renderPlot(task)